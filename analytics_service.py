@@ -19,7 +19,8 @@ except ImportError:
     POSTHOG_AVAILABLE = False
     print("⚠️ PostHog nie zainstalowany - analytics będą zapisywane lokalnie")
 
-load_dotenv()  # Wczytaj zmienne z .env
+if POSTHOG_AVAILABLE:
+    load_dotenv()  # Wczytaj zmienne z .env
 
 class AnalyticsService:
     def __init__(self):
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Silnik pobierania oparty na asyncio (alternatywa dla puli wątków)
+- Jedna pętla zdarzeń obsługuje tysiące równoczesnych transferów
+- Strumieniowe odczyty z aiohttp, zapisy na dysk w małej puli wątków
+- Zapis do <plik>.part ze stanem w pliku pobocznym (wznawianie), zmiana nazwy po ukończeniu
+- Limit równoległości przez asyncio.Semaphore
+- Ta sama kolejka, walidacja i callbacki co DownloadManager
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from file_writer import InsufficientSpaceError
+from partial_download import PartialDownload
+from retry_policy import FileTooLargeError, classify_status
+from stream_digest import DigestMismatchError, StreamingDigest, parse_digest_headers
+
+try:
+    import aiohttp
+except ImportError:  # Opcjonalna zależność - tylko dla silnika asyncio
+    aiohttp = None
+
+
+class AsyncDownloadEngine:
+    def __init__(self, manager, file_workers=4, chunk_size=64*1024):
+        if aiohttp is None:
+            raise ImportError("Silnik asyncio wymaga pakietu aiohttp (pip install aiohttp)")
+
+        self.manager = manager
+        self.file_workers = file_workers
+        self.chunk_size = chunk_size
+
+        self.loop = None
+        self.thread = None
+        self.tasks = set()
+        self.session = None
+        self._wakeup = None
+        self._stopping = False
+        self._draining = False
+        self._started = threading.Event()
+
+    def start(self):
+        """Uruchom pętlę zdarzeń w osobnym wątku"""
+        if self.thread and self.thread.is_alive():
+            return
+
+        self._stopping = False
+        self._draining = False
+        self._started.clear()
+        self.thread = threading.Thread(target=self._run_loop, name="download-asyncio", daemon=True)
+        self.thread.start()
+        self._started.wait(5)
+
+    def stop(self, drain=False, timeout=5.0):
+        """Zatrzymaj silnik; drain=True dokańcza kolejkę przed zatrzymaniem"""
+        if not self.thread:
+            return True
+
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._request_stop, drain)
+            except RuntimeError:
+                pass  # Pętla właśnie się zamknęła
+
+        self.thread.join(timeout)
+        stopped = not self.thread.is_alive()
+        if stopped:
+            self.thread = None
+        return stopped
+
+    def wake(self):
+        """Obudź dyspozytora (bezpieczne z dowolnego wątku)"""
+        loop = self.loop
+        if loop is None or self._wakeup is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass  # Pętla zamknięta
+
+    def resize(self, max_concurrent):
+        """Dostosuj liczbę slotów semafora do nowego limitu (bezpieczne z dowolnego wątku)"""
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._resize, max_concurrent)
+        except RuntimeError:
+            pass  # Pętla zamknięta
+    
+    def _resize(self, max_concurrent):
+        # Zwiększenie dokłada sloty; zmniejszenie egzekwuje manager._has_work()
+        for _ in range(max_concurrent - self._slots):
+            self._semaphore.release()
+        self._slots = max(self._slots, max_concurrent)
+        # Limit połączeń konektora jest stały - nowe żądania idą przez nową sesję,
+        # trwające transfery kończą się w starej (zamykanej, gdy nikt jej nie używa)
+        if self.session is not None and max_concurrent != self._connection_limit:
+            retired = self.session
+            self.session = self._new_session(max_concurrent)
+            self._retire(retired)
+        self._wakeup.set()
+    
+    def _new_session(self, limit):
+        self._connection_limit = limit
+        connector = aiohttp.TCPConnector(limit=limit)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+        session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self._session_users[session] = 0
+        return session
+    
+    def _retire(self, session):
+        """Zamknij nieaktualną sesję, gdy nie korzysta z niej żaden transfer"""
+        if session is not self.session and not self._session_users.get(session):
+            self._session_users.pop(session, None)
+            closing = asyncio.ensure_future(session.close())
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+    
+    def _request_stop(self, drain):
+        if drain:
+            self._draining = True
+        else:
+            self._stopping = True
+            for task in list(self.tasks):
+                task.cancel()
+        self._wakeup.set()
+
+    def _run_loop(self):
+        try:
+            asyncio.run(self._main())
+        finally:
+            self.loop = None
+            self._started.set()
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._slots = self.manager.max_concurrent
+        self._semaphore = asyncio.Semaphore(self._slots)
+        self._file_executor = ThreadPoolExecutor(max_workers=self.file_workers,
+                                                 thread_name_prefix="download-file-io")
+
+        self._session_users = {}  # sesja -> liczba transferów (stare sesje po zmianie limitu)
+        self._closing = set()
+        self.session = self._new_session(self._slots)
+        try:
+            self._started.set()
+            await self._dispatch()
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+        finally:
+            self._file_executor.shutdown(wait=True)
+            for session in list(self._session_users):
+                await session.close()
+            await asyncio.gather(*self._closing, return_exceptions=True)
+            self._session_users.clear()
+            self.session = None
+
+    async def _dispatch(self):
+        """Pobieraj elementy z kolejki, gdy jest wolny slot semafora"""
+        while not self._stopping:
+            await self._semaphore.acquire()
+            item = await self._next_item()
+            if item is None:
+                self._semaphore.release()
+                return
+
+            task = asyncio.create_task(self._run_item(item))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _next_item(self):
+        """Czekaj na element w kolejce; None oznacza zatrzymanie"""
+        manager = self.manager
+        while not self._stopping:
+            with manager.lock:
+                if manager._has_work():
+                    return manager._take_next()
+                # Czyszczenie pod blokadą - wake() z add_to_queue trafi po nim
+                self._wakeup.clear()
+                drained = self._draining and not manager.queue and not manager.active_downloads
+                retry_delay = manager._next_wakeup()
+
+            if drained:
+                return None
+            try:
+                # Odłożone ponowienia i sondy - obudź się najpóźniej na najbliższy termin
+                await asyncio.wait_for(self._wakeup.wait(), retry_delay)
+            except asyncio.TimeoutError:
+                pass
+        return None
+
+    async def _run_item(self, item):
+        manager = self.manager
+        try:
+            success = await self._download_file(item)
+            if success:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._file_executor, manager._store_content, item)
+            manager._finish_download(item, success)
+        except asyncio.CancelledError:
+            # Zatrzymanie silnika - element wraca do kolejki bez zużycia próby (jak w puli wątków)
+            manager._requeue_interrupted(item)
+        except Exception as e:
+            manager._fail_download(item, e)
+        finally:
+            self._semaphore.release()
+            self._wakeup.set()
+
+    @staticmethod
+    def _existing_size(file_path):
+        try:
+            return file_path.stat().st_size
+        except OSError:
+            return 0
+    
+    @staticmethod
+    def _write_chunk(writer, digest, partial, offset, chunk):
+        """Zapis, skrót i punkt kontrolny fragmentu poza pętlą zdarzeń (hashlib zwalnia GIL)"""
+        writer.write_at(offset, chunk)
+        digest.update(chunk)
+        partial.checkpoint(writer, offset + len(chunk))
+    
+    @staticmethod
+    def _close_writer(writer, partial, downloaded, keep):
+        """Zamknij plik .part; keep=True - utrwal postęp, następna próba wznowi"""
+        try:
+            if keep:
+                partial.checkpoint(writer, downloaded, force=True)
+        finally:
+            writer.close()
+    
+    @staticmethod
+    def _finalize(manager, item, partial, digest):
+        """Zweryfikuj skróty i zamień ukończony .part na plik docelowy"""
+        manager._record_digests(item, digest, partial)
+        partial.finalize()
+    
+    @staticmethod
+    def _finalize_complete_part(manager, item, partial):
+        """Plik .part był kompletny (przerwano tuż przed zmianą nazwy) - skrót z dysku"""
+        digest = StreamingDigest(manager.digest_algorithms)
+        digest.update_from_file(partial.part_path, 0, partial.bytes_received)
+        manager._record_digests(item, digest, partial)
+        partial.finalize()
+    
+    async def _download_file(self, item):
+        """Pobierz pojedynczy plik strumieniowo do <plik>.part (wznawialnie, jak w puli wątków)"""
+        manager = self.manager
+        url = item['url']
+        download_dir = item['download_dir']
+        loop = asyncio.get_running_loop()
+
+        manager.trigger_callback('start', url)
+
+        # Ścieżka stała między próbami - potrzebna do wznowienia
+        if item.get('target_path'):
+            file_path = Path(item['target_path'])
+        else:
+            file_path = download_dir / manager.get_filename_from_url(url)
+            item['target_path'] = str(file_path)
+        filename = file_path.name
+        await loop.run_in_executor(self._file_executor,
+                                   lambda: download_dir.mkdir(exist_ok=True, parents=True))
+
+        # Sprawdź duplikaty (stat poza pętlą zdarzeń - wolny dysk nie blokuje innych transferów)
+        existing_size = await loop.run_in_executor(self._file_executor, self._existing_size, file_path)
+        if existing_size:
+            print(f"📄 Plik już istnieje: {filename}")
+            item['file_path'] = str(file_path)
+            manager._finish_progress(url, existing_size)
+            return True
+
+        # Stan poprzedniej, przerwanej próby (plik .part i .part.json)
+        partial = PartialDownload(file_path, url, checkpoint_interval=manager.checkpoint_interval)
+        await loop.run_in_executor(self._file_executor, partial.load)
+
+        session = self.session
+        self._session_users[session] += 1
+        try:
+            response = await session.get(url, headers=partial.resume_headers())
+            manager._record_first_byte(item)
+
+            if response.status == 416 and partial.bytes_received:
+                response.release()
+                if partial.complete_on_416(response.headers.get('Content-Range')):
+                    total_size = partial.bytes_received  # finalize() czyści stan
+                    await loop.run_in_executor(self._file_executor, self._finalize_complete_part,
+                                               manager, item, partial)
+                    item['file_path'] = str(file_path)
+                    manager._finish_progress(url, total_size)
+                    return True
+                # .part nie pasuje do zasobu (np. plik na serwerze jest krótszy) - od zera
+                print(f"🗑️ Porzucono niepasujący plik .part: {filename}")
+                await loop.run_in_executor(self._file_executor, partial.discard)
+                response = await session.get(url)
+
+            async with response:
+                response.raise_for_status()
+
+                # 206 od zapisanego offsetu - kontynuuj; 200 - zasób zmieniony, od zera
+                offset = (partial.bytes_received
+                          if partial.resumes(response.status, response.headers.get('Content-Range'))
+                          else 0)
+                if offset:
+                    print(f"⏯️ Wznawianie od {offset//1024//1024}MB: {filename}")
+
+                # Rozmiar z nagłówka odpowiedzi - bez osobnego HEAD
+                content_length = response.content_length or 0
+                total_size = offset + content_length if content_length else 0
+                if total_size > manager.max_file_size:
+                    size_mb = total_size // (1024 * 1024)
+                    max_mb = manager.max_file_size // (1024 * 1024)
+                    await loop.run_in_executor(self._file_executor, partial.discard)
+                    item['error_class'] = 'rejected'
+                    manager.trigger_callback('error', url, f"Plik zbyt duży ({size_mb}MB > {max_mb}MB)")
+                    return False
+
+                print(f"⬇️ Pobieranie: {filename}")
+                partial.set_validators(total_size, response.headers.get('ETag'),
+                                       response.headers.get('Last-Modified'))
+                # Prealokacja .part (brak miejsca - błąd przed odczytem treści)
+                f = await loop.run_in_executor(self._file_executor, partial.open, offset, total_size)
+                transfer = manager.bandwidth.open(manager.speed_tier)
+                tracker = manager.progress_tracker(url, total_size, initial=offset)
+                # Content-MD5 dotyczy treści tej odpowiedzi - tylko przy pełnym pliku
+                digest = StreamingDigest(manager.digest_algorithms,
+                                         parse_digest_headers(response.headers, full_body=offset == 0))
+                downloaded = offset
+                duplicate_of = None
+                too_large = False
+                fingerprint = manager._early_fingerprint(total_size, offset)
+                try:
+                    if offset:
+                        # Część z poprzedniej próby - doliczana raz, z dysku
+                        await loop.run_in_executor(self._file_executor, digest.update_from_file,
+                                                   partial.part_path, 0, offset)
+                        if fingerprint is not None:
+                            await loop.run_in_executor(self._file_executor, fingerprint.update_from_file,
+                                                       partial.part_path, offset)
+
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        delay = transfer.reserve(len(chunk))
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        await loop.run_in_executor(self._file_executor, self._write_chunk,
+                                                   f, digest, partial, downloaded, chunk)
+                        downloaded += len(chunk)
+
+                        if fingerprint is not None and fingerprint.update(chunk):
+                            duplicate_of = await loop.run_in_executor(
+                                None, manager._match_fingerprint, url, fingerprint)
+                            fingerprint = None
+                            if duplicate_of:
+                                break  # Ta treść już jest w bibliotece - reszta zbędna
+
+                        if downloaded > manager.max_file_size:
+                            too_large = True
+                            break
+
+                        tracker.update(downloaded)
+                finally:
+                    transfer.close()
+                    # Postęp utrwalany także przy błędzie sieci i zatrzymaniu - następna próba wznowi
+                    await loop.run_in_executor(self._file_executor, self._close_writer, f, partial,
+                                               downloaded, not too_large and not duplicate_of)
+
+            if too_large:
+                await loop.run_in_executor(self._file_executor, partial.discard)
+                raise FileTooLargeError(f"Plik przekroczył limit {manager.max_file_size//1024//1024}MB")
+
+            if duplicate_of:
+                await loop.run_in_executor(self._file_executor, partial.discard)
+                await loop.run_in_executor(self._file_executor, manager._resolve_duplicate,
+                                           item, file_path, duplicate_of, total_size, downloaded)
+                tracker.finish(total_size)
+                return True
+
+            # Niepełny plik - .part zostaje do wznowienia
+            if total_size > 0 and downloaded != total_size:
+                raise Exception("Pobrano niepełny plik")
+
+            # Zmiana nazwy dopiero po weryfikacji - plik docelowy istnieje tylko kompletny
+            await loop.run_in_executor(self._file_executor, self._finalize,
+                                       manager, item, partial, digest)
+
+            tracker.finish(downloaded)
+            item['file_path'] = str(file_path)
+            print(f"✅ Pobrano: {filename} ({downloaded//1024//1024}MB)")
+            return True
+
+        except (asyncio.CancelledError, InsufficientSpaceError):
+            # Zatrzymanie - .part zostaje do wznowienia; brak miejsca - bez ponawiania
+            # (_run_item oznacza element jako nieudany)
+            raise
+
+        except FileTooLargeError as e:
+            manager._record_error(item, e)  # 'rejected' - bez ponawiania
+            manager.trigger_callback('error', url, str(e))
+            return False
+
+        except DigestMismatchError as e:
+            # Uszkodzony .part usunięty przez _record_digests - następna próba od zera
+            manager._record_error(item, e)
+            manager.trigger_callback('error', url, f"Błąd integralności: {e}")
+            return False
+        
+        except aiohttp.ClientResponseError as e:
+            retry_after = e.headers.get('Retry-After') if e.headers else None
+            item['error_class'], item['retry_after'] = classify_status(e.status, retry_after)
+            manager.trigger_callback('error', url, f"Błąd HTTP: {e.status}")
+            return False
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            item['error_class'] = 'timeout' if isinstance(e, asyncio.TimeoutError) else 'connection'
+            manager.trigger_callback('error', url, f"Błąd sieci: {str(e)}")
+            return False
+
+        except Exception as e:
+            manager._record_error(item, e)
+            manager.trigger_callback('error', url, f"Nieoczekiwany błąd: {str(e)[:100]}")
+            return False
+
+        finally:
+            self._session_users[session] -= 1
+            self._retire(session)
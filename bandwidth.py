@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Globalny ogranicznik przepustowości pobierania
+- Hierarchiczne kubełki tokenów (bajty/s): globalny -> poziom subskrypcji -> pojedyncze pobieranie
+- Każdy transfer pobiera bajty ze wszystkich kubełków na swojej ścieżce
+- Limity zmieniane w trakcie działania (set_global_rate / set_tier_rate / Transfer.set_rate)
+"""
+
+import threading
+import time
+
+MB = 1024 * 1024
+
+# Przepustowość poziomów 'download_speed' z SubscriptionManager (bajty/s, None = bez limitu)
+DEFAULT_TIER_RATES = {
+    'normal': 2 * MB,
+    'unlimited': None,
+}
+
+
+class TokenBucket:
+    """Kubełek z rezerwacją: pobranie ponad stan zwraca czas, jaki trzeba odczekać"""
+
+    def __init__(self, rate=None, burst=None):
+        """rate - bajty/s (None = bez limitu), burst - pojemność (domyślnie 1/4 sekundy ruchu)"""
+        self.lock = threading.Lock()
+        self.rate = None
+        self.burst = 0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        with self.lock:
+            self.rate = rate
+            self.burst = burst if burst is not None else (rate / 4 if rate else 0)
+            self.tokens = min(self.tokens, self.burst)
+            self.updated = time.monotonic()
+
+    def reserve(self, amount, now=None):
+        """Pobierz amount tokenów (stan może zejść poniżej zera). Zwraca czas oczekiwania w sekundach."""
+        with self.lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic() if now is None else now
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Transfer:
+    """Uchwyt pojedynczego pobierania - ostatni poziom hierarchii"""
+
+    def __init__(self, governor, tier, rate=None):
+        self.governor = governor
+        self.tier = tier
+        self.bucket = TokenBucket(rate)
+        self.bytes = 0
+        self.waited = 0.0
+
+    def set_rate(self, rate):
+        self.bucket.set_rate(rate)
+
+    def reserve(self, amount):
+        """Zarezerwuj amount bajtów na całej ścieżce. Zwraca czas oczekiwania (dla asyncio)."""
+        now = time.monotonic()
+        delay = max(bucket.reserve(amount, now) for bucket in self.governor._path(self.tier, self))
+        self.bytes += amount
+        self.waited += delay
+        return delay
+
+    def throttle(self, amount):
+        """Zarezerwuj amount bajtów i odczekaj, jeśli limit tego wymaga"""
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        self.governor._close(self)
+
+
+class BandwidthGovernor:
+    def __init__(self, global_rate=None, tier_rates=None, per_download_rate=None):
+        """
+        global_rate - limit całej aplikacji (bajty/s, None = bez limitu),
+        tier_rates - {poziom: bajty/s}, domyślnie DEFAULT_TIER_RATES,
+        per_download_rate - domyślny limit pojedynczego pobierania.
+        """
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket(global_rate)
+        self.tier_buckets = {}
+        for tier, rate in (DEFAULT_TIER_RATES if tier_rates is None else tier_rates).items():
+            self.tier_buckets[tier] = TokenBucket(rate)
+        self.per_download_rate = per_download_rate
+        self.transfers = set()
+
+    @property
+    def global_rate(self):
+        return self.global_bucket.rate
+
+    def set_global_rate(self, rate, burst=None):
+        self.global_bucket.set_rate(rate, burst)
+
+    def set_tier_rate(self, tier, rate, burst=None):
+        with self.lock:
+            bucket = self.tier_buckets.get(tier)
+            if bucket is None:
+                self.tier_buckets[tier] = TokenBucket(rate, burst)
+                return
+        bucket.set_rate(rate, burst)
+
+    def set_per_download_rate(self, rate):
+        """Zmień limit pojedynczego pobierania - także dla trwających transferów"""
+        with self.lock:
+            self.per_download_rate = rate
+            transfers = list(self.transfers)
+        for transfer in transfers:
+            transfer.set_rate(rate)
+
+    def open(self, tier=None, rate=None):
+        """Rozpocznij transfer w danym poziomie; rate nadpisuje per_download_rate"""
+        with self.lock:
+            transfer = Transfer(self, tier, rate if rate is not None else self.per_download_rate)
+            self.transfers.add(transfer)
+        return transfer
+
+    def _close(self, transfer):
+        with self.lock:
+            self.transfers.discard(transfer)
+
+    def _path(self, tier, transfer):
+        bucket = self.tier_buckets.get(tier)
+        if bucket is None:
+            return (self.global_bucket, transfer.bucket)
+        return (self.global_bucket, bucket, transfer.bucket)
+
+    def get_stats(self):
+        """Aktualne limity i liczba trwających transferów"""
+        with self.lock:
+            return {
+                'global_rate': self.global_bucket.rate,
+                'tier_rates': {tier: bucket.rate for tier, bucket in self.tier_buckets.items()},
+                'per_download_rate': self.per_download_rate,
+                'active_transfers': len(self.transfers)
+            }
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Ścieżka odbioru bez kopiowania dla pętli zapisu pobierania
+- Odczyt prosto do wielokrotnie używanych buforów (readinto + memoryview)
+- Ograniczona, globalna pula buforów - stałe zużycie pamięci przy wielu pobraniach;
+  rozmiar dopasowywany do równoległości menedżera (reserve)
+- Wyczerpana pula nie blokuje odbioru: po krótkim czekaniu bufor tymczasowy (poza pulą)
+- Adaptacyjny rozmiar fragmentu: od 64 KB do rozmiaru bufora, wg czasu odczytu
+"""
+
+import http.client
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+KB = 1024
+MB = 1024 * 1024
+
+
+class BufferPool:
+    """Pula buforów bytearray o stałym rozmiarze; acquire() czeka, gdy limit wyczerpany"""
+
+    def __init__(self, buffer_size=4*MB, max_buffers=16):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self.condition = threading.Condition()
+        self.free = []
+        self.allocated = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waits = 0
+        self.overflows = 0
+        self._overflow_in_use = 0
+
+    def reserve(self, max_buffers):
+        """Podnieś limit puli (np. do max_concurrent x segmenty menedżera); nigdy nie obniża"""
+        with self.condition:
+            if max_buffers > self.max_buffers:
+                self.max_buffers = max_buffers
+                self.condition.notify_all()
+
+    def acquire(self, timeout=None, overflow=False):
+        """Wypożycz bufor (nowy tylko, gdy żaden nie jest wolny, a limit na to pozwala)
+
+        Wyczerpana pula: czekaj timeout sekund (None - bez limitu), potem TimeoutError
+        albo - przy overflow=True - bufor tymczasowy, zwalniany zamiast wracać do puli.
+        """
+        with self.condition:
+            while not self.free and self.allocated >= self.max_buffers:
+                self.waits += 1
+                if not self.condition.wait(timeout):
+                    if not overflow:
+                        raise TimeoutError("Brak wolnego bufora w puli")
+                    self.overflows += 1
+                    self._overflow_in_use += 1
+                    self.in_use += 1
+                    self.peak_in_use = max(self.peak_in_use, self.in_use)
+                    return bytearray(self.buffer_size)
+            if self.free:
+                buffer = self.free.pop()
+            else:
+                buffer = bytearray(self.buffer_size)
+                self.allocated += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return buffer
+
+    def release(self, buffer):
+        with self.condition:
+            self.in_use -= 1
+            if self._overflow_in_use:
+                # Bufory są wymienne - pula zatrzymuje najwyżej allocated buforów
+                self._overflow_in_use -= 1
+                return
+            self.free.append(buffer)
+            self.condition.notify()
+
+    @contextmanager
+    def buffer(self, timeout=None):
+        buffer = self.acquire(timeout)
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'buffer_size': self.buffer_size,
+                'max_buffers': self.max_buffers,
+                'allocated': self.allocated,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'waits': self.waits,
+                'overflows': self.overflows
+            }
+
+
+class AdaptiveChunk:
+    """Rozmiar fragmentu dostosowany tak, by jeden odczyt trwał około target sekund"""
+
+    def __init__(self, minimum=64*KB, maximum=4*MB, target=0.05):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.size = minimum
+
+    def record(self, requested, received, elapsed):
+        if received >= requested and elapsed < self.target / 2:
+            self.size = min(self.maximum, self.size * 2)
+        elif elapsed > self.target * 2 or received < requested // 4:
+            self.size = max(self.minimum, self.size // 2)
+
+
+def _reader(response):
+    """Funkcja readinto dla odpowiedzi requests.
+
+    Bez kodowania treści czytamy bezpośrednio z http.client (jedno kopiowanie z gniazda);
+    skompresowane odpowiedzi idą przez urllib3, który dekoduje dane.
+    """
+    raw = response.raw
+    encoding = response.headers.get('content-encoding', 'identity').lower()
+    fp = getattr(raw, '_fp', None)
+    if encoding == 'identity' and fp is not None and hasattr(fp, 'readinto'):
+        return fp.readinto, True
+    return raw.readinto, False
+
+
+def _read(readinto, view):
+    """readinto z błędami zamienionymi na wyjątki requests (jak przy iter_content)"""
+    try:
+        return readinto(view)
+    except TimeoutError as e:
+        raise requests.exceptions.ReadTimeout(e)
+    except http.client.IncompleteRead as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except (http.client.HTTPException, OSError) as e:
+        raise requests.exceptions.ConnectionError(e)
+
+
+def iter_into(response, pool=None, minimum=64*KB, maximum=None, wait=0.1):
+    """Iteruj po treści odpowiedzi jako memoryview fragmentów bufora z puli.
+
+    Każdy fragment jest ważny tylko do następnej iteracji (bufor jest nadpisywany).
+    Przerwanie iteracji należy zakończyć close() generatora (contextlib.closing).
+    Wyczerpana pula - po wait sekundach bufor tymczasowy: wątek trzymający otwartą
+    odpowiedź nie czeka bez końca (i nie blokuje zatrzymania menedżera).
+    """
+    pool = pool or buffer_pool
+    chunk = AdaptiveChunk(minimum=min(minimum, pool.buffer_size),
+                          maximum=min(maximum or pool.buffer_size, pool.buffer_size))
+    readinto, direct = _reader(response)
+
+    buffer = pool.acquire(timeout=wait, overflow=True)
+    try:
+        view = memoryview(buffer)
+        while True:
+            requested = chunk.size
+            start = time.perf_counter()
+            received = _read(readinto, view[:requested])
+            if not received:
+                break
+            chunk.record(requested, received, time.perf_counter() - start)
+            yield view[:received]
+
+        if direct:
+            # Treść przeczytana z pominięciem urllib3 - oddaj połączenie do puli keep-alive
+            response.raw.release_conn()
+    finally:
+        pool.release(buffer)
+
+
+# Singleton instance
+buffer_pool = BufferPool()
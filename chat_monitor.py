@@ -14,12 +14,15 @@ import threading
 import sqlite3
 from pathlib import Path
 from datetime import datetime
-import requests
+from http_pool import get_session
 import zipfile
 import tempfile
 from urllib.parse import urlparse
 import json
 
+from url_canonical import canonical_url
+from url_classifier import ARCHIVE, BLOCKED, DANGEROUS, PLATFORM, VIDEO, classify
+
 class ChatMonitor:
     def __init__(self, download_manager):
         self.download_manager = download_manager
@@ -123,7 +126,7 @@ class ChatMonitor:
                 else:
                     link = match if match.startswith('http') else f"http://{match}"
                 
-                if link not in self.processed_links:
+                if canonical_url(link) not in self.processed_links:
                     links.append(link)
         return links
     
@@ -206,7 +209,7 @@ class ChatMonitor:
         try:
             self.notify(f"📦 Pobieranie ZIP: {url}")
             
-            response = requests.get(url, stream=True, timeout=30)
+            response = get_session().get(url, stream=True, timeout=30)
             response.raise_for_status()
             
             # Zapisz tymczasowy plik ZIP
@@ -235,24 +238,27 @@ class ChatMonitor:
     
     def process_discovered_link(self, link, source="chat"):
         """Przetwórz wykryty link"""
-        if link in self.processed_links:
+        # Historia trzyma kanoniczne klucze - warianty tego samego linku (youtu.be / watch?v=,
+        # parametry śledzące) przetwarzane są raz
+        key = canonical_url(link)
+        if key in self.processed_links:
             return
         
-        self.processed_links.add(link)
+        self.processed_links.add(key)
         self.save_history()
         
         self.notify(f"🔗 Znaleziono link w {source}: {link[:50]}...")
         
         # Określ typ pliku
-        link_lower = link.lower()
+        verdict = classify(link)
         
-        if any(ext in link_lower for ext in ['.zip', '.rar', '.7z', '.tar.gz']):
+        if verdict.kind == ARCHIVE:
             # Plik archiwum
             download_dir = Path.home() / "Downloads" / "ChatArchives"
             download_dir.mkdir(exist_ok=True)
             self.download_zip_file(link, download_dir)
             
-        elif any(ext in link_lower for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv']):
+        elif verdict.kind == VIDEO:
             # Plik wideo
             download_dir = Path.home() / "Downloads" / "ChatVideos"
             download_dir.mkdir(exist_ok=True)
@@ -260,13 +266,16 @@ class ChatMonitor:
             if success:
                 self.notify(f"➕ Dodano wideo do kolejki: {link[:50]}...")
             
-        elif any(domain in link_lower for domain in ['youtube.com', 'youtu.be', 'vimeo.com']):
+        elif verdict.kind == PLATFORM:
             # Serwis wideo
             download_dir = Path.home() / "Downloads" / "ChatVideos"
             download_dir.mkdir(exist_ok=True)
             success = self.download_manager.add_to_queue(link, download_dir, priority=2)
             if success:
                 self.notify(f"➕ Dodano wideo z serwisu do kolejki: {link[:50]}...")
+        
+        elif verdict.kind in (BLOCKED, DANGEROUS):
+            self.notify(f"⛔ Pominięto link: {verdict.message}", "warning")
     
     def start_monitoring(self):
         """Uruchom monitoring czatów"""
@@ -329,7 +338,7 @@ class ChatMonitor:
             if self.history_file.exists():
                 with open(self.history_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    self.processed_links = set(data.get('processed_links', []))
+                    self.processed_links = set(map(canonical_url, data.get('processed_links', [])))
         except Exception as e:
             print(f"Błąd wczytywania historii: {e}")
             self.processed_links = set()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Bezpiecznik (circuit breaker) per host
+- closed: pobrania normalnie; zbyt duży odsetek błędów hosta w oknie ostatnich prób -> open
+- open: elementy hosta czekają w kolejce bez zajmowania wątków roboczych
+- half-open: po czasie otwarcia (przejście leniwe, przy sprawdzeniu hosta) jedna próba
+  (sonda) decyduje - sukces zamyka, błąd otwiera ponownie z dłuższym czasem (wykładniczo,
+  do max_open_seconds); wyniki innych żądań poza stanem closed są pomijane
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate=0.5, min_requests=5, window=20,
+                 open_seconds=30.0, max_open_seconds=600.0, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.clock = clock
+
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window)  # True - sukces, False - błąd hosta
+        self.open_until = 0.0
+        self.opened = 0  # Kolejne otwarcia bez zamknięcia (wydłużają czas otwarcia)
+        self.probe_in_flight = False
+
+    def available(self):
+        """Czy element hosta może wystartować (bez zmiany stanu)"""
+        if self.state == CLOSED:
+            return True
+        return self.state == HALF_OPEN and not self.probe_in_flight
+
+    def expire(self):
+        """Po czasie otwarcia open -> half-open (leniwie, przy sprawdzeniu hosta). Zwraca nowy stan."""
+        if self.state == OPEN and self.clock() >= self.open_until:
+            self.state = HALF_OPEN
+            return HALF_OPEN
+        return None
+
+    def dispatch(self):
+        """Element hosta wystartował. True - to sonda, której wynik rozstrzyga o stanie."""
+        if self.state != HALF_OPEN or self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def record(self, success, probe=False):
+        """Wynik próby. Zwraca nowy stan, gdy nastąpiło przejście.
+
+        Poza stanem closed liczy się tylko wynik sondy - odpowiedzi żądań wysłanych
+        przed otwarciem są pomijane.
+        """
+        if self.state != CLOSED:
+            if not probe:
+                return None
+            self.probe_in_flight = False
+            if success:
+                return self._close()
+            return self._open()
+
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if (len(self.outcomes) >= self.min_requests and
+                failures / len(self.outcomes) >= self.failure_rate):
+            return self._open()
+        return None
+
+    def release(self, probe=False):
+        """Sonda zakończona bez rozstrzygnięcia - pozwól wystartować kolejnej"""
+        if probe:
+            self.probe_in_flight = False
+
+    def retry_in(self):
+        """Sekundy do końca otwarcia (None, gdy bezpiecznik nie jest otwarty)"""
+        if self.state != OPEN:
+            return None
+        return max(0.0, self.open_until - self.clock())
+
+    def _open(self):
+        self.probe_in_flight = False
+        duration = min(self.max_open_seconds, self.open_seconds * 2 ** self.opened)
+        self.opened += 1
+        self.state = OPEN
+        self.open_until = self.clock() + duration
+        return OPEN
+
+    def _close(self):
+        self.state = CLOSED
+        self.opened = 0
+        self.outcomes.clear()
+        return CLOSED
+
+    def get_stats(self):
+        failures = self.outcomes.count(False)
+        return {
+            'state': self.state,
+            'requests': len(self.outcomes),
+            'failure_rate': failures / len(self.outcomes) if self.outcomes else 0.0,
+            'retry_in': self.retry_in(),
+            'opened': self.opened
+        }
+
+
+class HostBreakers:
+    """Bezpieczniki wszystkich hostów i historia przejść (do monitorowania)"""
+
+    def __init__(self, history=100, **breaker_options):
+        self.breaker_options = breaker_options
+        self.breakers = {}
+        self.transitions = deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback(host, stary_stan, nowy_stan) po każdym przejściu"""
+        self.listeners.append(callback)
+
+    def _breaker(self, host):
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(**self.breaker_options)
+        return breaker
+
+    def available(self, host):
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            return True
+        if breaker.state == OPEN:
+            with self.lock:
+                new = breaker.expire()
+            self._notify(host, OPEN, new)
+        return breaker.available()
+
+    def dispatch(self, host):
+        """Element hosta wystartował. True - element jest sondą (przekazać do record / release)."""
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            return False
+        with self.lock:
+            return breaker.dispatch()
+
+    def record(self, host, success, probe=False):
+        with self.lock:
+            breaker = self._breaker(host)
+            old = breaker.state
+            new = breaker.record(success, probe)
+        self._notify(host, old, new)
+
+    def release(self, host, probe=False):
+        breaker = self.breakers.get(host)
+        if breaker is not None:
+            with self.lock:
+                breaker.release(probe)
+
+    def retry_in(self, hosts):
+        """Sekundy do końca otwarcia bezpiecznika któregoś z hostów z czekającymi elementami
+        (None, gdy żaden z nich nie czeka na bezpiecznik)"""
+        delays = []
+        for host in hosts:
+            breaker = self.breakers.get(host)
+            if breaker is not None and breaker.state == OPEN:
+                delays.append(breaker.retry_in())
+        return min(delays) if delays else None
+
+    def _notify(self, host, old, new):
+        if new is None or new == old:
+            return
+        self.transitions.append({'time': time.time(), 'host': host, 'from': old, 'to': new})
+        print(f"⚡ Bezpiecznik {host}: {old} -> {new}")
+        for callback in self.listeners:
+            callback(host, old, new)
+
+    def get_status(self):
+        with self.lock:
+            return {
+                'hosts': {host: breaker.get_stats() for host, breaker in sorted(self.breakers.items())},
+                'transitions': list(self.transitions)
+            }
@@ -3,6 +3,7 @@
 Domyślna konfiguracja systemu Video Downloader
 """
 
+import copy
 import os
 from pathlib import Path
 
@@ -25,6 +26,47 @@ DEFAULT_CONFIG = {
         "retry_attempts": 3,
         "retry_delay_seconds": 5,
         "chunk_size": 8192,
+        "max_per_host": 2,  # Limit równoległych pobrań z jednego hosta (None = bez limitu)
+        "segments": 4,  # Równoległe zakresy HTTP Range dla dużych plików (1 = wyłączone)
+        "segment_threshold_mb": 32,
+        "checkpoint_interval_mb": 4,  # Co ile MB utrwalać stan wznawiania (.part.json)
+        "digests": ["md5", "sha256"],  # Skróty liczone w locie (np. "blake2b", "xxh3_64")
+        "deduplicate": True,  # Pliki o tej samej treści (SHA-256) jako dowiązania do jednej kopii
+        "early_fingerprint": True,  # Przerwij duplikat po pierwszych MB (skrót prefiksu + rozmiar)
+        "fingerprint_tail_probe": True,  # Potwierdź dopasowanie żądaniem Range o końcówkę pliku
+        "history_size": 1000,  # Ile ostatnich wyników trzymać w pamięci (starsze - archiwum history.db)
+        "persistent_queue": True,  # Dziennik kolejki w SQLite - niedokończone pobrania wracają po restarcie
+        "engine": "threaded",  # "threaded" (pula wątków) lub "asyncio" (wymaga aiohttp)
+    },
+    
+    "http": {
+        "pool_hosts": 32,             # Ile pul połączeń (hostów) trzymać
+        "pool_maxsize_per_host": 16,  # Limit utrzymywanych połączeń keep-alive na host
+        "pool_block": False,          # Czekaj na wolne połączenie zamiast otwierać ponad limit
+    },
+    
+    "rate_limit": {
+        "per_minute": 10,             # Globalny limit pobrań (kubełek tokenów)
+        "per_hour": 50,
+        "per_domain": {},             # np. {"example.com": {"per_minute": 5, "per_hour": 20}}
+        "shared_store": None,         # Ścieżka bazy SQLite - wspólny budżet dla wielu procesów
+    },
+    
+    "bandwidth": {
+        "global_limit_mb_per_second": None,  # Limit całej aplikacji (None = bez limitu)
+        "tiers_mb_per_second": {             # Poziomy 'download_speed' z subskrypcji
+            "normal": 2,
+            "unlimited": None,
+        },
+        "per_download_mb_per_second": None,
+    },
+    
+    "circuit_breaker": {
+        "failure_rate": 0.5,       # Odsetek błędów hosta (połączenie, timeout, 5xx) otwierający bezpiecznik
+        "min_requests": 5,         # Minimalna liczba prób w oknie przed oceną
+        "window": 20,              # Okno ostatnich prób per host
+        "open_seconds": 30,        # Czas do pierwszej sondy (podwajany przy kolejnych otwarciach)
+        "max_open_seconds": 600,
     },
     
     "monitoring": {
@@ -48,6 +90,7 @@ DEFAULT_CONFIG = {
             "phishing-site.net",
             "suspicious-downloads.org",
         ],
+        "blocklist_dir": "~/.video_downloader/blocklists",  # Skompilowane listy zagrożeń (*.blk)
         "scan_downloads": True,
         "quarantine_suspicious": True,
         "max_url_length": 2048,
@@ -84,8 +127,8 @@ DEFAULT_CONFIG = {
 }
 
 def get_config():
-    """Zwraca domyślną konfigurację"""
-    return DEFAULT_CONFIG.copy()
+    """Zwraca domyślną konfigurację (kopia - deep_update nie zmienia wartości domyślnych)"""
+    return copy.deepcopy(DEFAULT_CONFIG)
 
 def save_config(config, config_file=None):
     """Zapisuje konfigurację do pliku JSON"""
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Magazyn treści adresowany skrótem SHA-256 (deduplikacja pobranych plików)
+- Obiekty w <root>/objects/ab/cdef... - twarde dowiązanie do pierwszej kopii pliku
+- Kolejne pliki o tej samej treści zastępowane dowiązaniem (hardlink lub reflink)
+- Indeks w SQLite, w pamięci zbiór znanych skrótów - sprawdzenie "czy już to mamy" w O(1)
+- Odcisk wczesny: skrót pierwszych N MB + rozmiar (+ skrót końcówki) - duplikat
+  rozpoznany po kilku MB, zanim pobierzemy całość
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+MB = 1024 * 1024
+
+# ioctl FICLONE (Linux) - kopia współdzieląca bloki na btrfs/xfs
+_FICLONE = 0x40049409
+
+
+def _reflink(source, target):
+    """Utwórz target jako reflink source. Zwraca False, gdy system plików tego nie obsługuje."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    src_fd = os.open(source, os.O_RDONLY)
+    try:
+        dst_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+            return True
+        except OSError:
+            return False
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+def file_fingerprint(path, size, prefix_size, tail_size):
+    """(skrót prefiksu, skrót końcówki) pliku - te same wartości co EarlyFingerprint i sonda Range"""
+    with open(path, 'rb') as f:
+        prefix = hashlib.sha256(f.read(prefix_size)).hexdigest()
+        f.seek(max(0, size - tail_size))
+        tail = hashlib.sha256(f.read(tail_size)).hexdigest()
+    return prefix, tail
+
+
+class EarlyFingerprint:
+    """Skrót pierwszych prefix_size bajtów transferu, liczony z kolejnych fragmentów"""
+
+    def __init__(self, total_size, prefix_size):
+        self.total_size = total_size
+        self.prefix_size = prefix_size
+        self.hash = hashlib.sha256()
+        self.received = 0
+
+    def update(self, data):
+        """Dolicz fragment. Zwraca True dokładnie raz - gdy prefiks jest kompletny."""
+        if self.received >= self.prefix_size:
+            return False
+        needed = self.prefix_size - self.received
+        self.hash.update(data[:needed])
+        self.received += min(needed, len(data))
+        return self.received >= self.prefix_size
+
+    def update_from_file(self, path, end):
+        """Dolicz bajty [0, end) z pliku .part poprzedniej próby"""
+        with open(path, 'rb') as f:
+            self.update(f.read(min(end, self.prefix_size)))
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class ContentStore:
+    def __init__(self, root=None, prefix_size=4*MB, tail_size=64*1024):
+        self.root = Path(root) if root else Path.home() / ".video_downloader" / "store"
+        # Odcisk wczesny - tylko dla plików większych niż prefiks
+        self.prefix_size = prefix_size
+        self.tail_size = tail_size
+        self.objects_dir = self.root / "objects"
+        self.lock = threading.Lock()
+        self.conn = None
+
+        # Pamięć podręczna indeksu: sha256 -> (rozmiar, ścieżka kanoniczna)
+        self.blobs = {}
+        # (rozmiar, skrót prefiksu) -> (skrót końcówki, sha256)
+        self.fingerprints = {}
+        self.bytes_saved = 0
+        self.files_deduplicated = 0
+
+    def _open(self):
+        """Otwórz indeks przy pierwszym użyciu (wywoływać pod self.lock)"""
+        if self.conn is not None:
+            return
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.root / "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                path TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS links (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                size INTEGER NOT NULL,
+                prefix TEXT NOT NULL,
+                tail TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                PRIMARY KEY (size, prefix)
+            )
+        """)
+        self.conn.commit()
+
+        self.fingerprints = {(size, prefix): (tail, sha256) for size, prefix, tail, sha256
+                             in self.conn.execute("SELECT size, prefix, tail, sha256 FROM fingerprints")}
+        self.blobs = {sha256: (size, path) for sha256, size, path
+                      in self.conn.execute("SELECT sha256, size, path FROM blobs")}
+        count, saved = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM links").fetchone()
+        self.files_deduplicated, self.bytes_saved = count, saved
+
+    def object_path(self, sha256):
+        return self.objects_dir / sha256[:2] / sha256[2:]
+
+    def contains(self, sha256):
+        """Czy treść o tym skrócie jest już w magazynie - O(1)"""
+        with self.lock:
+            self._open()
+            return sha256 in self.blobs
+
+    def lookup(self, sha256):
+        """Ścieżka istniejącej kopii treści lub None"""
+        with self.lock:
+            self._open()
+            entry = self.blobs.get(sha256)
+        if entry and Path(entry[1]).exists():
+            return Path(entry[1])
+        return None
+
+    def ingest(self, file_path, sha256, size=None):
+        """Dodaj pobrany plik do magazynu; duplikat zastępowany dowiązaniem.
+
+        Zwraca słownik: deduplicated, method ('hardlink' / 'reflink' / 'stored' / None), saved.
+        """
+        file_path = Path(file_path)
+        size = file_path.stat().st_size if size is None else size
+
+        with self.lock:
+            self._open()
+            entry = self.blobs.get(sha256)
+            canonical = Path(entry[1]) if entry else None
+
+            if canonical is not None and canonical.exists() and entry[0] == size:
+                if os.path.samefile(canonical, file_path):
+                    return {'deduplicated': False, 'method': None, 'saved': 0}
+                method = self._link(canonical, file_path)
+                if method:
+                    self._record_link(file_path, sha256, size)
+                    return {'deduplicated': True, 'method': method, 'saved': size}
+
+            # Nowa treść - obiekt jako twarde dowiązanie do pobranego pliku (bez kopiowania)
+            object_path = self.object_path(sha256)
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                object_path.unlink(missing_ok=True)
+                os.link(file_path, object_path)
+                canonical = object_path
+            except OSError:
+                # Inny system plików - indeks wskazuje bezpośrednio na pobrany plik
+                canonical = file_path
+
+            self.blobs[sha256] = (size, str(canonical))
+            self.conn.execute("INSERT OR REPLACE INTO blobs (sha256, size, path) VALUES (?, ?, ?)",
+                              (sha256, size, str(canonical)))
+            if size > self.prefix_size:
+                prefix, tail = file_fingerprint(canonical, size, self.prefix_size, self.tail_size)
+                self.fingerprints[(size, prefix)] = (tail, sha256)
+                self.conn.execute("INSERT OR REPLACE INTO fingerprints (size, prefix, tail, sha256) "
+                                  "VALUES (?, ?, ?, ?)", (size, prefix, tail, sha256))
+            self.conn.commit()
+            return {'deduplicated': False, 'method': 'stored', 'saved': 0}
+
+    def match_fingerprint(self, size, prefix):
+        """Kandydat dla odcisku wczesnego: (skrót końcówki, sha256) lub None - O(1)"""
+        with self.lock:
+            self._open()
+            candidate = self.fingerprints.get((size, prefix))
+        if candidate and self.lookup(candidate[1]) is not None:
+            return candidate
+        return None
+
+    def link_existing(self, sha256, target):
+        """Utwórz target jako dowiązanie do znanej treści (pobieranie przerwane jako duplikat).
+
+        Bez możliwości dowiązania - zwykła kopia. Zwraca użytą metodę lub None, gdy treści brak.
+        """
+        target = Path(target)
+        with self.lock:
+            self._open()
+            entry = self.blobs.get(sha256)
+            if entry is None or not Path(entry[1]).exists():
+                return None
+            size, source = entry[0], Path(entry[1])
+            method = self._link(source, target)
+            if method is None:
+                shutil.copyfile(source, target)
+                return 'copy'
+            self._record_link(target, sha256, size)
+            return method
+
+    def _record_link(self, path, sha256, size):
+        """Zapisz plik zastąpiony dowiązaniem (wywoływać pod self.lock)"""
+        self.conn.execute("INSERT OR REPLACE INTO links (path, sha256, size) VALUES (?, ?, ?)",
+                          (str(path), sha256, size))
+        self.conn.commit()
+        self.files_deduplicated += 1
+        self.bytes_saved += size
+
+    def _link(self, source, target):
+        """Zastąp target dowiązaniem do source (atomowo przez plik tymczasowy)"""
+        temp = target.with_name(f".{target.name}.dedup")
+        temp.unlink(missing_ok=True)
+        try:
+            os.link(source, temp)
+            method = 'hardlink'
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            if not _reflink(source, temp):
+                temp.unlink(missing_ok=True)
+                return None
+            method = 'reflink'
+        os.replace(temp, target)
+        return method
+
+    def get_stats(self):
+        with self.lock:
+            if self.conn is None and not (self.root / "index.db").exists():
+                return {'blobs': 0, 'files_deduplicated': 0, 'bytes_saved': 0}
+            self._open()
+            return {
+                'blobs': len(self.blobs),
+                'files_deduplicated': self.files_deduplicated,
+                'bytes_saved': self.bytes_saved
+            }
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
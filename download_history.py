@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Historia pobrań z ograniczoną pamięcią
+- W pamięci tylko ostatnie maxlen wyników (pierścień), starsze trafiają do archiwum na dysku
+- Archiwum w SQLite z indeksem (klucz URL-a, stan) - sprawdzenie "czy URL był już
+  pobrany" działa przy dowolnej długości historii (także dla wariantów URL-a o tym
+  samym kluczu kanonicznym)
+- Przed zapytaniem filtr Blooma kluczy archiwum (2 B na klucz) - nowe URL-e
+  odrzucane bez SQLite (sprawdzenie odbywa się pod blokadą menedżera)
+- Zapis do archiwum grupowy, w wątku w tle - przeniesienie wpisu nie czeka na dysk
+- Wpis przeniesiony do archiwum zgłaszany przez on_archived (np. usunięcie z dziennika kolejki)
+- Ponowienie nieudanych obejmuje także wpisy z archiwum
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+from queue_journal import COLUMNS, item_to_row, row_to_item
+
+
+class KeyFilter:
+    """Filtr Blooma kluczy: 16 bitów na klucz, 2 pozycje ze skrótu blake2b (ok. 1.5%
+    fałszywych trafień przy pełnym filtrze). Bez usuwania - filtr buduje się od nowa."""
+
+    BITS_PER_KEY = 16
+
+    def __init__(self, capacity=0):
+        self.capacity = max(capacity, 1024)
+        self.bits = self.capacity * self.BITS_PER_KEY
+        self.bloom = bytearray(self.bits // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        return (value & 0xFFFFFFFF) % self.bits, (value >> 32) % self.bits
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bloom[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        """False - klucza na pewno nie ma"""
+        bloom = self.bloom
+        return all(bloom[position >> 3] >> (position & 7) & 1 for position in self._positions(key))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+class HistoryArchive:
+    """Archiwum starszych wyników w SQLite.
+
+    add() tylko buforuje wiersz (wywoływane pod blokadą menedżera, także z pętli asyncio) -
+    zapis grupowy w wątku w tle, jak w QueueJournal. Sprawdzenia (contains) korzystają
+    z osobnego połączenia czytającego (WAL) - nie czekają na trwający zapis partii.
+    """
+
+    def __init__(self, db_path=None, commit_interval=0.05):
+        self.db_path = Path(db_path) if db_path else Path.home() / ".video_downloader" / "history.db"
+        self.commit_interval = commit_interval
+        # Bufor zapisu, filtry i liczniki; kolejność blokad: lock -> read_lock -> db_lock
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.db_lock = threading.Lock()  # Połączenie zapisujące
+        self.read_lock = threading.Lock()  # Połączenie czytające
+        self.flush_lock = threading.Lock()  # Kolejność zatwierdzania partii
+        self.conn = None
+        self.reader = None
+        # Stan -> KeyFilter kluczy w archiwum (budowany przy pierwszym sprawdzeniu)
+        self.filters = {}
+        # Stan -> liczba wpisów (z bazy przy pierwszym użyciu, potem w pamięci)
+        self.counts = {}
+        self.pending = []  # Wiersze czekające na zapis
+        # (klucz, stan) wierszy jeszcze niewidocznych w bazie (bufor i partia w zapisie)
+        self._unflushed = Counter()
+        self.flusher = None
+        self.closed = False
+        self.commits = 0
+
+    def _open(self):
+        """Otwórz bazę przy pierwszym użyciu (wywoływać pod self.db_lock)"""
+        if self.conn is not None:
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                download_dir TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                max_attempts INTEGER NOT NULL,
+                added_time TEXT NOT NULL,
+                target_path TEXT,
+                file_path TEXT,
+                error TEXT,
+                key TEXT
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(history)")]
+        if 'key' not in columns:
+            # Archiwum sprzed kluczy kanonicznych - kluczem starych wpisów jest sam URL
+            self.conn.execute("ALTER TABLE history ADD COLUMN key TEXT")
+            self.conn.execute("UPDATE history SET key = url")
+        self.conn.execute("DROP INDEX IF EXISTS history_url")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS history_key ON history (key, state)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS history_state ON history (state)")
+        self.conn.commit()
+
+    def _reader(self):
+        """Połączenie czytające (wywoływać pod self.read_lock)"""
+        if self.reader is None:
+            with self.db_lock:
+                self._open()
+            self.reader = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        return self.reader
+
+    def add(self, item, state, key=None):
+        """Zapisz wpis (w tle); key - klucz deduplikacji (domyślnie URL)"""
+        key = key or item['url']
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Archiwum historii jest zamknięte")
+            first = not self.pending
+            self.pending.append(item_to_row(item, state) + (key,))
+            self._unflushed[(key, state)] += 1
+            if state in self.counts:
+                self.counts[state] += 1
+            keys = self.filters.get(state)
+            if keys is not None:
+                keys.add(key)
+                if keys.full:
+                    # Przebudowa z większą pojemnością przy następnym sprawdzeniu
+                    del self.filters[state]
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_loop, name="history-archive", daemon=True)
+                self.flusher.start()
+            if first:
+                self.condition.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                # Zbierz wpisy z okna commit_interval w jedną transakcję
+                deadline = time.monotonic() + self.commit_interval
+                while not self.closed and (remaining := deadline - time.monotonic()) > 0:
+                    self.condition.wait(remaining)
+                if self.closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Zapisz zbuforowane wpisy teraz (jeden commit). Zwraca ich liczbę."""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.pending = self.pending, []
+            if not rows:
+                return 0
+            with self.db_lock:
+                self._open()
+                with self.conn:
+                    self.conn.executemany(
+                        f"INSERT INTO history ({', '.join(COLUMNS)}, key) "
+                        f"VALUES ({', '.join('?' * (len(COLUMNS) + 1))})", rows)
+            # Wiersze widoczne w bazie - sprawdzenia mogą już pytać SQLite
+            with self.lock:
+                self._unflushed.subtract((row[-1], row[3]) for row in rows)
+                self._unflushed += Counter()
+            self.commits += 1
+            return len(rows)
+
+    def _filter(self, state):
+        """Filtr kluczy w danym stanie - z bazy i bufora przy pierwszym użyciu (pod self.lock)"""
+        keys = self.filters.get(state)
+        if keys is None:
+            with self.read_lock:
+                stored = [key for key, in self._reader().execute(
+                    "SELECT key FROM history WHERE state = ?", (state,))]
+            stored.extend(key for (key, key_state) in self._unflushed if key_state == state)
+            keys = self.filters[state] = KeyFilter(2 * len(stored))
+            for key in stored:
+                keys.add(key)
+        return keys
+
+    def contains(self, key, state):
+        with self.lock:
+            if key not in self._filter(state):
+                return False
+            if (key, state) in self._unflushed:
+                return True
+        # Wiersz znika z _unflushed dopiero po zatwierdzeniu - baza już go pokazuje
+        with self.read_lock:
+            return self._reader().execute("SELECT 1 FROM history WHERE key = ? AND state = ? LIMIT 1",
+                                          (key, state)).fetchone() is not None
+
+    def count(self, state):
+        with self.lock:
+            if state not in self.counts:
+                stored = 0
+                if self.db_path.exists():
+                    with self.read_lock:
+                        stored = self._reader().execute(
+                            "SELECT COUNT(*) FROM history WHERE state = ?", (state,)).fetchone()[0]
+                self.counts[state] = stored + sum(
+                    count for (_, key_state), count in self._unflushed.items() if key_state == state)
+            return self.counts[state]
+
+    def _forget(self, state):
+        """Wpisy stanu usunięte z bazy - filtr i licznik od nowa (pod self.lock)"""
+        self.filters.pop(state, None)
+        self.counts[state] = 0
+
+    def take(self, state):
+        """Usuń i zwróć wszystkie wpisy w danym stanie (od najstarszego)"""
+        self.flush()
+        with self.lock:
+            with self.db_lock:
+                self._open()
+                rows = self.conn.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM history WHERE state = ? ORDER BY id", (state,)).fetchall()
+                with self.conn:
+                    self.conn.execute("DELETE FROM history WHERE state = ?", (state,))
+            self._forget(state)
+        return [row_to_item(row) for row in rows]
+
+    def clear(self, state):
+        """Usuń wpisy w danym stanie. Zwraca ich URL-e."""
+        self.flush()
+        with self.lock:
+            if self.conn is None and not self.db_path.exists():
+                return []
+            with self.db_lock:
+                self._open()
+                urls = [url for url, in self.conn.execute("SELECT url FROM history WHERE state = ?", (state,))]
+                with self.conn:
+                    self.conn.execute("DELETE FROM history WHERE state = ?", (state,))
+            self._forget(state)
+        return urls
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        with self.read_lock:
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+        with self.db_lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class DownloadHistory:
+    """Ostatnie wyniki w danym stanie ('done' / 'failed') - odczyt jak z listy.
+
+    Obiekt służy też jako indeks URL-i dla DownloadQueue(completed=...):
+    wpis dodaje append(), więc add() z kolejki niczego nie zmienia.
+    key - klucz deduplikacji URL-a (ten sam co w kolejce; musi dawać ten sam
+    wynik dla gotowego klucza), domyślnie sam URL.
+    on_archived(item) - wywoływane po przeniesieniu wpisu do archiwum.
+    """
+
+    def __init__(self, state, maxlen=1000, archive=None, key=None, on_archived=None):
+        self.state = state
+        self.maxlen = maxlen
+        self.archive = archive
+        self.key = key or str
+        self.on_archived = on_archived
+        self.recent = deque()
+        self._urls = Counter()  # Klucze URL-i wpisów w pamięci
+        # Bez archiwum przeniesione wpisy przepadają - zostają tylko klucze ich URL-i
+        self._evicted_urls = set()
+        self.evicted = 0
+
+    def append(self, item):
+        self.recent.append(item)
+        self._urls[self._item_key(item)] += 1
+        while len(self.recent) > self.maxlen:
+            self._spill(self.recent.popleft())
+
+    def _spill(self, item):
+        key = self._item_key(item)
+        self._urls[key] -= 1
+        if not self._urls[key]:
+            del self._urls[key]
+        if self.archive is not None:
+            self.archive.add(item, self.state, key)
+            if self.on_archived is not None:
+                self.on_archived(item)
+        else:
+            self._evicted_urls.add(key)
+        self.evicted += 1
+
+    def _item_key(self, item):
+        # Klucz zapamiętany przez kolejkę (item['key']) - bez ponownej kanonizacji
+        key = item.get('key')
+        return key if key is not None else self.key(item['url'])
+
+    def add(self, url):
+        """Zgodność z interfejsem zbioru URL-i (DownloadQueue.mark_completed)"""
+
+    def __contains__(self, url):
+        return self.contains_key(self.key(url))
+
+    def contains_key(self, key):
+        """Jak `url in historia`, dla gotowego klucza (DownloadQueue liczy go raz na URL)"""
+        if key in self._urls:
+            return True
+        if self.archive is not None:
+            return self.archive.contains(key, self.state)
+        return key in self._evicted_urls
+
+    def __len__(self):
+        return len(self.recent)
+
+    def __iter__(self):
+        return iter(list(self.recent))
+
+    def __getitem__(self, index):
+        return self.recent[index]
+
+    @property
+    def total(self):
+        """Liczba wszystkich wyników: w pamięci i w archiwum"""
+        archived = self.archive.count(self.state) if self.archive is not None else self.evicted
+        return len(self.recent) + archived
+
+    def take_all(self):
+        """Usuń i zwróć wszystkie wpisy - najpierw z archiwum (najstarsze)"""
+        items = self.archive.take(self.state) if self.archive is not None else []
+        items.extend(self.recent)
+        self.recent.clear()
+        self._urls.clear()
+        self._evicted_urls.clear()
+        self.evicted = 0
+        return items
+
+    def clear(self):
+        """Wyczyść historię. Zwraca URL-e usuniętych wpisów."""
+        urls = self.archive.clear(self.state) if self.archive is not None else []
+        urls.extend(item['url'] for item in self.recent)
+        self.recent.clear()
+        self._urls.clear()
+        self._evicted_urls.clear()
+        self.evicted = 0
+        return urls
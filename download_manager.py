@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """
 Zaawansowany system zarządzania pobieraniem
-- Kolejka pobierania z priorytetami
-- Równoległe pobieranie z limitem
+- Kolejka pobierania z priorytetami (kopiec + indeksy duplikatów)
+- Równoległe pobieranie z limitem (pula wątków lub silnik asyncio)
+- Pobieranie segmentowe dużych plików (HTTP Range)
+- Wznawianie przerwanych pobrań (pliki .part + stan w pliku pobocznym)
 - Rate limiting - ochrona przed spamem
 - Detekcja duplikatów
 - Walidacja bezpieczeństwa
@@ -13,71 +15,281 @@ import re
 import threading
 import time
 from collections import deque
+from contextlib import closing
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
 
+from download_history import DownloadHistory
+from download_queue import DownloadQueue, host_of
+from http_pool import http_pool
+from bandwidth import BandwidthGovernor
+from buffer_pool import buffer_pool, iter_into
+from circuit_breaker import HostBreakers
+from content_store import EarlyFingerprint
+from file_writer import InsufficientSpaceError
+from partial_download import PartialDownload
+from progress_tracker import ProgressTracker
+from rate_limiter import RateLimiter, SqliteBucketStore
+from retry_policy import DEFAULT_POLICIES, DownloadInterrupted, FileTooLargeError, classify_error
+from segmented_download import RangeNotSupportedError, SegmentedDownloader
+from stream_digest import DEFAULT_ALGORITHMS, DigestMismatchError, StreamingDigest, new_hash, parse_digest_headers
+from url_canonical import canonical_url
+from url_classifier import url_classifier
+
+# Klasy błędów świadczące o problemie hosta (nie konkretnego pliku)
+HOST_ERRORS = ('connection', 'timeout', 'server')
+
 
 class DownloadManager:
-    def __init__(self, max_concurrent=3, max_file_size=500*1024*1024):
-        self.queue = []
-        self.completed = []
-        self.failed = []
+    ENGINES = ('threaded', 'asyncio')
+    
+    def __init__(self, max_concurrent=3, max_file_size=500*1024*1024, engine='threaded',
+                 segments=4, segment_threshold=32*1024*1024, http=None,
+                 rate_limiter=None, max_per_host=None, bandwidth=None, content_store=None,
+                 journal=None, history_size=1000, archive=None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Nieznany silnik pobierania: {engine} (dostępne: {', '.join(self.ENGINES)})")
+        
+        # Duplikaty rozpoznawane po kanonicznej postaci URL-a (youtu.be/X i watch?v=X&t=30,
+        # linki CDN różniące się podpisem) - w kolejce, historii i partiach add_many
+        self.url_key = canonical_url
+        
+        # Ostatnie wyniki w pamięci (history_size), starsze w archiwum na dysku
+        # (zarchiwizowane wpisy znikają z dziennika kolejki)
+        self.completed = DownloadHistory('done', history_size, archive, key=self.url_key,
+                                         on_archived=self._compact_journal)
+        self.failed = DownloadHistory('failed', history_size, archive, key=self.url_key,
+                                      on_archived=self._compact_journal)
+        
+        # Kolejka z limitem równoległych pobrań per host i podziałem slotów między hostami;
+        # pobrane URL-e sprawdzane w historii (pamięć + archiwum)
+        self.queue = DownloadQueue(max_per_host=max_per_host, completed=self.completed, key=self.url_key)
+        
+        # Bezpiecznik per host - elementy niedostępnego hosta czekają w kolejce, jedna sonda
+        # decyduje o wznowieniu; przejścia także jako zdarzenie 'circuit' (host, stary, nowy)
+        self.breakers = HostBreakers()
+        self.breakers.add_listener(self._on_circuit_change)
+        self.queue.host_gate = self.breakers.available
+        
+        # Trwały dziennik stanów elementów - kolejka przetrwa restart (None wyłącza)
+        self.journal = journal
+        self._journal_recovered = False
         self.active_downloads = 0
         self.max_concurrent = max_concurrent
         self.max_file_size = max_file_size  # 500MB default
+        # Ponowienia: polityka (opóźnienie z jitterem) per klasa błędu, None = bez ponawiania
+        self.retry_policies = dict(DEFAULT_POLICIES)
         self.lock = threading.Lock()
+        # Budzi wątki robocze gdy pojawi się element lub zwolni się slot
+        self.work_available = threading.Condition(self.lock)
         self.running = False
         self.callbacks = {}
         
-        # Rate limiting
-        self.download_history = deque(maxlen=100)  # Ostatnie 100 pobrań
-        self.rate_limit_per_minute = 10  # Max 10 pobrań na minutę
-        self.rate_limit_per_hour = 50    # Max 50 pobrań na godzinę
+        # Pula wątków roboczych
+        self.workers = []
+        self._worker_generation = 0
+        self._draining = False
+        
+        # Wspólna pula połączeń HTTP (keep-alive między pobraniami z tego samego hosta)
+        self.http = http or http_pool
+        
+        # Pobieranie segmentowe plików >= segment_threshold (segments=1 wyłącza)
+        self.segmented = SegmentedDownloader(segments=segments, session=self.http.session)
+        self.segment_threshold = segment_threshold
+        self._reserve_buffers()
+        
+        # Ogranicznik przepustowości: globalny -> poziom subskrypcji -> pobieranie
+        self.bandwidth = bandwidth or BandwidthGovernor()
+        self.speed_tier = None  # Poziom 'download_speed' z SubscriptionManager.get_limits()
+        
+        # Skróty liczone w locie podczas pobierania (item['digests'])
+        self.digest_algorithms = DEFAULT_ALGORITHMS
         
-        # Blacklisted domains for security
-        self.blacklisted_domains = [
-            "malicious.com",
-            "phishing-site.net", 
-            "suspicious-downloads.org",
-            "fake-video-host.net"
-        ]
+        # Magazyn treści wg SHA-256 - duplikaty zastępowane dowiązaniami (None wyłącza)
+        self.content_store = content_store
+        # Odcisk wczesny (pierwsze MB + rozmiar) - transfer duplikatu przerywany po prefiksie;
+        # sonda Range końcówki pliku potwierdza dopasowanie
+        self.early_fingerprint = True
+        self.fingerprint_tail_probe = True
+        self.bandwidth_saved = 0
+        self.early_duplicates = 0
         
-        # Video file extensions
-        self.video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv', '.m4v']
+        # Zdarzenia 'progress': najwyżej tyle na sekundę na pobieranie (+ końcowe 100%)
+        self.progress_events_per_second = 4
+        
+        # Punkty kontrolne wznawiania co checkpoint_interval bajtów
+        self.checkpoint_interval = 4 * 1024 * 1024
+        
+        # Silnik pobierania: 'threaded' (domyślny) lub 'asyncio'
+        self.engine = engine
+        self.async_engine = None
+        if engine == 'asyncio':
+            from async_download_engine import AsyncDownloadEngine
+            self.async_engine = AsyncDownloadEngine(self)
+        
+        # Metryki opóźnień (sekundy): oczekiwanie w kolejce i czas do pierwszego bajtu
+        self.queue_wait_times = deque(maxlen=1000)
+        self.first_byte_times = deque(maxlen=1000)
+        
+        # Rate limiting - kubełki tokenów globalnie i per domena
+        # (domyślnie max 10 pobrań na minutę i 50 na godzinę)
+        self.rate_limiter = rate_limiter or RateLimiter(per_minute=10, per_hour=50)
+        
+        # Klasyfikacja URL-i (czarna lista, rozszerzenia, serwisy wideo) - wspólna dla modułów
+        self.classifier = url_classifier
+        
+        # Stan sprzed restartu: historia od razu (deduplikacja add_to_queue), kolejka
+        self._recover_journal()
+    
+    @property
+    def rate_limit_per_minute(self):
+        return self.rate_limiter.global_limits['minute']
+    
+    @rate_limit_per_minute.setter
+    def rate_limit_per_minute(self, value):
+        self.rate_limiter.global_limits['minute'] = value
+    
+    @property
+    def rate_limit_per_hour(self):
+        return self.rate_limiter.global_limits['hour']
+    
+    @rate_limit_per_hour.setter
+    def rate_limit_per_hour(self, value):
+        self.rate_limiter.global_limits['hour'] = value
+    
+    def set_max_concurrent(self, max_concurrent):
+        """Zmień limit równoległych pobrań w trakcie działania"""
+        with self.lock:
+            self.max_concurrent = max_concurrent
+            if self.running and self.engine == 'threaded':
+                # Dołóż wątki do nowego limitu; nadmiarowe czekają (_has_work)
+                for i in range(len(self.workers), max_concurrent):
+                    self._start_worker(i)
+            self.work_available.notify_all()
+        self._reserve_buffers()
+        if self.async_engine is not None:
+            self.async_engine.resize(max_concurrent)
     
-    def check_rate_limit(self):
-        """Sprawdź czy nie przekroczono limitów rate limiting"""
-        current_time = time.time()
+    def _reserve_buffers(self):
+        """Pula buforów odbioru na max_concurrent x segmenty (silnik wątkowy)"""
+        buffer_pool.reserve(self.max_concurrent * max(1, self.segmented.segments))
+    
+    def apply_subscription_limits(self, limits):
+        """Zastosuj limity z SubscriptionManager.get_limits(): równoległość i poziom prędkości"""
+        self.speed_tier = limits.get('download_speed')
+        if limits.get('max_concurrent'):
+            self.set_max_concurrent(limits['max_concurrent'])
+    
+    def attach_subscription(self, subscription):
+        """Powiąż limity z subskrypcją - także po późniejszej zmianie planu"""
+        self.apply_subscription_limits(subscription.get_limits())
+        subscription.add_listener(self.apply_subscription_limits)
+    
+    def configure(self, config):
+        """Zastosuj ustawienia z config.load_config() (sekcje download, http, rate_limit,
+        bandwidth, circuit_breaker) - przy starcie aplikacji, przed start_processing()
         
-        # Sprawdź limit na minutę
-        downloads_last_minute = [
-            t for t in self.download_history 
-            if current_time - t < 60
-        ]
+        Klucze persistent_queue i deduplicate decydują o attach_persistence (main.py).
+        """
+        mb = 1024 * 1024
+        download = config.get('download', {})
         
-        if len(downloads_last_minute) >= self.rate_limit_per_minute:
-            return False, f"Przekroczono limit {self.rate_limit_per_minute} pobrań na minutę"
+        engine = download.get('engine', self.engine)
+        if engine != self.engine:
+            if engine not in self.ENGINES:
+                raise ValueError(f"Nieznany silnik pobierania: {engine} (dostępne: {', '.join(self.ENGINES)})")
+            if self.running:
+                raise RuntimeError("Silnik pobierania można zmienić tylko przed start_processing()")
+            self.engine = engine
+            self.async_engine = None
+            if engine == 'asyncio':
+                from async_download_engine import AsyncDownloadEngine
+                self.async_engine = AsyncDownloadEngine(self)
         
-        # Sprawdź limit na godzinę
-        downloads_last_hour = [
-            t for t in self.download_history 
-            if current_time - t < 3600
-        ]
+        if 'digests' in download:
+            digests = tuple(download['digests'])
+            for name in digests:
+                new_hash(name)  # Nieznany algorytm lub brak xxhash - błąd od razu, nie przy pobieraniu
+            self.digest_algorithms = digests
+        if 'max_file_size_mb' in download:
+            self.max_file_size = download['max_file_size_mb'] * mb
+        if 'max_per_host' in download:
+            self.queue.max_per_host = download['max_per_host']
+        if 'segment_threshold_mb' in download:
+            self.segment_threshold = download['segment_threshold_mb'] * mb
+        if 'checkpoint_interval_mb' in download:
+            self.checkpoint_interval = download['checkpoint_interval_mb'] * mb
+        if 'history_size' in download:
+            # Nadmiar ponad nowy rozmiar trafia do archiwum przy kolejnym wpisie
+            self.completed.maxlen = self.failed.maxlen = download['history_size']
+        self.early_fingerprint = download.get('early_fingerprint', self.early_fingerprint)
+        self.fingerprint_tail_probe = download.get('fingerprint_tail_probe', self.fingerprint_tail_probe)
+        if 'segments' in download:
+            self.segmented.segments = max(1, download['segments'])
+        if 'max_concurrent' in download:
+            self.set_max_concurrent(download['max_concurrent'])  # Rezerwuje też bufory segmentów
+        else:
+            self._reserve_buffers()
         
-        if len(downloads_last_hour) >= self.rate_limit_per_hour:
-            return False, f"Przekroczono limit {self.rate_limit_per_hour} pobrań na godzinę"
+        http = config.get('http')
+        if http:
+            self.http.configure(pool_hosts=http.get('pool_hosts', 32),
+                                pool_maxsize=http.get('pool_maxsize_per_host', 16),
+                                pool_block=http.get('pool_block', False))
         
-        return True, "OK"
+        rate_limit = config.get('rate_limit', {})
+        if 'per_minute' in rate_limit:
+            self.rate_limit_per_minute = rate_limit['per_minute']
+        if 'per_hour' in rate_limit:
+            self.rate_limit_per_hour = rate_limit['per_hour']
+        for domain, limits in (rate_limit.get('per_domain') or {}).items():
+            self.rate_limiter.set_domain_limit(domain, **limits)
+        if rate_limit.get('shared_store'):
+            self.rate_limiter.store = SqliteBucketStore(Path(rate_limit['shared_store']).expanduser())
+        
+        to_rate = lambda value: None if value is None else value * mb
+        bandwidth = config.get('bandwidth', {})
+        if 'global_limit_mb_per_second' in bandwidth:
+            self.bandwidth.set_global_rate(to_rate(bandwidth['global_limit_mb_per_second']))
+        for tier, rate in (bandwidth.get('tiers_mb_per_second') or {}).items():
+            self.bandwidth.set_tier_rate(tier, to_rate(rate))
+        if 'per_download_mb_per_second' in bandwidth:
+            self.bandwidth.set_per_download_rate(to_rate(bandwidth['per_download_mb_per_second']))
+        
+        # Nowe ustawienia obejmują bezpieczniki hostów tworzone od tej chwili
+        self.breakers.breaker_options.update(config.get('circuit_breaker', {}))
+    
+    def progress_tracker(self, url, total_size, initial=0):
+        """Agregator postępu pobierania - emituje zdarzenia 'progress' z prędkością i ETA"""
+        return ProgressTracker(
+            total_size,
+            lambda *event: self.trigger_callback('progress', url, *event),
+            max_events_per_second=self.progress_events_per_second,
+            initial=initial
+        )
     
-    def record_download_attempt(self):
-        """Zapisz próbę pobrania do historii rate limiting"""
-        self.download_history.append(time.time())
+    def _finish_progress(self, url, size):
+        """Końcowe zdarzenie 'progress' (100%) dla pobrania zakończonego bez transferu treści"""
+        self.progress_tracker(url, size, initial=size).finish(size)
+    
+    def check_rate_limit(self, url=None):
+        """Sprawdź czy nie przekroczono limitów rate limiting (bez zużywania limitu)"""
+        return self.rate_limiter.check(url)
+    
+    def record_download_attempt(self, url=None):
+        """Zużyj limit na próbę pobrania. Zwraca (ok, komunikat)."""
+        return self.rate_limiter.acquire(url)
     
     def add_callback(self, event, callback):
-        """Dodaj callback dla wydarzeń (start, progress, complete, error)"""
+        """Dodaj callback dla wydarzeń (start, progress, complete, error, circuit)
+        
+        progress: callback(url, procent, pobrane, rozmiar, prędkość B/s, ETA s)
+        queued_batch: callback(lista URL-i) - elementy dodane przez add_many
+        circuit: callback(host, stary_stan, nowy_stan) - przejście bezpiecznika hosta
+        """
         if event not in self.callbacks:
             self.callbacks[event] = []
         self.callbacks[event].append(callback)
@@ -94,36 +306,22 @@ class DownloadManager:
     def is_valid_url(self, url):
         """Walidacja URL pod kątem bezpieczeństwa"""
         try:
-            result = urlparse(url)
-            
-            # Sprawdź podstawową strukturę
-            if not all([result.scheme, result.netloc]):
-                return False, "Nieprawidłowa struktura URL"
-            
-            # Sprawdź czy to HTTP/HTTPS
-            if result.scheme not in ['http', 'https']:
-                return False, "Obsługiwane są tylko protokoły HTTP/HTTPS"
-            
-            # Sprawdź blacklistę domen
-            for domain in self.blacklisted_domains:
-                if domain in result.netloc.lower():
-                    return False, f"Domena na czarnej liście: {domain}"
-            
-            # Sprawdź czy wygląda na plik wideo
-            url_lower = url.lower()
-            if not any(ext in url_lower for ext in self.video_extensions):
-                # Sprawdź popularne serwisy wideo
-                video_domains = ['youtube.com', 'youtu.be', 'vimeo.com', 'twitch.tv']
-                if not any(domain in url_lower for domain in video_domains):
-                    return False, "URL nie wygląda na link do wideo"
-            
+            verdict = self.classifier.classify(url)
+            if not verdict.is_video:
+                return False, verdict.message
             return True, "OK"
             
         except Exception as e:
             return False, f"Błąd walidacji: {str(e)}"
     
-    def calculate_file_hash(self, file_path):
-        """Oblicz hash pliku dla detekcji duplikatów"""
+    def calculate_file_hash(self, file_path, digests=None):
+        """Oblicz hash pliku dla detekcji duplikatów
+        
+        digests - skróty policzone podczas pobierania (item['digests']); zawarty w nich
+        MD5 zwracany bez ponownego czytania pliku.
+        """
+        if digests and digests.get('md5'):
+            return digests['md5']
         try:
             hash_md5 = hashlib.md5()
             with open(file_path, "rb") as f:
@@ -165,126 +363,436 @@ class DownloadManager:
             return f"video_{timestamp}.mp4"
     
     def check_file_size(self, url):
-        """Sprawdź rozmiar pliku przed pobraniem"""
+        """Sprawdź rozmiar pliku przed pobraniem (osobne żądanie HEAD)
+        
+        Pobieranie nie używa już tej metody - rozmiar jest sprawdzany
+        z nagłówków odpowiedzi GET (check_size) przed odczytem treści.
+        """
         try:
-            response = requests.head(url, allow_redirects=True, timeout=10)
-            file_size = int(response.headers.get('content-length', 0))
-            
-            if file_size > self.max_file_size:
-                size_mb = file_size // (1024 * 1024)
-                max_mb = self.max_file_size // (1024 * 1024)
-                return False, f"Plik zbyt duży ({size_mb}MB > {max_mb}MB)"
-            
-            return True, file_size
+            response = self._get_session().head(url, allow_redirects=True, timeout=10)
+            return self.check_size(int(response.headers.get('content-length', 0)))
             
         except Exception:
             # Jeśli nie można sprawdzić rozmiaru, pozwól na pobieranie
             return True, 0
     
+    def check_size(self, file_size):
+        """Sprawdź znany rozmiar pliku względem limitu max_file_size"""
+        if file_size > self.max_file_size:
+            size_mb = file_size // (1024 * 1024)
+            max_mb = self.max_file_size // (1024 * 1024)
+            return False, f"Plik zbyt duży ({size_mb}MB > {max_mb}MB)"
+        
+        return True, file_size
+    
     def add_to_queue(self, url, download_dir, priority=0):
         """Dodaj URL do kolejki pobierania"""
-        # Sprawdź rate limiting
-        rate_ok, rate_message = self.check_rate_limit()
-        if not rate_ok:
-            self.trigger_callback('error', url, f"Rate limit: {rate_message}")
-            return False
-        
         # Walidacja URL
         is_valid, message = self.is_valid_url(url)
         if not is_valid:
             self.trigger_callback('error', url, f"Nieprawidłowy URL: {message}")
             return False
         
+        # Sprawdź czy URL już jest w kolejce, pobierany lub pobrany - O(1);
+        # klucz deduplikacji liczony raz i zapamiętany w elemencie
+        key = self.url_key(url)
         with self.lock:
-            # Sprawdź czy URL już jest w kolejce
-            for item in self.queue:
-                if item['url'] == url:
-                    return False  # Już w kolejce
-            
-            # Sprawdź czy już został pobrany
-            for item in self.completed:
-                if item['url'] == url:
-                    return False  # Już pobrany
+            if self.queue.contains_key(key):
+                return False
+        
+        # Rate limiting - token zużywany tylko przez faktycznie dodawane URL-e
+        rate_ok, rate_message = self.record_download_attempt(url)
+        if not rate_ok:
+            self.trigger_callback('error', url, f"Rate limit: {rate_message}")
+            return False
+        
+        with self.lock:
+            if self.queue.contains_key(key):
+                return False
             
             download_item = {
                 'url': url,
+                'key': key,
                 'download_dir': Path(download_dir),
                 'priority': priority,
                 'added_time': datetime.now(),
                 'attempts': 0,
-                'max_attempts': 3
+                'max_attempts': 3,
+                'queued_at': time.monotonic()
             }
             
             # Dodaj z zachowaniem priorytetu
-            self.queue.append(download_item)
-            self.queue.sort(key=lambda x: x['priority'], reverse=True)
-            
-            # Zapisz próbę pobrania dla rate limiting
-            self.record_download_attempt()
+            self.queue.push(download_item)
+            self._journal_record(download_item, 'queued')
+            self._notify_work()
             
             self.trigger_callback('queued', url)
             return True
     
+    def add_many(self, urls, download_dir, priority=0):
+        """Dodaj wiele URL-i naraz
+        
+        Walidacja, klucze deduplikacji i hosty liczone raz na URL, poza blokadą;
+        pod blokadą tylko sprawdzenie indeksów gotowymi kluczami i wstawienie do kopców.
+        Jedno zdarzenie 'queued_batch' (lista dodanych URL-i). Zwraca listę
+        (url, przyjęty, powód) w kolejności urls.
+        """
+        download_dir = Path(download_dir)
+        verdicts = [None] * len(urls)
+        candidates = []
+        keys = []
+        hosts = []
+        seen = set()
+        for index, url in enumerate(urls):
+            verdict = self.classifier.classify(url)
+            if not verdict.is_video:
+                verdicts[index] = (False, f"Nieprawidłowy URL: {verdict.message}")
+                continue
+            key = self.url_key(url)
+            if key in seen:
+                verdicts[index] = (False, "Duplikat w tej partii")
+                continue
+            seen.add(key)
+            candidates.append(index)
+            keys.append(key)
+            hosts.append(verdict.host)
+        
+        # Tokeny limitu tylko dla nowych URL-i - wstępne sprawdzenie gotowych kluczy w indeksach
+        with self.lock:
+            fresh = []
+            for index, key, host in zip(candidates, keys, hosts):
+                if self.queue.contains_key(key):
+                    verdicts[index] = (False, "Już w kolejce lub pobrany")
+                else:
+                    fresh.append((index, key, host))
+        
+        limits = self.rate_limiter.acquire_many([urls[index] for index, _, _ in fresh])
+        added_time = datetime.now()
+        queued_at = time.monotonic()
+        batch, batch_indexes, batch_keys, batch_hosts = [], [], [], []
+        for (index, key, host), (rate_ok, rate_message) in zip(fresh, limits):
+            if not rate_ok:
+                verdicts[index] = (False, f"Rate limit: {rate_message}")
+                continue
+            batch.append({
+                'url': urls[index],
+                'download_dir': download_dir,
+                'priority': priority,
+                'added_time': added_time,
+                'attempts': 0,
+                'max_attempts': 3,
+                'queued_at': queued_at
+            })
+            batch_indexes.append(index)
+            batch_keys.append(key)
+            batch_hosts.append(host)
+        
+        with self.lock:
+            added = self.queue.push_many(batch, batch_keys, batch_hosts)
+            if added:
+                if self.journal is not None:
+                    self.journal.record_many(added)
+                self.work_available.notify_all()
+                if self.async_engine is not None:
+                    self.async_engine.wake()
+        
+        accepted = {id(item) for item in added}
+        rejected = []
+        for index, item in zip(batch_indexes, batch):
+            if id(item) in accepted:
+                verdicts[index] = (True, "OK")
+            else:
+                verdicts[index] = (False, "Już w kolejce lub pobrany")
+                rejected.append(item['url'])
+        if rejected:
+            # Dodane przez inny wątek między sprawdzeniem a wstawieniem - token wraca
+            self.rate_limiter.release_many(rejected)
+        
+        if added:
+            self.trigger_callback('queued_batch', [item['url'] for item in added])
+        return [(url, ok, reason) for url, (ok, reason) in zip(urls, verdicts)]
+    
     def start_processing(self):
-        """Uruchom przetwarzanie kolejki"""
-        if self.running:
+        """Uruchom przetwarzanie kolejki (pula max_concurrent wątków lub silnik asyncio)"""
+        with self.work_available:
+            if self.running:
+                return
+            
+            self.running = True
+            self._draining = False
+            self._recover_journal()
+            
+            if self.async_engine is None:
+                self._worker_generation += 1
+                self.workers = []
+                for i in range(self.max_concurrent):
+                    self._start_worker(i)
+        
+        if self.async_engine is not None:
+            self.async_engine.start()
+        
+        print(f"📥 Uruchomiono menedżer pobierania ({self.engine}, max {self.max_concurrent} równoległych)")
+    
+    def _recover_journal(self):
+        """Przywróć historię i elementy nieukończone przed restartem (wywoływać pod self.lock)"""
+        if self.journal is None or self._journal_recovered:
             return
+        self._journal_recovered = True
+        # Wiersze done/failed bez archiwizacji - ostatnie wyniki (starsze są w archiwum)
+        for item, state in self.journal.finished():
+            (self.completed if state == 'done' else self.failed).append(item)
+        recovered = 0
+        for item in self.journal.recover():
+            item['queued_at'] = time.monotonic()
+            if self.queue.push(item):
+                recovered += 1
+        if recovered:
+            print(f"♻️ Przywrócono {recovered} elementów kolejki z dziennika")
+    
+    def attach_persistence(self, journal=None, archive=None, content_store=None):
+        """Włącz trwały stan: dziennik kolejki, archiwum historii, magazyn treści
         
-        self.running = True
-        threading.Thread(target=self._process_queue, daemon=True).start()
-        print(f"📥 Uruchomiono menedżer pobierania (max {self.max_concurrent} równoległych)")
+        Wywoływać przy starcie aplikacji, przed start_processing - historia i nieukończone
+        elementy z dziennika wracają od razu.
+        """
+        with self.lock:
+            if archive is not None:
+                self.completed.archive = archive
+                self.failed.archive = archive
+            if content_store is not None:
+                self.content_store = content_store
+            if journal is not None:
+                self.journal = journal
+                self._journal_recovered = False
+                self._recover_journal()
     
-    def stop_processing(self):
-        """Zatrzymaj przetwarzanie kolejki"""
-        self.running = False
+    def _journal_record(self, item, state):
+        if self.journal is not None:
+            self.journal.record(item, state)
+    
+    def _compact_journal(self, item):
+        """Wpis przeniesiony do archiwum historii - wiersz done/failed niepotrzebny w dzienniku"""
+        if self.journal is not None:
+            self.journal.compact([item['url']])
+    
+    def _start_worker(self, index):
+        """Uruchom wątek roboczy bieżącej generacji (wywoływać pod self.lock)"""
+        worker = threading.Thread(
+            target=self._worker_loop,
+            args=(self._worker_generation,),
+            name=f"download-worker-{index}",
+            daemon=True
+        )
+        self.workers.append(worker)
+        worker.start()
+    
+    def stop_processing(self, drain=False, timeout=5.0):
+        """Zatrzymaj przetwarzanie kolejki
+        
+        drain=True - dokończ wszystkie elementy z kolejki przed zatrzymaniem,
+        drain=False - przerwij trwające pobierania i zostaw kolejkę.
+        Zwraca True, jeśli wszystkie wątki robocze zakończyły się w czasie timeout.
+        """
+        if self.async_engine is not None:
+            stopped = self.async_engine.stop(drain=drain, timeout=timeout)
+            with self.work_available:
+                self.running = False
+            self._flush_persistence()
+            print("⏹️ Zatrzymano menedżer pobierania")
+            return stopped
+        
+        with self.work_available:
+            if drain and self.running:
+                self._draining = True
+            else:
+                self.running = False
+            self.work_available.notify_all()
+            workers = list(self.workers)
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in workers:
+            if worker is threading.current_thread():
+                continue
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            worker.join(remaining)
+        
+        stopped = not any(worker.is_alive() for worker in workers)
+        with self.work_available:
+            self.running = False
+            self._draining = False
+            if stopped:
+                self.workers = []
+            self.work_available.notify_all()
+        
+        self._flush_persistence()
         print("⏹️ Zatrzymano menedżer pobierania")
+        return stopped
+    
+    def _flush_persistence(self):
+        """Zatwierdź zbuforowane zapisy dziennika i archiwum historii (poza self.lock)"""
+        if self.journal is not None:
+            self.journal.flush()
+        for history in (self.completed, self.failed):
+            if history.archive is not None:
+                history.archive.flush()
+    
+    def _has_work(self):
+        """Czy jest element do uruchomienia i wolny slot (wywoływać pod self.lock)"""
+        return self.active_downloads < self.max_concurrent and self.queue.has_ready()
     
-    def _process_queue(self):
-        """Główna pętla przetwarzania kolejki"""
-        while self.running:
-            with self.lock:
-                if (self.active_downloads < self.max_concurrent and 
-                    self.queue and 
-                    self.running):
+    def _get_session(self):
+        """Wspólna sesja HTTP z pulą połączeń"""
+        return self.http.session
+    
+    def _worker_loop(self, generation):
+        """Pętla wątku roboczego - śpi aż do zdarzenia, pobiera elementy po kolei"""
+        try:
+            while True:
+                with self.work_available:
+                    while (self.running and
+                           generation == self._worker_generation and
+                           not self._has_work()):
+                        if self._draining and not self.queue:
+                            return
+                        # Odłożone ponowienia i sondy bezpieczników - obudź się na najbliższy termin
+                        self.work_available.wait(self._next_wakeup())
                     
-                    item = self.queue.pop(0)
-                    self.active_downloads += 1
+                    if not self.running or generation != self._worker_generation:
+                        return
                     
-                    # Uruchom pobieranie w osobnym wątku
-                    threading.Thread(
-                        target=self._download_file_worker,
-                        args=(item,),
-                        daemon=True
-                    ).start()
-            
-            time.sleep(0.5)  # Sprawdzaj co 0.5 sekundy
+                    item = self._take_next()
+                
+                self._download_file_worker(item)
+        finally:
+            with self.work_available:
+                # Pozwól pozostałym wątkom zauważyć koniec drenowania
+                self.work_available.notify_all()
+    
+    def _take_next(self):
+        """Zdejmij następny element z kolejki jako aktywny (wywoływać pod self.lock)"""
+        item = self.queue.pop()
+        self.active_downloads += 1
+        self._record_queue_wait(item)
+        self._journal_record(item, 'active')
+        if self.breakers.dispatch(host_of(item['url'])):
+            item['breaker_probe'] = True
+        return item
+    
+    def _next_wakeup(self):
+        """Sekundy do najbliższego ponowienia lub sondy bezpiecznika (None - brak terminów)
+        
+        Wywoływać pod self.lock. Przy zajętych slotach terminy nic nie zmienią -
+        wątki budzi zwolnienie slotu.
+        """
+        if self.active_downloads >= self.max_concurrent:
+            return None
+        delays = [d for d in (self.queue.retry_delay(), self.breakers.retry_in(self.queue.queued_hosts()))
+                  if d is not None]
+        return min(delays) if delays else None
+    
+    def _record_queue_wait(self, item):
+        """Zapisz czas oczekiwania elementu w kolejce"""
+        item['dispatched_at'] = time.monotonic()
+        queued_at = item.get('queued_at')
+        if queued_at is not None:
+            self.queue_wait_times.append(item['dispatched_at'] - queued_at)
+    
+    def _record_first_byte(self, item):
+        """Zapisz czas od zakolejkowania do otrzymania odpowiedzi serwera"""
+        queued_at = item.get('queued_at')
+        if queued_at is not None:
+            self.first_byte_times.append(time.monotonic() - queued_at)
     
     def _download_file_worker(self, item):
         """Worker do pobierania pojedynczego pliku"""
         try:
             success = self._download_file(item)
+            if success:
+                self._store_content(item)
+            self._finish_download(item, success)
+        except DownloadInterrupted:
+            self._requeue_interrupted(item)
+        except Exception as e:
+            self._fail_download(item, e)
+    
+    def _finish_download(self, item, success):
+        """Rozlicz zakończone pobieranie: ukończone, ponowienie lub porażka"""
+        with self.lock:
+            self.active_downloads -= 1
+            self._notify_slot_freed()
             
-            with self.lock:
-                self.active_downloads -= 1
-                
-                if success:
-                    self.completed.append(item)
-                    self.trigger_callback('complete', item['url'], item.get('file_path'))
+            # Błędy po stronie hosta (bez 404, integralności itp.) liczą się do bezpiecznika
+            host_failure = not success and item.get('error_class', 'other') in HOST_ERRORS
+            self.breakers.record(host_of(item['url']), not host_failure, item.pop('breaker_probe', False))
+            
+            if success:
+                self.queue.mark_completed(item)
+                # Najpierw dziennik - append może od razu zarchiwizować wpis (history_size=0)
+                self._journal_record(item, 'done')
+                self.completed.append(item)
+                self.trigger_callback('complete', item['url'], item.get('file_path'))
+            else:
+                item['attempts'] += 1
+                error_class = item.pop('error_class', 'other')
+                policy = self.retry_policies.get(error_class)
+                retry_after = item.pop('retry_after', None)
+                if policy is not None and item['attempts'] < item['max_attempts']:
+                    # Ponów po opóźnieniu - element nie zajmuje slotu do terminu
+                    delay = policy.delay(item['attempts'], retry_after)
+                    item['queued_at'] = time.monotonic() + delay
+                    self.queue.defer(item, delay)
+                    self._journal_record(item, 'backoff')
+                    # Wątki śpiące bez limitu czasu muszą poznać nowy termin
+                    self.work_available.notify()
+                    print(f"🔄 Ponawiam próbę ({item['attempts']}/{item['max_attempts']}) "
+                          f"za {delay:.1f}s: {item['url']}")
                 else:
-                    item['attempts'] += 1
-                    if item['attempts'] < item['max_attempts']:
-                        # Ponów próbę
-                        self.queue.append(item)
-                        print(f"🔄 Ponawiam próbę ({item['attempts']}/{item['max_attempts']}): {item['url']}")
+                    self.queue.mark_failed(item)
+                    self._journal_record(item, 'failed')
+                    self.failed.append(item)
+                    if policy is None:
+                        message = f"Błąd bez ponawiania ({error_class})"
                     else:
-                        self.failed.append(item)
-                        self.trigger_callback('error', item['url'], "Przekroczono maksymalną liczbę prób")
-                        
-        except Exception as e:
-            with self.lock:
-                self.active_downloads -= 1
-                self.failed.append(item)
-            self.trigger_callback('error', item['url'], str(e))
+                        message = "Przekroczono maksymalną liczbę prób"
+                    self.trigger_callback('error', item['url'], message)
+    
+    def _requeue_interrupted(self, item):
+        """Przerwany przez stop_processing(drain=False) - z powrotem do kolejki bez zużycia próby
+        (.part zostaje - następne uruchomienie wznowi)"""
+        with self.lock:
+            self.active_downloads -= 1
+            self._notify_slot_freed()
+            item['queued_at'] = time.monotonic()
+            self.queue.requeue(item)
+            self.breakers.release(host_of(item['url']), item.pop('breaker_probe', False))
+            self._journal_record(item, 'queued')
+    
+    def _fail_download(self, item, error):
+        """Rozlicz pobieranie przerwane nieoczekiwanym wyjątkiem"""
+        with self.lock:
+            self.active_downloads -= 1
+            self._notify_slot_freed()
+            self.queue.mark_failed(item)
+            self.breakers.release(host_of(item['url']), item.pop('breaker_probe', False))
+            item['error'] = str(error)
+            self._journal_record(item, 'failed')
+            self.failed.append(item)
+        self.trigger_callback('error', item['url'], str(error))
+    
+    def _notify_work(self):
+        """Obudź wątek roboczy po dodaniu elementu (wywoływać pod self.lock)"""
+        self.work_available.notify()
+        if self.async_engine is not None:
+            self.async_engine.wake()
+    
+    def _notify_slot_freed(self):
+        """Obudź wątki robocze po zwolnieniu slotu (wywoływać pod self.lock)"""
+        if self._draining:
+            self.work_available.notify_all()
+        else:
+            self.work_available.notify()
+        if self.async_engine is not None:
+            self.async_engine.wake()
     
     def _download_file(self, item):
         """Pobierz pojedynczy plik"""
@@ -294,16 +802,14 @@ class DownloadManager:
         try:
             self.trigger_callback('start', url)
             
-            # Sprawdź rozmiar pliku
-            size_ok, file_size = self.check_file_size(url)
-            if not size_ok:
-                self.trigger_callback('error', url, file_size)
-                return False
-            
-            # Przygotuj ścieżkę pliku
-            filename = self.get_filename_from_url(url)
+            # Przygotuj ścieżkę pliku (stała między próbami - potrzebna do wznowienia)
+            if item.get('target_path'):
+                file_path = Path(item['target_path'])
+            else:
+                file_path = download_dir / self.get_filename_from_url(url)
+                item['target_path'] = str(file_path)
+            filename = file_path.name
             download_dir.mkdir(exist_ok=True, parents=True)
-            file_path = download_dir / filename
             
             # Sprawdź duplikaty
             if file_path.exists():
@@ -311,49 +817,183 @@ class DownloadManager:
                 if existing_size > 0:
                     print(f"📄 Plik już istnieje: {filename}")
                     item['file_path'] = str(file_path)
+                    self._finish_progress(url, existing_size)
                     return True
             
+            # Stan poprzedniej, przerwanej próby (plik .part)
+            partial = PartialDownload(file_path, url, checkpoint_interval=self.checkpoint_interval)
+            partial.load()
+            
+            # Jedno żądanie GET - rozmiar sprawdzany z nagłówków przed odczytem treści
+            response = self._get_session().get(url, headers=partial.resume_headers(),
+                                               stream=True, timeout=30)
+            self._record_first_byte(item)
+            
+            if response.status_code == 416 and partial.bytes_received:
+                response.close()
+                if partial.complete_on_416(response.headers.get('content-range')):
+                    # Plik .part był kompletny - przerwano tuż przed zmianą nazwy
+                    total_size = partial.bytes_received
+                    digest = StreamingDigest(self.digest_algorithms)
+                    digest.update_from_file(partial.part_path, 0, total_size)
+                    self._record_digests(item, digest, partial)
+                    partial.finalize()
+                    item['file_path'] = str(file_path)
+                    self._finish_progress(url, total_size)
+                    return True
+                # .part nie pasuje do zasobu (np. plik na serwerze jest krótszy) - od zera
+                print(f"🗑️ Porzucono niepasujący plik .part: {filename}")
+                partial.discard()
+                response = self._get_session().get(url, stream=True, timeout=30)
+            
+            response.raise_for_status()
+            
+            # 206 od zapisanego offsetu - kontynuuj; 200 - zasób zmieniony, od zera
+            offset = partial.bytes_received if partial.response_resumes(response) else 0
+            if offset:
+                print(f"⏯️ Wznawianie od {offset//1024//1024}MB: {filename}")
+            
+            content_length = int(response.headers.get('content-length', 0))
+            total_size = offset + content_length if content_length else 0
+            
+            # Sprawdź rozmiar pliku
+            size_ok, size_message = self.check_size(total_size)
+            if not size_ok:
+                response.close()
+                partial.discard()
+                item['error_class'] = 'rejected'
+                self.trigger_callback('error', url, size_message)
+                return False
+            
+            # Duże pliki - równoległe segmenty, jeśli serwer obsługuje Range
+            if not item.get('single_stream') and self._can_segment(response, total_size):
+                response.close()
+                range_info = {
+                    'total_size': total_size,
+                    'etag': response.headers.get('etag'),
+                    'last_modified': response.headers.get('last-modified'),
+                    'digests': parse_digest_headers(response.headers,
+                                                    full_body=response.status_code == 200)
+                }
+                try:
+                    return self._download_segmented(item, partial, range_info)
+                except RangeNotSupportedError:
+                    # Accept-Ranges bez pokrycia (200 z pełną treścią na zakres) - ten element
+                    # jednym strumieniem, od zera
+                    print(f"↩️ Serwer nie obsługuje zakresów - pobieranie jednym strumieniem: {filename}")
+                    partial.discard()
+                    item['single_stream'] = True
+                    return self._download_file(item)
+            
             # Pobieranie
             print(f"⬇️ Pobieranie: {filename}")
             
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
+            partial.set_validators(total_size, response.headers.get('etag'),
+                                   response.headers.get('last-modified'))
+            downloaded = offset
+            interrupted = False
+            too_large = False
+            duplicate_of = None
+            fingerprint = self._early_fingerprint(total_size, offset)
+            transfer = self.bandwidth.open(self.speed_tier)
+            tracker = self.progress_tracker(url, total_size, initial=offset)
+            # Content-MD5 dotyczy treści tej odpowiedzi - tylko przy pełnym pliku
+            digest = StreamingDigest(self.digest_algorithms,
+                                     parse_digest_headers(response.headers, full_body=offset == 0))
+            
+            # Prealokacja .part (brak miejsca - błąd przed odczytem treści), zapis pod offsetami.
+            # Odczyt prosto do buforów z puli (readinto), fragmenty od 64 KB do 4 MB.
+            try:
+                writer = partial.open(offset, total_size)
+            except InsufficientSpaceError:
+                response.close()
+                raise
+            
+            with writer, closing(iter_into(response)) as chunks:
+                if offset:
+                    # Część z poprzedniej próby - doliczana raz, z dysku
+                    digest.update_from_file(partial.part_path, 0, offset)
+                    if fingerprint is not None:
+                        fingerprint.update_from_file(partial.part_path, offset)
+                try:
+                    for chunk in chunks:
+                        if not self.running:
+                            interrupted = True  # Zatrzymano menedżer - przerwij transfer
+                            break
+                        if chunk:
+                            transfer.throttle(len(chunk))
+                            writer.write_at(downloaded, chunk)
+                            digest.update(chunk)
+                            downloaded += len(chunk)
+                            
+                            if fingerprint is not None and fingerprint.update(chunk):
+                                duplicate_of = self._match_fingerprint(url, fingerprint)
+                                fingerprint = None
+                                if duplicate_of:
+                                    break  # Ta treść już jest w bibliotece - reszta zbędna
+                            
+                            # Sprawdź limit rozmiaru podczas pobierania
+                            if downloaded > self.max_file_size:
+                                too_large = True
+                                break
+                            
+                            partial.checkpoint(writer, downloaded)
+                            tracker.update(downloaded)
+                finally:
+                    transfer.close()
+                    # Utrwal postęp także przy błędzie sieci - następna próba wznowi
+                    if not too_large and not duplicate_of:
+                        partial.checkpoint(writer, downloaded, force=True)
+            
+            if too_large:
+                response.close()
+                partial.discard()  # Usuń niepełny plik
+                raise FileTooLargeError(f"Plik przekroczył limit {self.max_file_size//1024//1024}MB")
+            
+            if interrupted:
+                response.close()
+                raise DownloadInterrupted("Pobieranie przerwane przez zatrzymanie menedżera")
             
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk and self.running:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # Sprawdź limit rozmiaru podczas pobierania
-                        if downloaded > self.max_file_size:
-                            f.close()
-                            file_path.unlink()  # Usuń niepełny plik
-                            raise Exception(f"Plik przekroczył limit {self.max_file_size//1024//1024}MB")
-                        
-                        # Callback postępu
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            self.trigger_callback('progress', url, progress, downloaded, total_size)
-            
-            # Sprawdź integralność pobranego pliku
+            if duplicate_of:
+                response.close()
+                partial.discard()
+                self._resolve_duplicate(item, file_path, duplicate_of, total_size, downloaded)
+                tracker.finish(total_size)
+                return True
+            
+            # Sprawdź integralność pobranego pliku (.part zostaje do wznowienia)
             if total_size > 0 and downloaded != total_size:
-                file_path.unlink()
                 raise Exception("Pobrano niepełny plik")
             
+            self._record_digests(item, digest, partial)
+            partial.finalize()
+            tracker.finish(downloaded)
             item['file_path'] = str(file_path)
             print(f"✅ Pobrano: {filename} ({downloaded//1024//1024}MB)")
             return True
             
+        except (InsufficientSpaceError, DownloadInterrupted):
+            # Brak miejsca - bez ponawiania, element trafia od razu do nieudanych;
+            # zatrzymanie menedżera - element wraca do kolejki (_download_file_worker)
+            raise
+            
+        except FileTooLargeError as e:
+            self._record_error(item, e)  # 'rejected' - bez ponawiania
+            self.trigger_callback('error', url, str(e))
+            return False
+            
+        except DigestMismatchError as e:
+            self._record_error(item, e)
+            self.trigger_callback('error', url, f"Błąd integralności: {e}")
+            return False
+            
         except requests.exceptions.RequestException as e:
+            self._record_error(item, e)
             error_messages = {
                 requests.exceptions.ConnectionError: "Błąd połączenia",
                 requests.exceptions.Timeout: "Przekroczono czas oczekiwania", 
                 requests.exceptions.TooManyRedirects: "Zbyt wiele przekierowań",
-                requests.exceptions.HTTPError: f"Błąd HTTP: {e.response.status_code if hasattr(e, 'response') else 'unknown'}"
+                requests.exceptions.HTTPError: f"Błąd HTTP: {getattr(e.response, 'status_code', 'unknown')}"
             }
             
             error_msg = error_messages.get(type(e), f"Błąd sieci: {str(e)}")
@@ -361,63 +1001,255 @@ class DownloadManager:
             return False
             
         except Exception as e:
+            self._record_error(item, e)
             self.trigger_callback('error', url, f"Nieoczekiwany błąd: {str(e)[:100]}")
             return False
     
+    def _record_error(self, item, error):
+        """Zapisz klasę błędu próby (wybór polityki ponawiania w _finish_download)"""
+        item['error_class'], item['retry_after'] = classify_error(error)
+    
+    def _can_segment(self, response, total_size):
+        """Czy przełączyć się na pobieranie segmentowe (duży plik, serwer obsługuje Range)"""
+        if self.segmented.segments <= 1 or total_size < self.segment_threshold:
+            return False
+        return (response.status_code == 206 or
+                response.headers.get('accept-ranges', '').lower() == 'bytes')
+    
+    def _download_segmented(self, item, partial, range_info):
+        """Pobierz plik równoległymi segmentami HTTP Range (z wznawianiem)"""
+        url = item['url']
+        file_path = partial.file_path
+        total_size = range_info['total_size']
+        if total_size > self.max_file_size:
+            raise FileTooLargeError(f"Plik przekroczył limit {self.max_file_size//1024//1024}MB")
+        
+        # Wznów od zapisanych zakresów, jeśli zasób się nie zmienił
+        ranges = None
+        if partial.bytes_received and partial.matches(range_info['etag'], range_info['last_modified'],
+                                                      total_size):
+            ranges = partial.state.get('segments') or [(partial.bytes_received, total_size - 1)]
+            print(f"⏯️ Wznawianie od {partial.bytes_received//1024//1024}MB: {file_path.name}")
+        else:
+            partial.reset()
+        
+        partial.set_validators(total_size, range_info['etag'], range_info['last_modified'])
+        validator = partial.validator()
+        headers = {'If-Range': validator} if validator else None
+        
+        print(f"⬇️ Pobieranie segmentowe ({self.segmented.segments}x): {file_path.name}")
+        self._record_first_byte(item)
+        
+        tracker = self.progress_tracker(url, total_size, initial=partial.bytes_received)
+        
+        transfer = self.bandwidth.open(self.speed_tier)
+        try:
+            downloaded = self.segmented.download(url, partial.part_path, total_size, progress=lambda downloaded, total: tracker.update(downloaded),
+                                                 should_continue=lambda: self.running, ranges=ranges,
+                                                 checkpoint=partial.checkpoint_segments, headers=headers,
+                                                 throttle=transfer.throttle)
+        finally:
+            transfer.close()
+        
+        # Wyjątek od skrótów w locie: MD5/SHA-256 wymagają bajtów w kolejności pliku, a segmenty
+        # przychodzą równolegle i poza kolejnością (skrótów zakresów nie da się złożyć w skrót
+        # całości). Dlatego tu jeden przebieg po złożonym .part - zaraz po zapisie, z pamięci
+        # podręcznej systemu. Pobieranie jednym strumieniem (segments=1) liczy skrót w locie.
+        digest = StreamingDigest(self.digest_algorithms, range_info.get('digests'))
+        digest.update_from_file(partial.part_path, 0, total_size)
+        self._record_digests(item, digest, partial)
+        partial.finalize()
+        tracker.finish(downloaded)
+        
+        item['file_path'] = str(file_path)
+        print(f"✅ Pobrano: {file_path.name} ({downloaded//1024//1024}MB)")
+        return True
+    
+    def _record_digests(self, item, digest, partial):
+        """Zweryfikuj skróty z nagłówkami serwera i zapisz je w elemencie"""
+        try:
+            item['digest_verified'] = digest.verify()
+        except DigestMismatchError:
+            partial.discard()  # Uszkodzone dane - następna próba od zera
+            raise
+        item['digests'] = digest.hexdigests()
+    
+    def _early_fingerprint(self, total_size, offset=0):
+        """Odcisk wczesny dla transferu - tylko znany rozmiar większy od prefiksu"""
+        store = self.content_store
+        if (store is None or not self.early_fingerprint or
+                total_size <= store.prefix_size or offset >= store.prefix_size):
+            return None
+        return EarlyFingerprint(total_size, store.prefix_size)
+    
+    def _match_fingerprint(self, url, fingerprint):
+        """sha256 znanej treści o tym samym odcisku (potwierdzonej sondą końcówki) lub None"""
+        candidate = self.content_store.match_fingerprint(fingerprint.total_size, fingerprint.hexdigest())
+        if candidate is None:
+            return None
+        tail, sha256 = candidate
+        if not self.fingerprint_tail_probe:
+            return sha256
+        
+        # Ostatnie bajty pliku osobnym żądaniem Range - bez nich prefiks nie wystarcza
+        # Strumieniowo i z limitem - serwer ignorujący Range nie wyśle nam całego pliku
+        tail_size = min(self.content_store.tail_size, fingerprint.total_size)
+        start = fingerprint.total_size - tail_size
+        try:
+            probe = self._get_session().get(url, headers={'Range': f"bytes={start}-"},
+                                            stream=True, timeout=30)
+            with probe:
+                if (probe.status_code != 206 or
+                        not probe.headers.get('content-range', '').startswith(f"bytes {start}-")):
+                    return None
+                digest = hashlib.sha256()
+                received = 0
+                for chunk in probe.iter_content(64 * 1024):
+                    received += len(chunk)
+                    if received > tail_size:
+                        return None
+                    digest.update(chunk)
+        except requests.exceptions.RequestException:
+            return None
+        if received != tail_size or digest.hexdigest() != tail:
+            return None
+        return sha256
+    
+    def _resolve_duplicate(self, item, file_path, sha256, total_size, downloaded):
+        """Zakończ przerwany duplikat: plik docelowy jako dowiązanie do istniejącej kopii"""
+        method = self.content_store.link_existing(sha256, file_path)
+        if method is None:
+            raise Exception("Treść duplikatu zniknęła z biblioteki")
+        with self.lock:
+            self.early_duplicates += 1
+            self.bandwidth_saved += max(0, total_size - downloaded)
+        item['file_path'] = str(file_path)
+        item['deduplicated'] = True
+        item['digests'] = {'sha256': sha256}
+        print(f"🔗 Duplikat rozpoznany po {downloaded//1024//1024}MB ({method}): {file_path.name}")
+    
+    def _store_content(self, item):
+        """Dodaj pobrany plik do magazynu treści; duplikat staje się dowiązaniem"""
+        sha256 = item.get('digests', {}).get('sha256')
+        if not sha256 or not item.get('file_path') or item.get('deduplicated'):
+            return
+        item['deduplicated'] = self.store_file(item['file_path'], sha256)
+    
+    def store_file(self, file_path, sha256, size=None):
+        """Dodaj plik pobrany poza kolejką (np. pobieranie z GUI) do magazynu treści
+        
+        Ta sama treść w innym katalogu staje się dowiązaniem do jednej kopii.
+        Zwraca True gdy plik okazał się duplikatem.
+        """
+        if self.content_store is None:
+            return False
+        try:
+            result = self.content_store.ingest(file_path, sha256, size)
+        except OSError as e:
+            # Deduplikacja to tylko oszczędność miejsca - pobrany plik zostaje bez zmian
+            print(f"⚠️ Deduplikacja nieudana: {e}")
+            return False
+        if result['deduplicated']:
+            print(f"🔗 Duplikat treści ({result['method']}): {Path(file_path).name} "
+                  f"- zaoszczędzono {result['saved']//1024//1024}MB")
+        return result['deduplicated']
+    
     def get_queue_status(self):
         """Pobierz status kolejki"""
+        storage = self.content_store.get_stats() if self.content_store is not None else {}
         with self.lock:
             return {
                 'queue_size': len(self.queue),
                 'active_downloads': self.active_downloads,
-                'completed': len(self.completed),
-                'failed': len(self.failed),
-                'running': self.running
+                'completed': self.completed.total,
+                'failed': self.failed.total,
+                'running': self.running,
+                'hosts': self.queue.host_stats(),
+                'storage_saved': storage.get('bytes_saved', 0),
+                'bandwidth_saved': self.bandwidth_saved,
+                'early_duplicates': self.early_duplicates,
+                'deduplicated_files': storage.get('files_deduplicated', 0)
             }
     
-    def get_rate_limit_status(self):
-        """Pobierz status rate limiting"""
-        current_time = time.time()
-        
-        downloads_last_minute = len([
-            t for t in self.download_history 
-            if current_time - t < 60
-        ])
-        
-        downloads_last_hour = len([
-            t for t in self.download_history 
-            if current_time - t < 3600
-        ])
+    def _on_circuit_change(self, host, old, new):
+        """Przejście bezpiecznika (wywoływane pod self.lock) - zamknięty host może mieć wiele elementów"""
+        if new == 'closed':
+            self.work_available.notify_all()
+            if self.async_engine is not None:
+                self.async_engine.wake()
+        self.trigger_callback('circuit', host, old, new)
+    
+    def get_circuit_status(self):
+        """Stan bezpieczników per host i ostatnie przejścia"""
+        return self.breakers.get_status()
+    
+    def get_connection_stats(self):
+        """Pobierz statystyki ponownego użycia połączeń HTTP"""
+        return self.http.get_stats()
+    
+    def get_rate_limit_status(self, url=None):
+        """Pobierz status rate limiting (globalny i - dla url - jego domeny)"""
+        buckets = self.rate_limiter.status(url)
         
         return {
-            'last_minute': downloads_last_minute,
-            'last_hour': downloads_last_hour,
+            'last_minute': buckets.get('global:minute', {}).get('used', 0),
+            'last_hour': buckets.get('global:hour', {}).get('used', 0),
             'limit_per_minute': self.rate_limit_per_minute,
             'limit_per_hour': self.rate_limit_per_hour,
-            'total_history': len(self.download_history)
+            'total_history': self.rate_limiter.total_attempts,
+            'buckets': buckets
         }
     
+    def get_latency_stats(self):
+        """Pobierz statystyki opóźnień kolejki (w sekundach)"""
+        def summarize(samples):
+            values = sorted(samples)
+            if not values:
+                return {'count': 0, 'avg': 0, 'p50': 0, 'p95': 0, 'max': 0}
+            return {
+                'count': len(values),
+                'avg': sum(values) / len(values),
+                'p50': values[len(values) // 2],
+                'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                'max': values[-1]
+            }
+        
+        with self.lock:
+            return {
+                'queue_wait': summarize(self.queue_wait_times),
+                'time_to_first_byte': summarize(self.first_byte_times)
+            }
+    
     def clear_completed(self):
         """Wyczyść listę ukończonych pobierań"""
         with self.lock:
-            self.completed.clear()
+            urls = self.completed.clear()
+            if self.journal is not None:
+                self.journal.forget(urls)
     
     def clear_failed(self):
         """Wyczyść listę nieudanych pobierań"""
         with self.lock:
-            self.failed.clear()
+            urls = self.failed.clear()
+            if self.journal is not None:
+                self.journal.forget(urls)
     
     def retry_failed(self):
         """Ponów pobieranie nieudanych plików"""
         with self.lock:
-            for item in self.failed[:]:
+            retried = 0
+            for item in self.failed.take_all():
                 item['attempts'] = 0
-                self.queue.append(item)
-                self.failed.remove(item)
-            
-            self.queue.sort(key=lambda x: x['priority'], reverse=True)
+                item['queued_at'] = time.monotonic()
+                if self.queue.push(item):
+                    self._journal_record(item, 'queued')
+                    retried += 1
+            self.work_available.notify_all()
+            if self.async_engine is not None:
+                self.async_engine.wake()
         
-        print(f"🔄 Dodano {len(self.failed)} nieudanych pobierań z powrotem do kolejki")
+        print(f"🔄 Dodano {retried} nieudanych pobierań z powrotem do kolejki")
 
-# Singleton instance
-download_manager = DownloadManager()
+# Singleton instance - bez trwałego stanu (import nie otwiera plików w katalogu domowym);
+# aplikacja włącza go przy starcie: download_manager.attach_persistence(...) (main.py)
+download_manager = DownloadManager(max_per_host=2)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Kolejka pobierania oparta na kopcach per host
+- Każdy host ma własny kopiec kluczowany parą (priorytet, numer sekwencyjny FIFO)
+- Indeksy haszujące URL-i w kolejce, aktywnych i ukończonych (kluczem może być
+  kanoniczna postać URL-a - warianty tego samego filmu to jeden element)
+- Wstawianie i pobieranie w O(log n), duplikaty w O(1)
+- Limit równoległych pobrań na host i sprawiedliwy podział między hostami:
+  najpierw priorytet, przy równym - host z najmniejszym ważonym udziałem
+- Czoła kopców hostów we wspólnym kopcu (priorytet, udział, FIFO) - wybór bez
+  przeglądania hostów; hosty z wyczerpanym limitem lub zamkniętą bramką odstawione
+  do zwolnienia slotu / ponownego sprawdzenia bramki
+- Wybór zapamiętany do następnej zmiany - has_ready() i pop() liczą go raz
+- Ponowienia z opóźnieniem: kopiec terminów, element wraca do kolejki dopiero po czasie
+"""
+
+import heapq
+import itertools
+import time
+from collections import Counter
+
+from url_classifier import classify
+
+
+def host_of(url):
+    """Host URL-a (małe litery); pusty napis, gdy URL go nie ma"""
+    # Werdykt walidacji jest już w pamięci podręcznej - bez ponownego parsowania
+    return classify(url).host
+
+
+class DownloadQueue:
+    """Kolejka priorytetowa elementów pobierania (słowników z kluczem 'url')"""
+
+    # Znacznik wpisu usuniętego z kopca (leniwe usuwanie)
+    _REMOVED = None
+
+    def __init__(self, max_per_host=None, completed=None, key=None):
+        """max_per_host - domyślny limit aktywnych pobrań z jednego hosta (None = bez limitu)
+        completed - indeks URL-i pobranych (add / clear / in), domyślnie zbiór w pamięci
+        key - klucz deduplikacji URL-a (np. url_canonical.canonical_url), domyślnie sam URL
+        """
+        self.key = key or str
+        self._hosts = {}  # host -> kopiec wpisów [-priorytet, seq, element, host]
+        self._counter = itertools.count()
+        self._stale = 0
+
+        # Indeksy: klucz URL-a -> wpis kopca / element
+        self._entries = {}
+        self.active = {}
+        self.completed = set() if completed is None else completed
+        # Indeks z contains_key (DownloadHistory) sprawdzany gotowym kluczem - bez ponownego liczenia
+        self._completed_contains = getattr(self.completed, 'contains_key', self.completed.__contains__)
+
+        # Ponowienia odłożone w czasie: kopiec wpisów [termin, seq, element], klucz -> wpis
+        self._delayed = []
+        self._deferred = {}
+        self.clock = time.monotonic
+
+        # Liczniki per host
+        self._queued_by_host = Counter()
+        self._active_by_host = Counter()
+
+        # Sprawiedliwość: ważona liczba obsłużonych elementów per host (czas wirtualny)
+        self._served = {}
+        self._virtual_time = 0.0
+
+        # Kopiec czół hostów [-priorytet, udział, seq, host]; host -> jego aktualny wpis
+        # (starsze wpisy tego hosta w kopcu są nieaktualne i pomijane)
+        self._ready = []
+        self._ready_entries = {}
+        # Hosty odstawione: limit aktywnych wyczerpany / bramka zamknięta
+        self._full = set()
+        self._gated = set()
+        self._selected = None  # Wynik _select() do następnej zmiany kolejki
+
+        self._max_per_host = max_per_host
+        self.host_limits = {}   # host -> limit aktywnych (nadpisuje max_per_host)
+        self.host_weights = {}  # host -> waga udziału (domyślnie 1)
+        # Opcjonalna bramka host -> bool (np. bezpiecznik): False wstrzymuje elementy hosta
+        self.host_gate = None
+
+    def __len__(self):
+        return len(self._entries) + len(self._deferred)
+
+    def __bool__(self):
+        return bool(self._entries) or bool(self._deferred)
+
+    def __contains__(self, url):
+        """Czy URL (lub jego wariant o tym samym kluczu) jest w kolejce (także odłożony),
+        w trakcie pobierania lub już pobrany"""
+        return self.contains_key(self.key(url))
+
+    def item_key(self, item):
+        """Klucz deduplikacji elementu - liczony raz i zapamiętany w item['key']"""
+        key = item.get('key')
+        if key is None:
+            key = item['key'] = self.key(item['url'])
+        return key
+
+    def contains_key(self, key):
+        """Jak `url in kolejka`, dla gotowego klucza deduplikacji"""
+        return (key in self._entries or key in self._deferred or
+                key in self.active or self._completed_contains(key))
+
+    def __iter__(self):
+        """Elementy w kolejności priorytetu i dodania, potem odłożone wg terminu (kopia)"""
+        entries = sorted(self._entries.values(), key=lambda entry: (entry[0], entry[1]))
+        delayed = sorted(self._deferred.values(), key=lambda entry: (entry[0], entry[1]))
+        return iter([entry[2] for entry in entries] + [entry[2] for entry in delayed])
+
+    def is_queued(self, url):
+        return self.key(url) in self._entries
+
+    def is_active(self, url):
+        return self.key(url) in self.active
+
+    def is_completed(self, url):
+        return self._completed_contains(self.key(url))
+
+    def queued_hosts(self):
+        """Hosty z elementami czekającymi w kolejce (bez odłożonych ponowień)"""
+        return self._queued_by_host.keys()
+
+    @property
+    def max_per_host(self):
+        return self._max_per_host
+
+    @max_per_host.setter
+    def max_per_host(self, value):
+        self._max_per_host = value
+        for host in list(self._full):
+            self._unpark(host)
+
+    def set_host_limit(self, host, max_active=None, weight=None):
+        """Ustaw limit aktywnych pobrań i/lub wagę udziału dla hosta"""
+        if max_active is not None:
+            self.host_limits[host] = max_active
+        if weight is not None:
+            self.host_weights[host] = weight
+        self._unpark(host)
+
+    def push(self, item):
+        """Dodaj element do kolejki. Zwraca False dla duplikatu."""
+        if self.contains_key(self.item_key(item)):
+            return False
+        self._push(item)
+        return True
+
+    def push_many(self, items, keys=None, hosts=None):
+        """Dodaj wiele elementów naraz (kopce hostów scalane przez heapify). Zwraca dodane.
+
+        keys / hosts - klucze i hosty URL-i policzone wcześniej (np. poza blokadą
+        menedżera), w kolejności items; domyślnie liczone tutaj. Klucz trafia do item['key'].
+        """
+        items = list(items)
+        if keys is None:
+            keys = [self.item_key(item) for item in items]
+        if hosts is None:
+            hosts = [host_of(item['url']) for item in items]
+        added = []
+        batches = {}
+        entries_index = self._entries
+        for item, key, host in zip(items, keys, hosts):
+            if self.contains_key(key):
+                continue
+            item['key'] = key
+            entry = [-item.get('priority', 0), next(self._counter), item, host]
+            entries_index[key] = entry
+            batches.setdefault(host, []).append(entry)
+            added.append(item)
+
+        for host, entries in batches.items():
+            heap = self._hosts.get(host)
+            if heap is None:
+                heap = self._hosts[host] = []
+                self._served[host] = max(self._served.get(host, 0.0), self._virtual_time)
+            self._queued_by_host[host] += len(entries)
+            if len(entries) > len(heap):
+                heap.extend(entries)
+                heapq.heapify(heap)
+            else:
+                for entry in entries:
+                    heapq.heappush(heap, entry)
+            self._refresh(host)
+        return added
+
+    def _push(self, item):
+        host = host_of(item['url'])
+        heap = self._hosts.get(host)
+        if heap is None:
+            heap = self._hosts[host] = []
+            # Host wracający do kolejki nie dostaje zaległego udziału
+            self._served[host] = max(self._served.get(host, 0.0), self._virtual_time)
+
+        entry = [-item.get('priority', 0), next(self._counter), item, host]
+        self._entries[self.item_key(item)] = entry
+        self._queued_by_host[host] += 1
+        heapq.heappush(heap, entry)
+        if heap[0] is entry:
+            self._refresh(host)
+
+    def _head(self, host):
+        """Pierwszy żywy wpis kopca hosta (usuwa martwe wpisy ze szczytu)"""
+        heap = self._hosts[host]
+        while heap and heap[0][2] is self._REMOVED:
+            heapq.heappop(heap)
+            self._stale -= 1
+        return heap[0] if heap else None
+
+    def _host_available(self, host):
+        if self.host_gate is not None and not self.host_gate(host):
+            return False
+        limit = self.host_limits.get(host, self.max_per_host)
+        return limit is None or self._active_by_host[host] < limit
+
+    def _refresh(self, host):
+        """Wstaw aktualne czoło hosta do kopca czół (po zmianie czoła lub udziału)"""
+        self._selected = None
+        if host in self._full or host in self._gated or host not in self._hosts:
+            return
+        head = self._head(host)
+        if head is None:
+            self._ready_entries.pop(host, None)
+            return
+        current = self._ready_entries.get(host)
+        served = self._served.get(host, 0.0)
+        if current is not None and current[2] == head[1] and current[1] == served:
+            return
+        entry = [head[0], served, head[1], host]
+        self._ready_entries[host] = entry
+        heapq.heappush(self._ready, entry)
+        if len(self._ready) > 2 * len(self._ready_entries) + 64:
+            # Zbyt wiele nieaktualnych wpisów - przebuduj kopiec czół
+            self._ready = list(self._ready_entries.values())
+            heapq.heapify(self._ready)
+
+    def _park(self, host):
+        """Odstaw host niemogący teraz startować (zdjęty ze szczytu kopca czół)"""
+        self._ready_entries.pop(host, None)
+        if self.host_gate is not None and not self.host_gate(host):
+            self._gated.add(host)
+        else:
+            self._full.add(host)
+
+    def _unpark(self, host):
+        if host in self._full or host in self._gated:
+            self._full.discard(host)
+            self._gated.discard(host)
+        self._refresh(host)
+
+    def _select(self):
+        """Wpis do pobrania: priorytet, potem najmniejszy udział hosta, potem FIFO"""
+        if self._delayed:
+            self._promote()
+        # Bramka (np. bezpiecznik) zmienia się w czasie - odstawione nią hosty sprawdzane ponownie
+        for host in list(self._gated):
+            if self.host_gate is None or self.host_gate(host):
+                self._unpark(host)
+        selected = self._selected
+        if selected is not None:
+            if selected[2] is not self._REMOVED and self._host_available(selected[3]):
+                return selected
+            self._selected = None
+
+        ready = self._ready
+        while ready:
+            top = ready[0]
+            host = top[3]
+            if self._ready_entries.get(host) is not top:
+                heapq.heappop(ready)  # Nieaktualny wpis
+                continue
+            head = self._head(host) if host in self._hosts else None
+            if head is None:
+                heapq.heappop(ready)
+                del self._ready_entries[host]
+                self._hosts.pop(host, None)
+                continue
+            if head[1] != top[2]:
+                heapq.heappop(ready)  # Czoło hosta usunięte - wstaw następne
+                del self._ready_entries[host]
+                self._refresh(host)
+                continue
+            if not self._host_available(host):
+                heapq.heappop(ready)
+                self._park(host)
+                continue
+            self._selected = head
+            return head
+        return None
+
+    def has_ready(self):
+        """Czy jakiś element może wystartować (jego host nie wyczerpał limitu)"""
+        return self._select() is not None
+
+    def pop(self):
+        """Pobierz następny element i oznacz go jako aktywny (None, gdy nic nie może wystartować)"""
+        entry = self._select()
+        if entry is None:
+            return None
+
+        self._selected = None
+        item, host = entry[2], entry[3]
+        heapq.heappop(self._hosts[host])
+
+        key = self.item_key(item)
+        del self._entries[key]
+        self._queued_by_host[host] -= 1
+        if not self._queued_by_host[host]:
+            del self._queued_by_host[host]
+            self._drop_heap(host)
+
+        self.active[key] = item
+        self._active_by_host[host] += 1
+
+        served = self._served.get(host, self._virtual_time)
+        self._virtual_time = served
+        self._served[host] = served + 1.0 / self.host_weights.get(host, 1)
+        self._refresh(host)
+        return item
+
+    def peek(self):
+        """Element, który zwróciłby pop(), bez zdejmowania go z kolejki"""
+        entry = self._select()
+        return entry[2] if entry else None
+
+    def remove(self, url):
+        """Usuń oczekujący (także odłożony) element z kolejki"""
+        key = self.key(url)
+        delayed = self._deferred.pop(key, None)
+        if delayed is not None:
+            item, delayed[2] = delayed[2], self._REMOVED
+            return item
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        item, host = entry[2], entry[3]
+        entry[2] = self._REMOVED
+        self._stale += 1
+        self._selected = None
+        self._queued_by_host[host] -= 1
+        if not self._queued_by_host[host]:
+            del self._queued_by_host[host]
+            self._drop_heap(host)
+            self._forget(host)
+        self._compact()
+        return item
+
+    def _drop_heap(self, host):
+        """Host bez elementów w kolejce - usuń jego kopiec (same martwe wpisy) i czoło"""
+        heap = self._hosts.pop(host, None)
+        if heap:
+            self._stale -= len(heap)
+        self._ready_entries.pop(host, None)
+
+    def _release(self, item):
+        """Zdejmij element z aktywnych i zwolnij slot jego hosta"""
+        if self.active.pop(self.item_key(item), None) is None:
+            return
+        host = host_of(item['url'])
+        self._active_by_host[host] -= 1
+        if self._active_by_host[host] <= 0:
+            del self._active_by_host[host]
+            self._forget(host)
+        if host in self._full:
+            self._unpark(host)  # Zwolniony slot hosta
+
+    def _forget(self, host):
+        """Usuń stan sprawiedliwości hosta bez elementów w kolejce i aktywnych"""
+        if host not in self._queued_by_host and host not in self._active_by_host:
+            self._served.pop(host, None)
+
+    def requeue(self, item):
+        """Przywróć aktywny element do kolejki (ponowna próba)"""
+        self._release(item)
+        if self.item_key(item) in self._entries:
+            return False
+        self._push(item)
+        return True
+
+    def defer(self, item, delay):
+        """Zwolnij aktywny element i zaplanuj jego ponowienie za delay sekund"""
+        self._release(item)
+        key = self.item_key(item)
+        if key in self._entries or key in self._deferred:
+            return False
+        entry = [self.clock() + delay, next(self._counter), item]
+        self._deferred[key] = entry
+        heapq.heappush(self._delayed, entry)
+        return True
+
+    def _promote(self):
+        """Przenieś do kolejki elementy, których termin ponowienia minął"""
+        now = self.clock()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, item = heapq.heappop(self._delayed)
+            if item is self._REMOVED:
+                continue
+            del self._deferred[self.item_key(item)]
+            self._push(item)
+
+    def retry_delay(self):
+        """Sekundy do najbliższego terminu ponowienia (None, gdy nic nie jest odłożone)"""
+        while self._delayed and self._delayed[0][2] is self._REMOVED:
+            heapq.heappop(self._delayed)
+        if not self._delayed:
+            return None
+        return max(0.0, self._delayed[0][0] - self.clock())
+
+    def mark_completed(self, item):
+        """Oznacz aktywny element jako pobrany"""
+        self._release(item)
+        self.completed.add(self.item_key(item))
+
+    def mark_failed(self, item):
+        """Zdejmij aktywny element bez oznaczania go jako pobranego"""
+        self._release(item)
+
+    def clear_completed(self):
+        self.completed.clear()
+
+    def clear(self):
+        """Usuń wszystkie oczekujące elementy (aktywne i ukończone zostają)"""
+        self._hosts.clear()
+        self._entries.clear()
+        self._queued_by_host.clear()
+        self._stale = 0
+        self._ready.clear()
+        self._ready_entries.clear()
+        self._full.clear()
+        self._gated.clear()
+        self._selected = None
+        self._delayed.clear()
+        self._deferred.clear()
+
+    def host_stats(self):
+        """Głębokość kolejki i liczba aktywnych pobrań per host"""
+        hosts = set(self._queued_by_host) | set(self._active_by_host)
+        return {
+            host: {
+                'queued': self._queued_by_host.get(host, 0),
+                'active': self._active_by_host.get(host, 0),
+                'limit': self.host_limits.get(host, self.max_per_host)
+            }
+            for host in sorted(hosts)
+        }
+
+    def _compact(self):
+        """Przebuduj kopce, gdy usunięte wpisy stanowią ponad połowę"""
+        total = sum(len(heap) for heap in self._hosts.values())
+        if self._stale > 64 and self._stale * 2 > total:
+            for host in list(self._hosts):
+                heap = [entry for entry in self._hosts[host] if entry[2] is not self._REMOVED]
+                if heap:
+                    heapq.heapify(heap)
+                    self._hosts[host] = heap
+                else:
+                    del self._hosts[host]
+            self._stale = 0
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Zapis pobieranych plików pod jawnymi offsetami
+- Prealokacja przy znanym rozmiarze (posix_fallocate) - mniej fragmentacji na ext4/xfs
+- Sprawdzenie wolnego miejsca przed pobraniem pierwszego bajtu
+- os.pwrite pod podanym offsetem - jeden zapis dla pobierania zwykłego, segmentowego i wznawianego
+"""
+
+import errno
+import os
+import shutil
+import threading
+from pathlib import Path
+
+
+class InsufficientSpaceError(OSError):
+    """Za mało miejsca na dysku na pobierany plik"""
+
+    def __init__(self, path, required, available):
+        self.required = required
+        self.available = available
+        super().__init__(
+            errno.ENOSPC,
+            f"Za mało miejsca na dysku: potrzeba {required//1024//1024}MB, "
+            f"dostępne {available//1024//1024}MB",
+            str(path)
+        )
+
+
+def allocated_bytes(path):
+    """Ile bajtów pliku jest już zaalokowanych na dysku (0, gdy plik nie istnieje)"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    blocks = getattr(stat, 'st_blocks', None)
+    return blocks * 512 if blocks is not None else stat.st_size
+
+
+def ensure_free_space(path, size):
+    """Rzuć InsufficientSpaceError, jeśli dysk nie pomieści pliku o danym rozmiarze"""
+    path = Path(path)
+    required = max(0, size - allocated_bytes(path))
+    if not required:
+        return
+    available = shutil.disk_usage(path.parent).free
+    if available < required:
+        raise InsufficientSpaceError(path, required, available)
+
+
+class FileWriter:
+    """Zapis pod offsetami przez deskryptor pliku (bezpieczny dla wielu wątków)"""
+
+    def __init__(self, path, truncate=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if truncate:
+            flags |= os.O_TRUNC
+        self.fd = os.open(self.path, flags, 0o644)
+        # Bez os.pwrite (Windows) - lseek + write pod blokadą
+        self._lock = None if hasattr(os, 'pwrite') else threading.Lock()
+
+    def preallocate(self, size):
+        """Sprawdź wolne miejsce i zarezerwuj size bajtów, zanim zaczniemy pobierać"""
+        if not size:
+            return
+        ensure_free_space(self.path, size)
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(self.fd, 0, size)
+                return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise InsufficientSpaceError(self.path, size, shutil.disk_usage(self.path.parent).free)
+            if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+                raise
+        # System plików bez fallocate - przynajmniej ustaw docelowy rozmiar
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+
+    def truncate(self, size):
+        os.ftruncate(self.fd, size)
+
+    def write_at(self, offset, data):
+        """Zapisz całe data pod offsetem. Zwraca liczbę zapisanych bajtów."""
+        view = memoryview(data)
+        total = len(view)
+        written = 0
+        try:
+            while written < total:
+                if self._lock is None:
+                    written += os.pwrite(self.fd, view[written:], offset + written)
+                else:
+                    with self._lock:
+                        os.lseek(self.fd, offset + written, os.SEEK_SET)
+                        written += os.write(self.fd, view[written:])
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise InsufficientSpaceError(self.path, total - written, 0) from e
+            raise
+        return total
+
+    def fsync(self):
+        os.fsync(self.fd)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
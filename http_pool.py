@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Wspólna pula połączeń HTTP dla wszystkich modułów
+- Jedna sesja requests z pulą połączeń per host (keep-alive)
+- Ponowne użycie połączeń TCP+TLS między kolejnymi żądaniami do tego samego hosta
+- Liczniki trafień/chybień puli (połączenie użyte ponownie / nowe)
+"""
+
+import threading
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PoolStats:
+    """Liczniki ponownego użycia połączeń, globalnie i per host"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.by_host = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, host, reused):
+        with self.lock:
+            key = 'hits' if reused else 'misses'
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.by_host[host][key] += 1
+
+    def snapshot(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'by_host': {host: dict(counts) for host, counts in self.by_host.items()}
+            }
+
+    def reset(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.by_host.clear()
+
+
+def _counting_pool(base, stats):
+    """Klasa puli urllib3 zliczająca, czy wydane połączenie było już otwarte"""
+
+    class CountingPool(base):
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout=timeout)
+            stats.record(f"{self.host}:{self.port}", getattr(conn, 'sock', None) is not None)
+            return conn
+
+    CountingPool.__name__ = f"Counting{base.__name__}"
+    return CountingPool
+
+
+class PooledAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.stats),
+            'https': _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+
+class HttpPool:
+    def __init__(self, pool_hosts=32, pool_maxsize=16, pool_block=False):
+        """
+        pool_hosts - ile pul (hostów) trzymać w pamięci,
+        pool_maxsize - limit utrzymywanych połączeń na host,
+        pool_block - czekaj na wolne połączenie zamiast otwierać ponad limit.
+        """
+        self.stats = PoolStats()
+        self.session = requests.Session()
+        self.configure(pool_hosts, pool_maxsize, pool_block)
+
+    def configure(self, pool_hosts=32, pool_maxsize=16, pool_block=False):
+        """Zmień rozmiary puli - nowy adapter w tej samej sesji (np. z konfiguracji przy starcie)"""
+        adapter = PooledAdapter(self.stats, pool_connections=pool_hosts,
+                                pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.session.head(url, **kwargs)
+
+    def get_stats(self):
+        """Pobierz statystyki ponownego użycia połączeń"""
+        return self.stats.snapshot()
+
+    def reset_stats(self):
+        self.stats.reset()
+
+    def close(self):
+        self.session.close()
+
+
+# Singleton instance
+http_pool = HttpPool()
+
+
+def get_session():
+    """Wspólna sesja HTTP z pulą połączeń"""
+    return http_pool.session
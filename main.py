@@ -13,12 +13,22 @@ from datetime import datetime
 from urllib.parse import urlparse, unquote
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import requests
 import pyperclip
 from concurrent.futures import ThreadPoolExecutor
 
 # Import our bulletproof error handler
 from error_handler import error_handler, logger
+from config import load_config
+from content_store import ContentStore
+from download_history import HistoryArchive
+from download_manager import download_manager
+from http_pool import get_session
+from queue_journal import QueueJournal
+from security_validator import security_validator
+from subscription_manager import subscription_manager
+from progress_tracker import ProgressTracker
+from stream_digest import StreamingDigest
+from url_classifier import url_classifier
 
 class DeepIntelVideoSuite:
     def __init__(self, root):
@@ -212,21 +222,9 @@ class DeepIntelVideoSuite:
         self.root.after(5000, self.safe_auto_refresh_files)
     
     def is_video_url(self, url):
-        """Check if URL points to a video file"""
+        """Check if URL points to a video file or a video platform page"""
         try:
-            parsed = urlparse(url)
-            path_lower = parsed.path.lower()
-            
-            # Check file extension
-            if any(path_lower.endswith(ext) for ext in self.supported_formats):
-                return True
-            
-            # Check video platforms
-            video_domains = ['youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion.com']
-            if any(domain in parsed.netloc for domain in video_domains):
-                return True
-                
-            return False
+            return url_classifier.classify(url).is_video
         except Exception as e:
             logger.error(f"URL validation error: {e}")
             return False
@@ -301,22 +299,28 @@ class DeepIntelVideoSuite:
             # Download file
             self.update_status(f"Downloading: {filename}")
             
-            response = requests.get(url, stream=True, timeout=30)
+            response = get_session().get(url, stream=True, timeout=30)
             response.raise_for_status()
             
             total_size = int(response.headers.get('content-length', 0))
             downloaded = 0
             
+            # Coalesced progress - a few Tk updates per second instead of one per chunk
+            tracker = ProgressTracker(total_size, self.schedule_progress_update)
+            # SHA-256 while streaming - the content store links copies of the same video
+            digest = StreamingDigest(('sha256',))
+            
             with open(file_path, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
                     if chunk:
                         f.write(chunk)
+                        digest.update(chunk)
                         downloaded += len(chunk)
-                        
-                        # Update progress
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            self.root.after(0, lambda: self.progress_var.set(progress))
+                        tracker.update(downloaded)
+            tracker.finish(downloaded)
+            
+            # Same content already downloaded (e.g. by the chat monitor) - keep one copy on disk
+            download_manager.store_file(file_path, digest.hexdigests()['sha256'], downloaded)
             
             # Add to file list
             self.downloaded_files.append(str(file_path))
@@ -336,6 +340,15 @@ class DeepIntelVideoSuite:
         finally:
             self.downloading = False
     
+    def schedule_progress_update(self, percent, downloaded, total_size, speed, eta):
+        """Push an aggregated progress event to the Tk main loop"""
+        if percent is None:
+            return
+        status = f"{percent:.0f}% - {speed / (1024 * 1024):.1f} MB/s"
+        if eta:
+            status += f" - {eta:.0f}s left"
+        self.root.after(0, lambda: (self.progress_var.set(percent), self.status_var.set(status)))
+    
     def prompt_overwrite(self, file_path, url):
         """Prompt user about file overwrite"""
         response = messagebox.askyesno("File Exists", 
@@ -569,12 +582,28 @@ Would you like to:
         """Handle application closing safely"""
         try:
             self.thread_pool.shutdown(wait=False)
+            # Stops workers and commits the queue journal / history archive
+            download_manager.stop_processing()
             self.root.destroy()
             logger.info("Application closed successfully")
         except Exception as e:
             logger.error(f"Error during shutdown: {e}")
             self.root.destroy()
 
+def setup_download_manager(config=None):
+    """Wire the shared download manager at app startup (not on import): settings from
+    ~/.video_downloader/config.json, persistent state under ~/.video_downloader
+    and subscription plan limits (also after plan changes)"""
+    config = config or load_config()
+    download = config['download']
+    download_manager.configure(config)
+    security_validator.load_blocklist_dir(config['security']['blocklist_dir'])
+    download_manager.attach_persistence(
+        journal=QueueJournal() if download.get('persistent_queue', True) else None,
+        archive=HistoryArchive(),
+        content_store=ContentStore() if download.get('deduplicate', True) else None)
+    download_manager.attach_subscription(subscription_manager)
+
 def main():
     """Main application entry point with comprehensive error handling"""
     try:
@@ -582,6 +611,8 @@ def main():
         import tkinter as tk
         from tkinter import messagebox
         
+        setup_download_manager()
+        
         # Create and run application
         root = tk.Tk()
         app = DeepIntelVideoSuite(root)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Wznawialne pobieranie - pliki .part i stan w pliku pobocznym
+- Dane trafiają do <plik>.part, stan do <plik>.part.json
+- Stan: liczba odebranych bajtów, rozmiar, ETag/Last-Modified, zakresy segmentów
+- Wznowienie przez Range: bytes=N- z If-Range
+- Punkty kontrolne co kilka MB (fsync + atomowy zapis stanu), nie co fragment
+- Plik .part prealokowany przy znanym rozmiarze, zapis pod offsetami (FileWriter)
+"""
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from file_writer import FileWriter, InsufficientSpaceError
+
+
+class PartialDownload:
+    PART_SUFFIX = '.part'
+    STATE_SUFFIX = '.part.json'
+
+    def __init__(self, file_path, url, checkpoint_interval=4*1024*1024):
+        self.file_path = Path(file_path)
+        self.url = url
+        self.part_path = self.file_path.with_name(self.file_path.name + self.PART_SUFFIX)
+        self.state_path = self.file_path.with_name(self.file_path.name + self.STATE_SUFFIX)
+        self.checkpoint_interval = checkpoint_interval
+
+        self.state = {}
+        self._last_checkpoint = 0
+
+    @property
+    def bytes_received(self):
+        return self.state.get('bytes_received', 0)
+
+    @property
+    def total_size(self):
+        return self.state.get('total_size', 0)
+
+    def load(self):
+        """Wczytaj stan poprzedniej próby; niespójny stan jest porzucany"""
+        self.state = {}
+        try:
+            if self.state_path.exists() and self.part_path.exists():
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                part_size = self.part_path.stat().st_size
+                if state.get('url') == self.url and part_size >= state.get('bytes_received', 0):
+                    self.state = state
+        except (OSError, ValueError):
+            self.state = {}
+
+        self._last_checkpoint = self.bytes_received
+        return self.state
+
+    def validator(self):
+        """Walidator dla If-Range: silny ETag, w drugiej kolejności Last-Modified"""
+        etag = self.state.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return self.state.get('last_modified')
+
+    def matches(self, etag=None, last_modified=None, total_size=None):
+        """Czy zapisany stan dotyczy tej samej wersji zasobu"""
+        if total_size and self.total_size and total_size != self.total_size:
+            return False
+        if etag and self.state.get('etag'):
+            return etag == self.state['etag']
+        if last_modified and self.state.get('last_modified'):
+            return last_modified == self.state['last_modified']
+        return True
+
+    def resume_headers(self):
+        """Nagłówki żądania wznawiającego (puste, gdy nie ma czego wznawiać)"""
+        if self.bytes_received <= 0:
+            return {}
+        headers = {'Range': f"bytes={self.bytes_received}-"}
+        validator = self.validator()
+        if validator:
+            headers['If-Range'] = validator
+        return headers
+
+    def response_resumes(self, response):
+        """Czy odpowiedź (requests) jest kontynuacją od zapisanego offsetu"""
+        return self.resumes(response.status_code, response.headers.get('content-range', ''))
+
+    def resumes(self, status, content_range):
+        """Czy odpowiedź o tym statusie i Content-Range jest kontynuacją od zapisanego offsetu"""
+        if self.bytes_received <= 0 or status != 206:
+            return False
+        match = re.match(r'bytes\s+(\d+)-', content_range or '')
+        return bool(match) and int(match.group(1)) == self.bytes_received
+
+    def complete_on_416(self, content_range):
+        """Odpowiedź 416 na wznowienie: czy .part zawiera już cały zasób.
+        
+        Content-Range: bytes */N podaje pełny rozmiar zasobu; bez nagłówka - rozmiar
+        zapisany w stanie. Inny rozmiar oznacza, że .part nie pasuje do zasobu.
+        """
+        if self.bytes_received <= 0:
+            return False
+        match = re.match(r'bytes\s+\*/(\d+)', content_range or '')
+        total_size = int(match.group(1)) if match else self.total_size
+        return self.bytes_received == total_size
+
+    def set_validators(self, total_size, etag=None, last_modified=None):
+        """Zapamiętaj walidatory odpowiedzi i pełny rozmiar zasobu"""
+        self.state.update({
+            'url': self.url,
+            'total_size': total_size,
+            'etag': etag,
+            'last_modified': last_modified,
+        })
+
+    def open(self, offset=0, total_size=None):
+        """Otwórz plik .part do zapisu pod offsetami (FileWriter).
+        
+        Przy znanym total_size plik jest prealokowany - brak miejsca na dysku
+        kończy się InsufficientSpaceError, zanim pobierzemy pierwszy bajt.
+        """
+        writer = FileWriter(self.part_path, truncate=offset <= 0)
+        try:
+            if offset <= 0:
+                self.reset()
+            elif not total_size:
+                writer.truncate(offset)
+            writer.preallocate(total_size)
+        except InsufficientSpaceError:
+            writer.close()
+            if offset <= 0:
+                self.part_path.unlink(missing_ok=True)
+            raise
+        self._last_checkpoint = offset
+        return writer
+
+    def reset(self):
+        """Zacznij od zera - zachowaj tylko walidatory zasobu"""
+        self.state['bytes_received'] = 0
+        self.state.pop('segments', None)
+        self._last_checkpoint = 0
+
+    def checkpoint(self, writer, bytes_received, force=False):
+        """Utrwal dane i stan, jeśli od ostatniego punktu minęło checkpoint_interval bajtów"""
+        if not force and bytes_received - self._last_checkpoint < self.checkpoint_interval:
+            return False
+        writer.fsync()
+        self.state['bytes_received'] = bytes_received
+        self._last_checkpoint = bytes_received
+        self.save()
+        return True
+
+    def checkpoint_segments(self, ranges, bytes_received, force=False):
+        """Punkt kontrolny pobierania segmentowego: pozostałe zakresy [start, end]"""
+        if not force and bytes_received - self._last_checkpoint < self.checkpoint_interval:
+            return False
+        fd = os.open(self.part_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.state['segments'] = [list(r) for r in ranges]
+        self.state['bytes_received'] = bytes_received
+        self._last_checkpoint = bytes_received
+        self.save()
+        return True
+
+    def save(self):
+        """Zapisz stan atomowo (plik tymczasowy + os.replace)"""
+        self.state['url'] = self.url
+        self.state['updated'] = time.time()
+        tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def finalize(self):
+        """Zamień ukończony .part na plik docelowy i usuń stan"""
+        os.replace(self.part_path, self.file_path)
+        self.state_path.unlink(missing_ok=True)
+        self.state = {}
+
+    def discard(self):
+        """Usuń częściowe dane i stan"""
+        self.part_path.unlink(missing_ok=True)
+        self.state_path.unlink(missing_ok=True)
+        self.state = {}
+        self._last_checkpoint = 0
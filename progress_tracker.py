@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Agregacja zdarzeń postępu pobierania
+- Najwyżej N zdarzeń na sekundę na pobieranie (zamiast jednego na każdy fragment)
+- Opcjonalny minimalny krok: co X% lub co Y bajtów
+- Wygładzona prędkość (średnia wykładnicza) i szacowany czas do końca
+- Zawsze końcowe zdarzenie 100%
+"""
+
+import threading
+import time
+
+
+class ProgressTracker:
+    def __init__(self, total_size, emit, max_events_per_second=4, min_step_percent=0.0,
+                 min_step_bytes=0, smoothing=0.3, initial=0, clock=time.monotonic):
+        """
+        emit(percent, downloaded, total_size, speed, eta) - odbiorca zdarzeń;
+        percent i eta są None, gdy rozmiar nie jest znany; speed w bajtach/s, eta w sekundach.
+        """
+        self.total_size = total_size
+        self.emit = emit
+        self.interval = 1.0 / max_events_per_second if max_events_per_second else 0.0
+        self.min_step_bytes = max(min_step_bytes, total_size * min_step_percent / 100 if total_size else 0)
+        self.smoothing = smoothing
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.downloaded = initial
+        self.speed = 0.0
+        self.events = 0
+
+        now = clock()
+        self._last_emit = now
+        self._last_bytes = initial
+        self._sample_time = now
+        self._sample_bytes = initial
+        self._finished = False
+
+    def update(self, downloaded):
+        """Zapisz stan postępu; zdarzenie tylko gdy minął interwał i krok. Zwraca True przy emisji."""
+        now = self.clock()
+        with self.lock:
+            # Wątki segmentów mogą zgłaszać stany w innej kolejności
+            self.downloaded = max(self.downloaded, downloaded)
+            if self._finished or now - self._last_emit < self.interval:
+                return False
+            if self.downloaded - self._last_bytes < max(self.min_step_bytes, 1):
+                return False
+            event = self._event(now)
+        self.emit(*event)
+        return True
+
+    def finish(self, downloaded=None):
+        """Końcowe zdarzenie (100% przy znanym rozmiarze) - wysyłane dokładnie raz"""
+        now = self.clock()
+        with self.lock:
+            if self._finished:
+                return False
+            self._finished = True
+            if downloaded is not None:
+                self.downloaded = downloaded
+            event = self._event(now, final=True)
+        self.emit(*event)
+        return True
+
+    def _event(self, now, final=False):
+        """Zaktualizuj prędkość i zbuduj zdarzenie (wywoływać pod self.lock)"""
+        elapsed = now - self._sample_time
+        if elapsed > 0:
+            sample = (self.downloaded - self._sample_bytes) / elapsed
+            self.speed = sample if self.events == 0 else (
+                self.smoothing * sample + (1 - self.smoothing) * self.speed)
+            self._sample_time = now
+            self._sample_bytes = self.downloaded
+
+        self._last_emit = now
+        self._last_bytes = self.downloaded
+        self.events += 1
+
+        total = self.total_size
+        if not total:
+            return None, self.downloaded, total, self.speed, None
+        if final:
+            return 100.0, self.downloaded, total, self.speed, 0.0
+        remaining = max(0, total - self.downloaded)
+        eta = remaining / self.speed if self.speed > 0 else None
+        return self.downloaded / total * 100, self.downloaded, total, self.speed, eta
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Trwały dziennik kolejki pobierania (SQLite WAL)
+- Stan każdego elementu: queued, active, done, failed, backoff
+- Zapis grupowy: zmiany zbierane przez commit_interval i zatwierdzane jedną transakcją
+  (10 tys. dodanych URL-i = jeden fsync, kolejne zmiany tego samego URL-a scalane)
+- Odtwarzanie po restarcie: elementy queued/active/backoff wracają do kolejki,
+  done/failed - do historii (deduplikacja pobranych działa dalej)
+- Wpisy zakończone (done/failed) usuwane po przeniesieniu do archiwum historii (compact)
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+STATES = ('queued', 'active', 'done', 'failed', 'backoff')
+PENDING_STATES = ('queued', 'active', 'backoff')
+FINISHED_STATES = ('done', 'failed')
+
+# Znacznik w pending: usuń wiersz, o ile jest w stanie zakończonym
+_COMPACT = 'compact'
+
+# Kolumny wiersza elementu (dziennik kolejki i archiwum historii)
+COLUMNS = ('url', 'download_dir', 'priority', 'state', 'attempts', 'max_attempts',
+           'added_time', 'target_path', 'file_path', 'error')
+
+
+def item_to_row(item, state):
+    """Element kolejki -> krotka kolumn COLUMNS"""
+    added_time = item.get('added_time')
+    return (
+        item['url'],
+        str(item['download_dir']),
+        item.get('priority', 0),
+        state,
+        item.get('attempts', 0),
+        item.get('max_attempts', 3),
+        added_time.isoformat() if isinstance(added_time, datetime) else str(added_time or ''),
+        item.get('target_path'),
+        item.get('file_path'),
+        item.get('error')
+    )
+
+
+def row_to_item(row):
+    """Krotka kolumn COLUMNS -> element kolejki (bez stanu)"""
+    url, download_dir, priority, _, attempts, max_attempts, added_time, target_path, file_path, error = row
+    try:
+        added = datetime.fromisoformat(added_time)
+    except ValueError:
+        added = datetime.now()
+    item = {
+        'url': url,
+        'download_dir': Path(download_dir),
+        'priority': priority,
+        'added_time': added,
+        'attempts': attempts,
+        'max_attempts': max_attempts
+    }
+    for key, value in (('target_path', target_path), ('file_path', file_path), ('error', error)):
+        if value:
+            item[key] = value
+    return item
+
+
+class QueueJournal:
+    def __init__(self, db_path=None, commit_interval=0.05):
+        self.db_path = Path(db_path) if db_path else Path.home() / ".video_downloader" / "queue.db"
+        self.commit_interval = commit_interval
+        self.conn = None
+
+        # url -> wiersz do zapisu lub None (usunięcie); nowszy stan nadpisuje starszy
+        self.pending = {}
+        self.condition = threading.Condition()
+        # Kolejność zatwierdzania partii (zamiana pending + zapis pod jedną blokadą)
+        self.commit_lock = threading.Lock()
+        self.flusher = None
+        self.closed = False
+        self.commits = 0
+
+    def _open(self):
+        """Otwórz bazę przy pierwszym użyciu (wywoływać pod self.commit_lock)"""
+        if self.conn is not None:
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                url TEXT PRIMARY KEY,
+                download_dir TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                max_attempts INTEGER NOT NULL,
+                added_time TEXT NOT NULL,
+                target_path TEXT,
+                file_path TEXT,
+                error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state)")
+        self.conn.commit()
+
+    def record(self, item, state):
+        """Zapisz stan elementu (zatwierdzany grupowo w tle)"""
+        if state not in STATES:
+            raise ValueError(f"Nieznany stan elementu: {state}")
+        self._submit({item['url']: item_to_row(item, state)})
+
+    def record_many(self, items, state='queued'):
+        self._submit({item['url']: item_to_row(item, state) for item in items})
+
+    def forget(self, urls):
+        """Usuń wpisy (np. po wyczyszczeniu listy ukończonych)"""
+        self._submit(dict.fromkeys(urls))
+
+    def compact(self, urls):
+        """Usuń wpisy zakończone przeniesione do archiwum historii (HistoryArchive)
+
+        Usuwany jest tylko wiersz w stanie done/failed - URL dodany ponownie
+        zachowuje swój nowszy stan.
+        """
+        with self.condition:
+            rows = {}
+            for url in urls:
+                row = self.pending.get(url, _COMPACT)
+                if row is _COMPACT:
+                    rows[url] = _COMPACT
+                elif row is not None and row[3] in FINISHED_STATES:
+                    rows[url] = None
+            self._submit_locked(rows)
+
+    def _submit(self, rows):
+        with self.condition:
+            self._submit_locked(rows)
+
+    def _submit_locked(self, rows):
+        """Dołącz zmiany do partii (wywoływać pod self.condition)"""
+        if not rows:
+            return
+        if self.closed:
+            raise RuntimeError("Dziennik kolejki jest zamknięty")
+        first = not self.pending
+        self.pending.update(rows)
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self._flush_loop, name="queue-journal", daemon=True)
+            self.flusher.start()
+        if first:
+            self.condition.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                # Zbierz zmiany z okna commit_interval w jedną transakcję
+                deadline = time.monotonic() + self.commit_interval
+                while not self.closed and (remaining := deadline - time.monotonic()) > 0:
+                    self.condition.wait(remaining)
+                if self.closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Zatwierdź wszystkie oczekujące zmiany teraz (jeden commit)"""
+        with self.commit_lock:
+            with self.condition:
+                rows, self.pending = self.pending, {}
+            if not rows:
+                return 0
+            self._open()
+            upserts = [row for row in rows.values() if row is not None and row is not _COMPACT]
+            deletes = [(url,) for url, row in rows.items() if row is None]
+            compacts = [(url,) + FINISHED_STATES for url, row in rows.items() if row is _COMPACT]
+            with self.conn:
+                if deletes:
+                    self.conn.executemany("DELETE FROM items WHERE url = ?", deletes)
+                if compacts:
+                    self.conn.executemany("DELETE FROM items WHERE url = ? AND state IN (?, ?)", compacts)
+                if upserts:
+                    self.conn.executemany(
+                        f"INSERT OR REPLACE INTO items ({', '.join(COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(COLUMNS))})", upserts)
+            self.commits += 1
+            return len(rows)
+
+    def recover(self):
+        """Elementy nieukończone przed restartem (aktywne wracają jako queued)"""
+        self.flush()
+        with self.commit_lock:
+            self._open()
+            rows = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM items WHERE state IN (?, ?, ?) ORDER BY added_time",
+                PENDING_STATES).fetchall()
+            with self.conn:
+                self.conn.execute("UPDATE items SET state = 'queued' WHERE state = 'active'")
+
+        return [row_to_item(row) for row in rows]
+
+    def finished(self):
+        """Elementy zakończone (done/failed) jeszcze niezarchiwizowane - [(element, stan)]
+        w kolejności ostatniej zmiany; odbudowa historii po restarcie"""
+        self.flush()
+        with self.commit_lock:
+            self._open()
+            rows = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM items WHERE state IN (?, ?) ORDER BY rowid",
+                FINISHED_STATES).fetchall()
+        return [(row_to_item(row), row[3]) for row in rows]
+
+    def counts(self):
+        """Liczba wpisów w każdym stanie (po zatwierdzeniu oczekujących zmian)"""
+        self.flush()
+        with self.commit_lock:
+            self._open()
+            counts = dict.fromkeys(STATES, 0)
+            counts.update(self.conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state"))
+            return counts
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        with self.commit_lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Limiter liczby pobrań oparty na kubełkach tokenów
+- Stały koszt O(1) sprawdzenia i zapisu (bez skanowania historii)
+- Limity globalne oraz per domena (na minutę i na godzinę)
+- Stan w pamięci procesu lub we wspólnej bazie SQLite - kilka procesów
+  na jednej maszynie korzysta wtedy z jednego budżetu
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from url_classifier import classify
+
+# Okna limitów: nazwa -> (długość w sekundach, opis w komunikatach)
+WINDOWS = {
+    'minute': (60, "na minutę"),
+    'hour': (3600, "na godzinę"),
+}
+
+
+def _refill(tokens, updated, stored_capacity, now, capacity, rate):
+    """Stan kubełka po doładowaniu; zmiana limitu przesuwa stan o różnicę pojemności"""
+    if tokens is None:
+        return float(capacity)
+    if stored_capacity is not None and stored_capacity != capacity:
+        tokens += capacity - stored_capacity
+    tokens += max(0.0, now - updated) * rate
+    return max(0.0, min(float(capacity), tokens))
+
+
+class MemoryBucketStore:
+    """Kubełki w pamięci procesu"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}  # key -> (tokens, updated, capacity)
+
+    def now(self):
+        return time.monotonic()
+
+    def take(self, specs, cost=1, consume=True):
+        """Atomowo pobierz cost tokenów ze wszystkich kubełków albo z żadnego.
+
+        specs - lista (key, capacity, rate). Zwraca (ok, key blokującego kubełka, tokeny).
+        """
+        with self.lock:
+            now = self.now()
+            levels = {}
+            for key, capacity, rate in specs:
+                tokens, updated, stored_capacity = self.buckets.get(key, (None, now, None))
+                levels[key] = _refill(tokens, updated, stored_capacity, now, capacity, rate)
+
+            blocked = next((key for key, _, _ in specs if levels[key] < cost), None)
+            if consume:
+                for key, capacity, _ in specs:
+                    tokens = levels[key] - cost if blocked is None else levels[key]
+                    self.buckets[key] = (tokens, now, capacity)
+            return blocked is None, blocked, levels
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class SqliteBucketStore:
+    """Kubełki we wspólnej bazie SQLite (współdzielone między procesami)"""
+
+    def __init__(self, db_path, timeout=5.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+        # isolation_level=None - transakcje sterowane ręcznie (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=timeout,
+                                    isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                capacity REAL NOT NULL
+            )
+        """)
+
+    def now(self):
+        # Zegar ścienny - wspólny dla wszystkich procesów
+        return time.time()
+
+    def take(self, specs, cost=1, consume=True):
+        """Jak MemoryBucketStore.take, w jednej transakcji zapisu"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            # BEGIN IMMEDIATE - blokada zapisu od początku, inne procesy czekają
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                now = self.now()
+                levels = {}
+                for key, capacity, rate in specs:
+                    row = cursor.execute(
+                        "SELECT tokens, updated, capacity FROM buckets WHERE key = ?", (key,)
+                    ).fetchone()
+                    tokens, updated, stored_capacity = row if row else (None, now, None)
+                    levels[key] = _refill(tokens, updated, stored_capacity, now, capacity, rate)
+
+                blocked = next((key for key, _, _ in specs if levels[key] < cost), None)
+                if consume:
+                    cursor.executemany(
+                        "INSERT OR REPLACE INTO buckets (key, tokens, updated, capacity) VALUES (?, ?, ?, ?)",
+                        [(key, levels[key] - cost if blocked is None else levels[key], now, capacity)
+                         for key, capacity, _ in specs]
+                    )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            return blocked is None, blocked, levels
+
+    def reset(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM buckets")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class RateLimiter:
+    def __init__(self, per_minute=10, per_hour=50, domain_limits=None, store=None):
+        """
+        per_minute / per_hour - limity globalne (None = bez limitu),
+        domain_limits - {domena: {'per_minute': N, 'per_hour': M}}; obejmuje też subdomeny,
+        store - MemoryBucketStore (domyślnie) lub SqliteBucketStore.
+        """
+        self.store = store or MemoryBucketStore()
+        self.global_limits = {'minute': per_minute, 'hour': per_hour}
+        self.domain_limits = {}
+        for domain, limits in (domain_limits or {}).items():
+            self.set_domain_limit(domain, **limits)
+
+        self.lock = threading.Lock()
+        self.total_attempts = 0
+
+    def set_domain_limit(self, domain, per_minute=None, per_hour=None):
+        """Ustaw limit dla domeny (i jej subdomen); oba None usuwa limit"""
+        domain = domain.lower().lstrip('.')
+        if per_minute is None and per_hour is None:
+            self.domain_limits.pop(domain, None)
+        else:
+            self.domain_limits[domain] = {'minute': per_minute, 'hour': per_hour}
+
+    def domain_for(self, url):
+        """Domena z konfiguracji pasująca do hosta URL (najdłuższe dopasowanie) lub None"""
+        if not self.domain_limits:
+            return None
+        host = classify(url).host if '://' in url else url.lower()
+        labels = host.split('.')
+        for i in range(len(labels)):
+            candidate = '.'.join(labels[i:])
+            if candidate in self.domain_limits:
+                return candidate
+        return None
+
+    def _specs(self, url):
+        """Kubełki obowiązujące dla URL: (key, pojemność, tokeny/s)"""
+        specs = []
+        scopes = [('global', self.global_limits)]
+        domain = self.domain_for(url) if url else None
+        if domain:
+            scopes.append((domain, self.domain_limits[domain]))
+
+        for scope, limits in scopes:
+            for window, (seconds, _) in WINDOWS.items():
+                capacity = limits.get(window)
+                if capacity is None:
+                    continue
+                specs.append((f"{scope}:{window}", capacity, capacity / seconds))
+        return specs
+
+    def _denied_message(self, key):
+        scope, window = key.rsplit(':', 1)
+        limits = self.global_limits if scope == 'global' else self.domain_limits[scope]
+        message = f"Przekroczono limit {limits[window]} pobrań {WINDOWS[window][1]}"
+        if scope != 'global':
+            message += f" dla {scope}"
+        return message
+
+    def check(self, url=None):
+        """Sprawdź limit bez zużywania tokenu. Zwraca (ok, komunikat)."""
+        specs = self._specs(url)
+        ok, blocked, _ = self.store.take(specs, consume=False)
+        return (True, "OK") if ok else (False, self._denied_message(blocked))
+
+    def acquire(self, url=None):
+        """Zużyj token ze wszystkich pasujących kubełków. Zwraca (ok, komunikat)."""
+        specs = self._specs(url)
+        ok, blocked, _ = self.store.take(specs)
+        if not ok:
+            return False, self._denied_message(blocked)
+        with self.lock:
+            self.total_attempts += 1
+        return True, "OK"
+
+    def acquire_many(self, urls):
+        """Po jednym tokenie dla każdego URL-a, jedna operacja na grupę URL-i o tych samych kubełkach.
+
+        Zwraca listę (ok, komunikat) w kolejności urls; w grupie limit dostają pierwsze URL-e.
+        """
+        results = [None] * len(urls)
+        groups = {}
+        for index, url in enumerate(urls):
+            groups.setdefault(tuple(self._specs(url)), []).append(index)
+
+        for specs, indexes in groups.items():
+            specs = list(specs)
+            _, _, levels = self.store.take(specs, consume=False)
+            granted = min([len(indexes)] + [int(levels[key]) for key, _, _ in specs])
+            if granted and not self.store.take(specs, cost=granted)[0]:
+                # Tokeny zużyte w międzyczasie przez inny wątek - po jednym
+                for index in indexes:
+                    results[index] = self.acquire(urls[index])
+                continue
+
+            if granted < len(indexes):
+                blocked = min(specs, key=lambda spec: levels[spec[0]] - granted)[0]
+                denied = (False, self._denied_message(blocked))
+            for position, index in enumerate(indexes):
+                results[index] = (True, "OK") if position < granted else denied
+            with self.lock:
+                self.total_attempts += granted
+        return results
+
+    def release_many(self, urls):
+        """Zwróć tokeny pobrane przez acquire_many dla URL-i, których ostatecznie nie dodano"""
+        groups = {}
+        for url in urls:
+            specs = tuple(self._specs(url))
+            groups[specs] = groups.get(specs, 0) + 1
+        for specs, count in groups.items():
+            # Ujemny koszt dokłada tokeny; nadmiar ponad pojemność obcina następne doładowanie
+            self.store.take(list(specs), cost=-count)
+        with self.lock:
+            self.total_attempts -= len(urls)
+
+    def status(self, url=None):
+        """Wykorzystanie limitów: {key: {'limit', 'used', 'remaining'}}"""
+        specs = self._specs(url)
+        _, _, levels = self.store.take(specs, consume=False)
+        result = {}
+        for key, capacity, _ in specs:
+            remaining = levels[key]
+            result[key] = {
+                'limit': capacity,
+                'used': round(capacity - remaining),
+                'remaining': remaining
+            }
+        return result
+
+    def reset(self):
+        self.store.reset()
+        with self.lock:
+            self.total_attempts = 0
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Polityki ponawiania nieudanych pobrań
+- Klasy błędów: zerwane połączenie, timeout, 429, 5xx, błąd integralności, 4xx, odrzucenie
+- Wykładnicze opóźnienie z pełnym jitterem: losowo z [0, min(cap, base * 2^próba)]
+- Retry-After (sekundy lub data HTTP) respektowany dla 429 i 503
+"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from stream_digest import DigestMismatchError
+
+
+class FileTooLargeError(Exception):
+    """Plik przekroczył max_file_size (np. odpowiedź chunked bez Content-Length) - bez ponawiania"""
+
+
+class DownloadInterrupted(Exception):
+    """Transfer przerwany zatrzymaniem menedżera - element wraca do kolejki bez zużycia próby"""
+
+
+class RetryPolicy:
+    def __init__(self, base=1.0, cap=60.0, honour_retry_after=False):
+        self.base = base
+        self.cap = cap
+        self.honour_retry_after = honour_retry_after
+
+    def delay(self, attempt, retry_after=None, rng=random.random):
+        """Opóźnienie przed ponowieniem po attempt nieudanych próbach (attempt od 1)"""
+        if self.honour_retry_after and retry_after is not None:
+            return max(0.0, retry_after)
+        return rng() * min(self.cap, self.base * 2 ** (attempt - 1))
+
+
+# None - błąd, którego ponowienie nic nie zmieni (od razu do nieudanych)
+DEFAULT_POLICIES = {
+    'connection': RetryPolicy(base=1.0, cap=60.0),
+    'timeout': RetryPolicy(base=2.0, cap=120.0),
+    'rate_limited': RetryPolicy(base=5.0, cap=600.0, honour_retry_after=True),
+    'server': RetryPolicy(base=2.0, cap=300.0, honour_retry_after=True),
+    'integrity': RetryPolicy(base=0.5, cap=10.0),
+    'other': RetryPolicy(base=1.0, cap=60.0),
+    'client': None,
+    'rejected': None,
+}
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After w sekundach (liczba sekund lub data HTTP); None, gdy brak lub niepoprawny"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, moment.timestamp() - now)
+
+
+def classify_status(status, retry_after=None):
+    """Klasa błędu dla kodu HTTP: (klasa, sekundy z Retry-After lub None)"""
+    if status == 429:
+        return 'rate_limited', parse_retry_after(retry_after)
+    if status == 408:
+        return 'timeout', None
+    if status >= 500:
+        return 'server', parse_retry_after(retry_after) if status == 503 else None
+    return 'client', None
+
+
+def classify_error(error):
+    """Klasa błędu pobierania: (klasa, sekundy z Retry-After lub None)"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return classify_status(error.response.status_code, error.response.headers.get('retry-after'))
+    # ConnectTimeout dziedziczy też po ConnectionError - timeout sprawdzany najpierw
+    if isinstance(error, (requests.exceptions.Timeout, TimeoutError)):
+        return 'timeout', None
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                          ConnectionError)):
+        return 'connection', None
+    if isinstance(error, DigestMismatchError):
+        return 'integrity', None
+    if isinstance(error, FileTooLargeError):
+        return 'rejected', None
+    return 'other', None
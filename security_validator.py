@@ -11,75 +11,69 @@ import os
 import sys
 import subprocess
 import hashlib
-import requests
+from http_pool import get_session
 from pathlib import Path
-import re
-from urllib.parse import urlparse
 import json
 
+from domain_blocklist import Blocklists, DomainBlocklist, compile_blocklist, read_domains
+from url_classifier import ARCHIVE, OTHER, url_classifier
+
 class SecurityValidator:
-    def __init__(self):
-        # Aktualizowana lista niebezpiecznych domen
-        self.blacklisted_domains = [
-            "malicious.com",
-            "phishing-site.net", 
-            "suspicious-downloads.org",
-            "fake-video-host.net",
-            "virus-downloads.com",
-            "malware-central.org"
-        ]
+    def __init__(self, blocklist_dir=None, classifier=None):
+        # Czarna lista, zaufane serwisy i niebezpieczne wzorce - wspólny klasyfikator URL-i
+        self.classifier = classifier or url_classifier
         
-        # Bezpieczne domeny wideo
-        self.trusted_domains = [
-            "youtube.com", "youtu.be",
-            "vimeo.com", "player.vimeo.com",
-            "twitch.tv", "clips.twitch.tv",
-            "dailymotion.com",
-            "wistia.com", "fast.wistia.net"
-        ]
+        # Skompilowane listy zagrożeń (*.blk) wczytywane przy starcie - mmap, bez parsowania
+        self.blocklist_dir = None
+        self.load_blocklist_dir(blocklist_dir or Path.home() / ".video_downloader" / "blocklists")
+    
+    def load_blocklist_dir(self, blocklist_dir):
+        """Ustaw katalog skompilowanych list (security.blocklist_dir) i zmapuj jego pliki *.blk"""
+        blocklist_dir = Path(blocklist_dir).expanduser()
+        if blocklist_dir == self.blocklist_dir:
+            return
+        self.blocklist_dir = blocklist_dir
+        if self.blocklist_dir.is_dir():
+            for path in sorted(self.blocklist_dir.glob("*.blk")):
+                try:
+                    self._add_blocklist(DomainBlocklist(path))
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ Pominięto listę domen {path.name}: {e}")
+    
+    def load_blocklist(self, path):
+        """Dodaj listę zagrożeń (domeny lub format hosts); kompilowana do blocklist_dir/<nazwa>.blk
         
-        # Wzorce niebezpiecznych URL
-        self.dangerous_patterns = [
-            r'\.exe(\?|$)',  # Pliki exe
-            r'\.scr(\?|$)',  # Screen savery
-            r'\.bat(\?|$)',  # Batch files
-            r'\.cmd(\?|$)',  # Command files
-            r'javascript:',  # JavaScript URLs
-            r'data:',        # Data URLs
-        ]
+        Plik .blk podawany bezpośrednio jest tylko mapowany. Zwraca liczbę domen.
+        """
+        path = Path(path)
+        compiled = path
+        if path.suffix != ".blk":
+            compiled = self.blocklist_dir / f"{path.stem}.blk"
+            if not compiled.exists() or compiled.stat().st_mtime < path.stat().st_mtime:
+                compile_blocklist(read_domains(path), compiled)
+        blocklist = DomainBlocklist(compiled)
+        self._add_blocklist(blocklist)
+        print(f"🛡️ Wczytano listę domen {path.name}: {len(blocklist)} wpisów")
+        return len(blocklist)
+    
+    def _add_blocklist(self, blocklist):
+        blocked = self.classifier.blocked
+        if isinstance(blocked, Blocklists):
+            blocked.add(blocklist)
+            # Zapamiętane werdykty mogły powstać przed dodaniem listy
+            self.classifier.reload()
+        else:
+            # Własna czarna lista klasyfikatora (np. DomainSet) - sprawdzana jako pierwsza
+            self.classifier.reload(blocked=Blocklists([blocked, blocklist]))
     
     def validate_url(self, url):
         """Kompleksowa walidacja URL"""
         try:
-            # Podstawowa walidacja struktury
-            result = urlparse(url)
-            if not all([result.scheme, result.netloc]):
-                return False, "Nieprawidłowa struktura URL"
-            
-            # Sprawdź protokół
-            if result.scheme not in ['http', 'https']:
-                return False, "Obsługiwane są tylko protokoły HTTP/HTTPS"
-            
-            # Sprawdź blacklistę
-            domain = result.netloc.lower()
-            for blacklisted in self.blacklisted_domains:
-                if blacklisted in domain:
-                    return False, f"Domena na czarnej liście: {blacklisted}"
-            
-            # Sprawdź niebezpieczne wzorce
-            url_lower = url.lower()
-            for pattern in self.dangerous_patterns:
-                if re.search(pattern, url_lower):
-                    return False, f"Niebezpieczny wzorzec w URL: {pattern}"
-            
-            # Sprawdź czy to zaufana domena lub wygląda na wideo
-            is_trusted = any(trusted in domain for trusted in self.trusted_domains)
-            
-            if not is_trusted:
-                # Sprawdź rozszerzenie pliku
-                video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv']
-                if not any(ext in url_lower for ext in video_extensions):
-                    return False, "URL nie wygląda na link do wideo z niezaufanej domeny"
+            verdict = self.classifier.classify(url)
+            if verdict.kind in (ARCHIVE, OTHER):
+                return False, "URL nie wygląda na link do wideo z niezaufanej domeny"
+            if not verdict.is_video:
+                return False, verdict.message
             
             return True, "URL wydaje się bezpieczny"
             
@@ -92,7 +86,7 @@ class SecurityValidator:
             # Symulacja sprawdzania reputacji (w rzeczywistości można używać VirusTotal API)
             # For demo purposes, sprawdzamy tylko podstawowe wskaźniki
             
-            response = requests.head(url, timeout=10)
+            response = get_session().head(url, timeout=10)
             content_type = response.headers.get('content-type', '').lower()
             
             # Sprawdź Content-Type
@@ -198,8 +192,13 @@ class SecurityValidator:
         except Exception as e:
             return False, f"Błąd sprawdzania pliku: {str(e)}"
     
-    def calculate_file_hash(self, file_path):
-        """Oblicz hash pliku dla późniejszej weryfikacji"""
+    def calculate_file_hash(self, file_path, digests=None):
+        """Oblicz hash pliku dla późniejszej weryfikacji
+        
+        digests - skróty z pobierania (item['digests']); SHA-256 z nich bez czytania pliku
+        """
+        if digests and digests.get('sha256'):
+            return digests['sha256']
         try:
             hash_sha256 = hashlib.sha256()
             with open(file_path, "rb") as f:
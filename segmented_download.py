@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Pobieranie segmentowe przez HTTP Range
+- Sprawdzenie obsługi Range (odpowiedź 206 + Content-Range); 200 na zakres - RangeNotSupportedError
+- Podział pliku na N zakresów pobieranych równolegle
+- Zapis każdego segmentu pod jego offsetem (os.pwrite) w prealokowanym pliku
+- Adaptacja: wolny segment jest dzielony, a wolny wątek przejmuje jego drugą połowę
+- Wznawianie od zapisanych zakresów (punkty kontrolne co kilka MB)
+"""
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import requests
+
+from buffer_pool import iter_into
+from file_writer import FileWriter
+from http_pool import get_session
+from retry_policy import DownloadInterrupted
+
+class SegmentedDownloadError(Exception):
+    """Błąd pobierania segmentowego"""
+
+
+class RangeNotSupportedError(SegmentedDownloadError):
+    """Serwer odpowiedział na żądanie zakresu pełną treścią (HTTP 200) - pobieraj jednym strumieniem"""
+
+
+class Segment:
+    """Zakres bajtów [start, end]: position - zarezerwowane, written - zapisane na dysk"""
+
+    __slots__ = ('start', 'end', 'position', 'written')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.position = start
+        self.written = start
+
+    @property
+    def remaining(self):
+        return max(0, self.end + 1 - self.position)
+
+
+class _TransferState:
+    def __init__(self, url, writer, total_size, segments, progress, should_continue,
+                 checkpoint, headers, throttle=None):
+        self.url = url
+        self.writer = writer
+        self.total_size = total_size
+        self.segments = segments
+        self.progress = progress
+        self.should_continue = should_continue
+        self.checkpoint = checkpoint
+        self.headers = headers or {}
+        self.throttle = throttle
+        self.lock = threading.Lock()
+        self.checkpoint_lock = threading.Lock()
+        self.downloaded = total_size - sum(segment.remaining for segment in segments)
+        self.splits = 0
+        self.error = None
+
+    def written_ranges(self):
+        """Zakresy jeszcze niezapisane na dysk i liczba zapisanych bajtów (pod self.lock)"""
+        ranges = [(s.written, s.end) for s in self.segments if s.written <= s.end]
+        missing = sum(end + 1 - start for start, end in ranges)
+        return ranges, self.total_size - missing
+
+
+class SegmentedDownloader:
+    def __init__(self, segments=4, min_segment_size=1024*1024, chunk_size=64*1024,
+                 timeout=30, max_workers=16, session=None):
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+        self.session = session or get_session()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        # Statystyki ostatniego transferu
+        self.last_stats = {}
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="download-segment")
+            return self._executor
+
+    def probe(self, url, session=None):
+        """Sprawdź obsługę Range. Zwraca całkowity rozmiar pliku lub None."""
+        info = self.probe_info(url, session=session)
+        return info['total_size'] if info else None
+
+    def probe_info(self, url, session=None):
+        """Sprawdź obsługę Range. Zwraca rozmiar i walidatory (ETag/Last-Modified) lub None."""
+        session = session or self.session
+        try:
+            response = session.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                                   timeout=self.timeout)
+            try:
+                if response.status_code != 206:
+                    return None
+                match = re.match(r'bytes\s+0-0/(\d+)', response.headers.get('content-range', ''))
+                if not match:
+                    return None
+                return {
+                    'total_size': int(match.group(1)),
+                    'etag': response.headers.get('etag'),
+                    'last_modified': response.headers.get('last-modified')
+                }
+            finally:
+                response.close()
+        except requests.exceptions.RequestException:
+            return None
+
+    def split(self, total_size, segments=None):
+        """Podziel rozmiar pliku na równe zakresy (nie mniejsze niż min_segment_size)"""
+        segments = segments or self.segments
+        count = max(1, min(segments, total_size // max(self.min_segment_size, 1)))
+        size = total_size // count
+        ranges = []
+        for i in range(count):
+            start = i * size
+            end = total_size - 1 if i == count - 1 else start + size - 1
+            ranges.append(Segment(start, end))
+        return ranges
+
+    def download(self, url, file_path, total_size, progress=None, should_continue=None,
+                 ranges=None, checkpoint=None, headers=None, throttle=None):
+        """Pobierz plik segmentami. Zwraca liczbę pobranych bajtów.
+        
+        ranges - pozostałe zakresy [(start, end)] przy wznawianiu,
+        checkpoint(ranges, bytes_received, force) - zapis stanu co kilka MB,
+        headers - dodatkowe nagłówki żądań segmentów (np. If-Range),
+        throttle(bytes) - ogranicznik przepustowości wspólny dla wszystkich segmentów.
+        """
+        if ranges:
+            segments = self._rebalance([Segment(start, end) for start, end in ranges])
+        else:
+            segments = self.split(total_size)
+
+        # Prealokacja (błąd braku miejsca przed pierwszym żądaniem) - każdy segment
+        # pisze pod swoim offsetem przez wspólny deskryptor
+        writer = FileWriter(file_path, truncate=not ranges)
+        try:
+            writer.preallocate(total_size)
+        except OSError:
+            writer.close()
+            raise
+
+        state = _TransferState(url, writer, total_size, segments, progress,
+                               should_continue or (lambda: True), checkpoint, headers, throttle)
+
+        executor = self._get_executor()
+        futures = [executor.submit(self._worker, state, segment) for segment in list(segments)]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            if state.checkpoint and (state.error is not None or state.downloaded != total_size):
+                self._checkpoint(state, force=True)
+            writer.close()
+
+        self.last_stats = {
+            'segments': len(futures),
+            'splits': state.splits,
+            'downloaded': state.downloaded
+        }
+
+        if state.error is not None:
+            raise state.error
+        if state.downloaded != total_size:
+            raise SegmentedDownloadError(
+                f"Pobrano niepełny plik ({state.downloaded}/{total_size} bajtów)")
+        return state.downloaded
+
+    def _rebalance(self, segments):
+        """Dziel największe zakresy, aż będzie ich tyle, ile połączeń"""
+        while len(segments) < self.segments:
+            largest = max(segments, key=lambda s: s.remaining)
+            if largest.remaining < 2 * self.min_segment_size:
+                break
+            middle = largest.position + largest.remaining // 2
+            segments.append(Segment(middle, largest.end))
+            largest.end = middle - 1
+        return segments
+
+    def _worker(self, state, segment):
+        """Pobieraj przydzielony segment, potem przejmuj pracę najwolniejszych"""
+        try:
+            while segment is not None and state.error is None:
+                self._fetch_segment(state, segment)
+                segment = self._steal(state)
+        except Exception as e:
+            with state.lock:
+                if state.error is None:
+                    state.error = e
+
+    def _steal(self, state):
+        """Podziel segment z największą pozostałą pracą i przejmij jego drugą połowę"""
+        with state.lock:
+            victim = max(state.segments, key=lambda s: s.remaining, default=None)
+            if victim is None or victim.remaining < 2 * self.min_segment_size:
+                return None
+
+            middle = victim.position + victim.remaining // 2
+            stolen = Segment(middle, victim.end)
+            victim.end = middle - 1
+            state.segments.append(stolen)
+            state.splits += 1
+            return stolen
+
+    def _fetch_segment(self, state, segment):
+        if segment.remaining == 0:
+            return
+
+        headers = dict(state.headers)
+        headers['Range'] = f"bytes={segment.position}-{segment.end}"
+        response = self.session.get(state.url, headers=headers, stream=True,
+                                           timeout=self.timeout)
+        with response:
+            if response.status_code == 200:
+                raise RangeNotSupportedError("Serwer zignorował nagłówek Range (HTTP 200)")
+            if response.status_code != 206:
+                raise SegmentedDownloadError(
+                    f"Serwer nie zwrócił zakresu (HTTP {response.status_code})")
+
+            # Fragmenty najwyżej min_segment_size - przy podziale segmentu marnujemy mało danych
+            chunks = iter_into(response, minimum=self.chunk_size, maximum=self.min_segment_size)
+            with closing(chunks):
+                for chunk in chunks:
+                    if state.error is not None:
+                        return
+                    if not state.should_continue():
+                        raise DownloadInterrupted("Pobieranie przerwane")
+
+                    with state.lock:
+                        # Koniec segmentu mógł zostać przesunięty przez podział
+                        allowed = segment.remaining
+                        if allowed <= 0:
+                            break
+                        if len(chunk) > allowed:
+                            chunk = chunk[:allowed]
+                        offset = segment.position
+                        segment.position += len(chunk)
+                        state.downloaded += len(chunk)
+                        downloaded = state.downloaded
+
+                    if state.throttle:
+                        state.throttle(len(chunk))
+                    # pwrite - bez buforowania, zapisane bajty od razu trafiają do systemu
+                    state.writer.write_at(offset, chunk)
+                    with state.lock:
+                        segment.written += len(chunk)
+
+                    if state.checkpoint:
+                        self._checkpoint(state)
+
+                    if state.progress:
+                        state.progress(downloaded, state.total_size)
+
+                    if segment.remaining == 0:
+                        break
+
+        if segment.remaining > 0 and state.error is None:
+            raise SegmentedDownloadError(
+                f"Serwer zakończył segment przedwcześnie ({segment.remaining} bajtów brakuje)")
+
+    def _checkpoint(self, state, force=False):
+        """Przekaż zapisane zakresy do punktu kontrolnego (jeden naraz)"""
+        if not state.checkpoint_lock.acquire(blocking=force):
+            return
+        try:
+            with state.lock:
+                ranges, written = state.written_ranges()
+            state.checkpoint(ranges, written, force)
+        finally:
+            state.checkpoint_lock.release()
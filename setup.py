@@ -38,6 +38,12 @@ setup(
         "psutil>=5.9.0",
     ],
     extras_require={
+        "async": [
+            "aiohttp>=3.9.0",
+        ],
+        "xxhash": [
+            "xxhash>=3.0.0",
+        ],
         "dev": [
             "pytest>=7.0.0",
             "pytest-cov>=4.0.0",
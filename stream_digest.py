@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Skróty plików liczone w locie, podczas pobierania
+- MD5, SHA-256 i inne algorytmy hashlib (np. BLAKE2), opcjonalnie xxhash
+- Aktualizacja każdym odebranym fragmentem - bez ponownego czytania pliku
+  (wyjątek: pobieranie segmentowe - segmenty poza kolejnością, jeden przebieg po pliku)
+- Weryfikacja z nagłówkami Content-MD5, Digest (RFC 3230) i Repr-Digest (RFC 9530)
+"""
+
+import base64
+import binascii
+import hashlib
+import re
+
+try:
+    import xxhash
+except ImportError:  # Opcjonalna zależność - tylko dla algorytmów xxh*
+    xxhash = None
+
+DEFAULT_ALGORITHMS = ('md5', 'sha256')
+
+# Nazwy algorytmów z nagłówków HTTP -> nazwy hashlib
+_HEADER_ALGORITHMS = {
+    'md5': 'md5',
+    'sha': 'sha1',
+    'sha-256': 'sha256',
+    'sha-512': 'sha512',
+}
+
+
+class DigestMismatchError(Exception):
+    """Skrót pobranych danych różni się od podanego przez serwer"""
+
+
+def new_hash(algorithm):
+    """Obiekt skrótu dla nazwy z hashlib lub xxhash (xxh64, xxh3_64, xxh128)"""
+    if algorithm.startswith('xxh'):
+        if xxhash is None:
+            raise ImportError("Algorytmy xxh* wymagają pakietu xxhash (pip install xxhash)")
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def _decode(value):
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def parse_digest_headers(headers, full_body=True):
+    """Oczekiwane skróty całego pliku z nagłówków odpowiedzi: {algorytm: bajty}.
+
+    Content-MD5 opisuje treść tej odpowiedzi - uwzględniany tylko dla pełnej treści (full_body).
+    Digest i Repr-Digest opisują cały zasób, także przy odpowiedzi 206.
+    """
+    expected = {}
+
+    for item in headers.get('digest', '').split(','):
+        name, _, value = item.partition('=')
+        algorithm = _HEADER_ALGORITHMS.get(name.strip().lower())
+        digest = _decode(value) if algorithm else None
+        if digest:
+            expected[algorithm] = digest
+
+    for name, value in re.findall(r'([\w-]+)\s*=\s*:([A-Za-z0-9+/=]+):', headers.get('repr-digest', '')):
+        algorithm = _HEADER_ALGORITHMS.get(name.lower())
+        digest = _decode(value) if algorithm else None
+        if digest:
+            expected[algorithm] = digest
+
+    if full_body and headers.get('content-md5'):
+        digest = _decode(headers['content-md5'])
+        if digest:
+            expected.setdefault('md5', digest)
+
+    return expected
+
+
+class StreamingDigest:
+    def __init__(self, algorithms=DEFAULT_ALGORITHMS, expected=None):
+        """expected - {algorytm: bajty} z nagłówków; te algorytmy są liczone zawsze"""
+        self.expected = dict(expected or {})
+        names = list(dict.fromkeys(list(algorithms) + list(self.expected)))
+        self.hashes = {name: new_hash(name) for name in names}
+        self.size = 0
+
+    def update(self, data):
+        for digest in self.hashes.values():
+            digest.update(data)
+        self.size += len(data)
+
+    def update_from_file(self, path, start=0, end=None, chunk_size=1024*1024):
+        """Dolicz bajty [start, end) z pliku - np. część pobraną przez wcześniejszą próbę"""
+        with open(path, 'rb', buffering=0) as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            buffer = bytearray(chunk_size)
+            view = memoryview(buffer)
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else min(chunk_size, remaining)
+                received = f.readinto(view[:size])
+                if not received:
+                    break
+                self.update(view[:received])
+                if remaining is not None:
+                    remaining -= received
+
+    def hexdigests(self):
+        return {name: digest.hexdigest() for name, digest in self.hashes.items()}
+
+    def verify(self):
+        """Porównaj z oczekiwanymi skrótami. Zwraca listę zweryfikowanych algorytmów."""
+        verified = []
+        for name, expected in self.expected.items():
+            actual = self.hashes[name].digest()
+            if actual != expected:
+                raise DigestMismatchError(
+                    f"Niezgodny skrót {name}: oczekiwano {expected.hex()}, otrzymano {actual.hex()}")
+            verified.append(name)
+        return verified
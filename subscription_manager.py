@@ -44,6 +44,9 @@ class SubscriptionManager:
             'cloud_backup': True             # Backup w chmurze
         }
         
+        # Powiadamiane o zmianie limitów (np. DownloadManager.apply_subscription_limits)
+        self.listeners = []
+        
         self.daily_stats = {
             'downloads_today': 0,
             'last_reset_date': datetime.now().date().isoformat()
@@ -109,6 +112,19 @@ class SubscriptionManager:
         """Pobierz aktualne limity"""
         return self.premium_features if self.is_premium else self.freemium_limits
     
+    def add_listener(self, callback):
+        """Dodaj callback wywoływany z nowymi limitami po zmianie planu"""
+        self.listeners.append(callback)
+    
+    def notify_limits_changed(self):
+        """Przekaż aktualne limity wszystkim słuchaczom"""
+        limits = self.get_limits()
+        for callback in self.listeners:
+            try:
+                callback(limits)
+            except Exception as e:
+                print(f"❌ Error applying limits: {e}")
+    
     def can_download(self):
         """Sprawdź czy użytkownik może pobrać kolejny plik"""
         self.reset_daily_counter_if_needed()
@@ -160,6 +176,7 @@ class SubscriptionManager:
         
         self.is_premium = True
         self.save_subscription()
+        self.notify_limits_changed()
         
         print(f"🎉 Premium activated until {expiry_date.strftime('%Y-%m-%d')}")
         analytics_service.track_event('premium_activated', {
@@ -177,6 +194,7 @@ class SubscriptionManager:
         
         self.is_premium = False
         self.save_subscription()
+        self.notify_limits_changed()
         
         print("🔓 Premium deactivated")
         analytics_service.track_event('premium_deactivated')
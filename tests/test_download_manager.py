@@ -0,0 +1,1950 @@
+import base64
+import hashlib
+import re
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+from collections import Counter
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+from domain_blocklist import DomainBlocklist, compile_blocklist
+from download_history import DownloadHistory, HistoryArchive
+from download_manager import DownloadManager
+from download_queue import DownloadQueue, host_of
+from http_pool import HttpPool
+from bandwidth import BandwidthGovernor
+from buffer_pool import BufferPool, buffer_pool, iter_into
+from circuit_breaker import CircuitBreaker
+from config import get_config
+from content_store import ContentStore
+from file_writer import FileWriter
+from partial_download import PartialDownload
+from progress_tracker import ProgressTracker
+from queue_journal import QueueJournal
+from rate_limiter import RateLimiter, SqliteBucketStore
+from retry_policy import RetryPolicy, classify_status, parse_retry_after
+from segmented_download import SegmentedDownloader
+from security_validator import SecurityValidator
+from url_canonical import canonical_url
+from url_classifier import UrlClassifier, DomainSet
+import async_download_engine
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class RangeHandler(QuietHandler):
+    """Handler obsługujący Range/If-Range (opcjonalnie dławiący lub zrywający transfer)"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    slow_start = None
+    slow_delay = 0.05
+    drop_first_after = None  # Zerwij pierwsze żądanie GET po tylu bajtach
+    etag = '"v1"'
+    requests_log = None
+    extra_headers = {}
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def do_HEAD(self):
+        if self.requests_log is not None:
+            self.requests_log.append('HEAD')
+        self._serve(body=False)
+
+    def _serve(self, body):
+        path = Path(self.directory) / self.path.lstrip('/').split('?')[0]
+        if not path.is_file():
+            self.send_error(404)
+            return
+
+        data = path.read_bytes()
+        if body and self.requests_log is not None:
+            self.requests_log.append(self.headers.get('Range'))
+
+        start, end, status = 0, len(data) - 1, 200
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if match and (if_range is None or if_range == self.etag):
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(data)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        for name, value in self.extra_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if not body:
+            return
+        if self.drop_first_after is not None and len(self.requests_log) == 1:
+            self.wfile.write(data[start:start + self.drop_first_after])
+            self.close_connection = True
+            return
+        for offset in range(start, end + 1, 64 * 1024):
+            if self.slow_start is not None and start == self.slow_start:
+                time.sleep(self.slow_delay)
+            try:
+                self.wfile.write(data[offset:min(offset + 64 * 1024, end + 1)])
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+
+class LocalServer:
+    """Lokalny serwer HTTP udostępniający katalog z plikami testowymi"""
+
+    def __init__(self, directory, handler=QuietHandler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=str(directory)))
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.httpd.server_port}/{name}"
+
+
+def make_item(url, priority=0):
+    return {'url': url, 'download_dir': Path("/tmp"), 'priority': priority,
+            'attempts': 0, 'max_attempts': 3}
+
+
+class TestDownloadQueue(unittest.TestCase):
+    """Testy kolejki priorytetowej"""
+
+    def test_priority_then_fifo_order(self):
+        """Wyższy priorytet pierwszy, przy równym - kolejność dodania"""
+        queue = DownloadQueue()
+        for url, priority in [("a", 0), ("b", 2), ("c", 0), ("d", 2)]:
+            queue.push(make_item(url, priority))
+
+        order = [queue.pop()['url'] for _ in range(4)]
+        self.assertEqual(order, ["b", "d", "a", "c"])
+        self.assertIsNone(queue.pop())
+
+    def test_push_many_merges_batch(self):
+        """Partia scalana z kopcem - ta sama kolejność co pojedyncze push, bez duplikatów"""
+        queue = DownloadQueue()
+        queue.push(make_item("a", 1))
+        added = queue.push_many([make_item(url, priority) for url, priority
+                                 in [("b", 2), ("a", 5), ("c", 0), ("d", 2), ("b", 0)]])
+
+        self.assertEqual([item['url'] for item in added], ["b", "c", "d"])
+        self.assertEqual(len(queue), 4)
+        self.assertEqual([queue.pop()['url'] for _ in range(4)], ["b", "d", "a", "c"])
+
+    def test_duplicates_across_states(self):
+        """Duplikaty odrzucane w kolejce, w trakcie pobierania i po pobraniu"""
+        queue = DownloadQueue()
+        self.assertTrue(queue.push(make_item("a")))
+        self.assertFalse(queue.push(make_item("a")))
+
+        item = queue.pop()
+        self.assertTrue(queue.is_active("a"))
+        self.assertFalse(queue.push(make_item("a")))
+
+        queue.mark_completed(item)
+        self.assertFalse(queue.push(make_item("a")))
+
+        queue.clear_completed()
+        self.assertTrue(queue.push(make_item("a")))
+
+    def test_remove_and_requeue(self):
+        """Usunięte elementy są pomijane, ponowione wracają do kolejki"""
+        queue = DownloadQueue()
+        queue.push(make_item("a", 1))
+        queue.push(make_item("b"))
+        queue.remove("a")
+        self.assertEqual(len(queue), 1)
+
+        item = queue.pop()
+        self.assertEqual(item['url'], "b")
+        self.assertTrue(queue.requeue(item))
+        self.assertEqual(queue.pop()['url'], "b")
+
+
+    def test_hosts_share_slots_fairly(self):
+        """Seria linków z jednego hosta nie blokuje innych hostów; priorytet nadal wygrywa"""
+        queue = DownloadQueue()
+        for i in range(5):
+            queue.push(make_item(f"https://big.com/{i}.mp4"))
+        queue.push(make_item("https://small.org/1.mp4"))
+        queue.push(make_item("https://small.org/2.mp4"))
+        queue.push(make_item("https://urgent.net/1.mp4", priority=5))
+
+        hosts = [host_of(queue.pop()['url']) for _ in range(5)]
+        self.assertEqual(hosts, ["urgent.net", "big.com", "small.org", "big.com", "small.org"])
+
+    def test_per_host_cap(self):
+        """Limit aktywnych pobrań per host - zwolnienie slotu odblokowuje hosta"""
+        queue = DownloadQueue(max_per_host=2)
+        for i in range(4):
+            queue.push(make_item(f"https://big.com/{i}.mp4"))
+
+        first, second = queue.pop(), queue.pop()
+        self.assertIsNone(queue.pop())
+        self.assertFalse(queue.has_ready())
+        self.assertEqual(queue.host_stats()["big.com"], {'queued': 2, 'active': 2, 'limit': 2})
+
+        queue.mark_completed(first)
+        self.assertEqual(queue.pop()['url'], "https://big.com/2.mp4")
+
+    def test_dispatch_does_not_scan_hosts(self):
+        """Wybór elementu nie przegląda wszystkich hostów; has_ready() i pop() liczą go raz"""
+        checked = Counter()
+        queue = DownloadQueue(max_per_host=1)
+        queue.host_gate = lambda host: checked.update([host]) or True
+        queue.push_many(make_item(f"https://h{i}.example.com/{n}.mp4")
+                        for n in range(3) for i in range(5000))
+
+        popped = []
+        for _ in range(100):
+            self.assertTrue(queue.has_ready())
+            popped.append(queue.pop())
+        self.assertLess(sum(checked.values()), 1000)
+        self.assertEqual(len({host_of(item['url']) for item in popped}), 100)
+
+        # Host z wyczerpanym limitem wraca do wyboru po zwolnieniu slotu
+        queue.mark_completed(popped[0])
+        queue.push(make_item("https://h0.example.com/urgent.mp4", priority=5))
+        self.assertEqual(queue.pop()['url'], "https://h0.example.com/urgent.mp4")
+
+
+class TestDownloadManager(unittest.TestCase):
+    """Testy menedżera pobierania"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manager = DownloadManager()
+
+    def tearDown(self):
+        self.manager.stop_processing()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_add_many_reports_reason_per_url(self):
+        """add_many - jedna partia, powód odrzucenia dla każdego URL-a, jedno zdarzenie"""
+        self.manager.rate_limit_per_minute = 3
+        self.manager.add_to_queue("https://a.com/old.mp4", self.temp_dir)
+        batches = []
+        self.manager.add_callback('queued_batch', batches.append)
+
+        results = self.manager.add_many([
+            "https://a.com/1.mp4", "ftp://a.com/2.mp4", "https://a.com/1.mp4",
+            "https://a.com/old.mp4", "https://b.com/3.mp4", "https://b.com/4.mp4",
+        ], self.temp_dir, priority=2)
+
+        accepted = [url for url, ok, _ in results if ok]
+        self.assertEqual(accepted, ["https://a.com/1.mp4", "https://b.com/3.mp4"])
+        reasons = [reason for _, ok, reason in results if not ok]
+        self.assertTrue(reasons[0].startswith("Nieprawidłowy URL"))
+        self.assertEqual(reasons[1], "Duplikat w tej partii")
+        self.assertEqual(reasons[2], "Już w kolejce lub pobrany")
+        self.assertTrue(reasons[3].startswith("Rate limit"))
+        self.assertEqual(batches, [accepted])
+        self.assertEqual(self.manager.queue.peek()['url'], "https://a.com/1.mp4")
+
+    def test_single_request_per_download(self):
+        """Pobranie to jedno żądanie GET - bez osobnego HEAD"""
+        serve_dir = Path(tempfile.mkdtemp())
+        (serve_dir / "clip.mp4").write_bytes(b"v" * 10_000)
+        (serve_dir / "huge.mp4").write_bytes(b"v" * 20_000)
+        log = []
+        handler = type("LoggingHandler", (RangeHandler,), {'requests_log': log})
+        errors = []
+        self.manager.max_file_size = 15_000
+        self.manager.add_callback('error', lambda url, message: errors.append(message))
+
+        try:
+            with LocalServer(serve_dir, handler) as server:
+                self.manager.add_to_queue(server.url("clip.mp4"), self.temp_dir)
+                self.manager.add_to_queue(server.url("huge.mp4"), self.temp_dir)
+                self.manager.start_processing()
+                self.manager.stop_processing(drain=True, timeout=10)
+        finally:
+            shutil.rmtree(serve_dir, ignore_errors=True)
+
+        self.assertNotIn('HEAD', log)
+        self.assertEqual(len(self.manager.completed), 1)
+        self.assertTrue(any("zbyt duży" in message for message in errors))
+        self.assertFalse((Path(self.temp_dir) / "huge.mp4.part").exists())
+
+    def test_oversized_chunked_response_is_not_retried(self):
+        """Odpowiedź chunked (bez Content-Length) ponad limit - 'rejected', bez ponawiania"""
+        log = []
+
+        class ChunkedHandler(QuietHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                log.append(self.path)
+                self.send_response(200)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for _ in range(10):
+                    chunk = b"v" * 4096
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        for engine in ('threaded', 'asyncio'):
+            with self.subTest(engine=engine):
+                log.clear()
+                manager = DownloadManager(engine=engine)
+                manager.max_file_size = 15_000
+                errors = []
+                manager.add_callback('error', lambda url, message: errors.append(message))
+                with LocalServer(self.temp_dir, ChunkedHandler) as server:
+                    manager.add_to_queue(server.url(f"stream-{engine}.mp4"), self.temp_dir)
+                    manager.start_processing()
+                    self.assertTrue(manager.stop_processing(drain=True, timeout=10))
+
+                self.assertEqual(len(log), 1)
+                self.assertEqual(len(manager.failed), 1)
+                self.assertEqual(manager.failed[0]['attempts'], 1)
+                self.assertTrue(any("przekroczył limit" in message for message in errors))
+                self.assertTrue(errors[-1].startswith("Błąd bez ponawiania (rejected)"))
+
+    def test_stop_without_drain_keeps_attempt(self):
+        """stop_processing(drain=False) w trakcie transferu: element wraca do kolejki bez
+        zużycia próby, w obu silnikach"""
+        serve_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, serve_dir, ignore_errors=True)
+        (serve_dir / "clip.mp4").write_bytes(b"v" * (2 * 1024 * 1024))
+        handler = type("SlowHandler", (RangeHandler,), {'slow_start': 0, 'slow_delay': 0.05})
+
+        for engine in ('threaded', 'asyncio'):
+            with self.subTest(engine=engine):
+                manager = DownloadManager(engine=engine, segments=1)
+                download_dir = Path(self.temp_dir) / engine
+                with LocalServer(serve_dir, handler) as server:
+                    manager.add_to_queue(server.url("clip.mp4"), download_dir)
+                    manager.start_processing()
+                    deadline = time.monotonic() + 5
+                    while not (download_dir / "clip.mp4.part").exists() and time.monotonic() < deadline:
+                        time.sleep(0.01)
+                    manager.stop_processing(drain=False, timeout=5)
+
+                self.assertEqual(manager.active_downloads, 0)
+                self.assertEqual(len(manager.failed), 0)
+                self.assertEqual([item['attempts'] for item in manager.queue], [0])
+
+    def test_add_to_queue_rejects_duplicates(self):
+        """Ten sam URL nie trafia do kolejki dwa razy"""
+        url = "https://example.com/video.mp4"
+        self.assertTrue(self.manager.add_to_queue(url, self.temp_dir))
+        self.assertFalse(self.manager.add_to_queue(url, self.temp_dir))
+        self.assertEqual(self.manager.get_queue_status()['queue_size'], 1)
+
+    def test_burst_dispatch_without_polling(self):
+        """Seria elementów startuje od razu do limitu równoległości"""
+        self.manager.max_concurrent = 10
+        self.manager.rate_limit_per_minute = 100
+        release = threading.Event()
+        started = []
+
+        def fake_download(item):
+            started.append(item['url'])
+            release.wait(5)
+            return True
+
+        with patch.object(self.manager, '_download_file', side_effect=fake_download):
+            self.manager.start_processing()
+            for i in range(20):
+                self.manager.add_to_queue(f"https://example.com/{i}.mp4", self.temp_dir)
+
+            deadline = time.time() + 0.3
+            while len(started) < 10 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(started), 10)
+
+            release.set()
+            deadline = time.time() + 1
+            while len(self.manager.completed) < 20 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(self.manager.completed), 20)
+
+        stats = self.manager.get_latency_stats()
+        self.assertEqual(stats['queue_wait']['count'], 20)
+
+    def test_per_host_cap_in_manager(self):
+        """Przy limicie per host wolne sloty trafiają do innych hostów"""
+        manager = DownloadManager(max_concurrent=4, max_per_host=2)
+        manager.rate_limit_per_minute = 100
+        release = threading.Event()
+        started = []
+
+        def fake_download(item):
+            started.append(host_of(item['url']))
+            release.wait(5)
+            return True
+
+        with patch.object(manager, '_download_file', side_effect=fake_download):
+            for i in range(10):
+                manager.add_to_queue(f"https://big.com/{i}.mp4", self.temp_dir)
+            manager.add_to_queue("https://other.org/1.mp4", self.temp_dir)
+            manager.start_processing()
+
+            deadline = time.time() + 1
+            while len(started) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            self.assertEqual(sorted(started), ["big.com", "big.com", "other.org"])
+            hosts = manager.get_queue_status()['hosts']
+            self.assertEqual(hosts["big.com"]['active'], 2)
+            self.assertEqual(hosts["big.com"]['queued'], 8)
+
+            release.set()
+            self.assertTrue(manager.stop_processing(drain=True, timeout=5))
+        self.assertEqual(len(manager.completed), 11)
+
+    def test_worker_pool_reuses_threads_and_drains(self):
+        """Stała pula wątków obsługuje całą kolejkę i kończy się po drenowaniu"""
+        self.manager.max_concurrent = 3
+        self.manager.rate_limit_per_minute = 100
+        threads = set()
+
+        def fake_download(item):
+            threads.add(threading.current_thread().name)
+            time.sleep(0.01)
+            return True
+
+        with patch.object(self.manager, '_download_file', side_effect=fake_download):
+            for i in range(30):
+                self.manager.add_to_queue(f"https://example.com/{i}.mp4", self.temp_dir)
+            self.manager.start_processing()
+            self.assertTrue(self.manager.stop_processing(drain=True, timeout=5))
+
+        self.assertEqual(len(self.manager.completed), 30)
+        self.assertLessEqual(len(threads), 3)
+        self.assertEqual(self.manager.workers, [])
+
+
+class TestSegmentedDownload(unittest.TestCase):
+    """Testy pobierania segmentowego przez HTTP Range"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+        self.payload = bytes(range(256)) * (4 * 1024 * 4)  # 4 MB
+        (self.serve_dir / "big.mp4").write_bytes(self.payload)
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def test_segments_reassemble_file(self):
+        downloader = SegmentedDownloader(segments=4, min_segment_size=256 * 1024)
+        target = self.download_dir / "big.mp4"
+
+        with LocalServer(self.serve_dir, RangeHandler) as server:
+            size = downloader.probe(server.url("big.mp4"))
+            self.assertEqual(size, len(self.payload))
+            downloader.download(server.url("big.mp4"), target, size)
+
+        self.assertEqual(target.read_bytes(), self.payload)
+        self.assertEqual(downloader.last_stats['segments'], 4)
+
+    def test_slow_segment_is_split(self):
+        """Wolny segment zostaje podzielony i przejęty przez szybsze wątki"""
+        handler = type("SlowHandler", (RangeHandler,), {'slow_start': 0})
+        downloader = SegmentedDownloader(segments=4, min_segment_size=128 * 1024)
+        target = self.download_dir / "big.mp4"
+
+        with LocalServer(self.serve_dir, handler) as server:
+            downloader.download(server.url("big.mp4"), target, len(self.payload))
+
+        self.assertEqual(target.read_bytes(), self.payload)
+        self.assertGreater(downloader.last_stats['splits'], 0)
+
+    def test_resume_fetches_only_missing_ranges(self):
+        """Wznowienie segmentowe pobiera tylko brakujące zakresy"""
+        half = len(self.payload) // 2
+        target = self.download_dir / "big.mp4.part"
+        target.write_bytes(self.payload[:half])
+        log = []
+        handler = type("LoggingHandler", (RangeHandler,), {'requests_log': log})
+        checkpoints = []
+        downloader = SegmentedDownloader(segments=4, min_segment_size=256 * 1024)
+
+        with LocalServer(self.serve_dir, handler) as server:
+            downloader.download(server.url("big.mp4"), target, len(self.payload),
+                                ranges=[(half, len(self.payload) - 1)],
+                                checkpoint=lambda ranges, done, force: checkpoints.append(done))
+
+        self.assertEqual(target.read_bytes(), self.payload)
+        starts = [int(re.match(r'bytes=(\d+)-', r).group(1)) for r in log]
+        self.assertGreaterEqual(len(starts), 4)
+        self.assertTrue(all(start >= half for start in starts))
+
+    def test_manager_uses_segments_for_large_files(self):
+        manager = DownloadManager(segment_threshold=1024 * 1024)
+        completed = []
+        manager.add_callback('complete', lambda url, path: completed.append(path))
+
+        with LocalServer(self.serve_dir, RangeHandler) as server:
+            manager.add_to_queue(server.url("big.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+
+        self.assertEqual(len(completed), 1)
+        self.assertEqual(Path(completed[0]).read_bytes(), self.payload)
+        self.assertEqual(manager.segmented.last_stats['downloaded'], len(self.payload))
+
+
+    def test_ranged_200_falls_back_to_single_stream(self):
+        """Accept-Ranges, ale żądanie zakresu dostaje 200 z całym plikiem - jeden strumień"""
+        log = []
+        handler = type("NoRangeHandler", (QuietHandler,), {
+            'protocol_version': "HTTP/1.1",
+            'end_headers': lambda self: (log.append(self.headers.get('Range')),
+                                         self.send_header('Accept-Ranges', 'bytes'),
+                                         QuietHandler.end_headers(self))[-1]
+        })
+        manager = DownloadManager(segment_threshold=1024 * 1024)
+        completed, errors = [], []
+        manager.add_callback('complete', lambda url, path: completed.append(path))
+        manager.add_callback('error', lambda url, message: errors.append(message))
+
+        with LocalServer(self.serve_dir, handler) as server:
+            manager.add_to_queue(server.url("big.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(completed), 1)
+        self.assertEqual(Path(completed[0]).read_bytes(), self.payload)
+        self.assertEqual(manager.completed.recent[-1]['attempts'], 0)  # Bez ponawiania
+        self.assertTrue(any(log), "pobieranie segmentowe nie zostało podjęte")
+        self.assertIsNone(log[-1])
+        self.assertFalse((self.download_dir / "big.mp4.part").exists())
+
+
+class TestFileWriter(unittest.TestCase):
+    """Testy prealokacji i zapisu pod offsetami"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def test_positional_writes_into_preallocated_file(self):
+        path = self.download_dir / "file.bin"
+        with FileWriter(path, truncate=True) as writer:
+            writer.preallocate(10)
+            self.assertEqual(path.stat().st_size, 10)
+            writer.write_at(5, b"world")
+            writer.write_at(0, memoryview(b"hello"))
+        self.assertEqual(path.read_bytes(), b"helloworld")
+
+    def test_insufficient_space_fails_before_fetching_body(self):
+        """Brak miejsca - błąd bez ponawiania i bez pobierania treści"""
+        (self.serve_dir / "clip.mp4").write_bytes(b"v" * 64 * 1024)
+        manager = DownloadManager(segments=1)
+        errors = []
+        manager.add_callback('error', lambda url, message: errors.append(message))
+        log = []
+        handler = type("LoggingHandler", (RangeHandler,), {'requests_log': log})
+        usage = shutil.disk_usage(self.download_dir)._replace(free=1024)
+
+        with patch('file_writer.shutil.disk_usage', return_value=usage), \
+                LocalServer(self.serve_dir, handler) as server:
+            manager.add_to_queue(server.url("clip.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+
+        self.assertEqual(len(log), 1)
+        self.assertEqual(len(manager.failed), 1)
+        self.assertIn("Za mało miejsca", errors[-1])
+        self.assertEqual(list(self.download_dir.iterdir()), [])
+
+
+class TestBufferPool(unittest.TestCase):
+    """Testy odczytu do buforów z ograniczonej puli"""
+
+    def test_pool_is_bounded(self):
+        pool = BufferPool(buffer_size=1024, max_buffers=1)
+        with pool.buffer():
+            with self.assertRaises(TimeoutError):
+                pool.acquire(timeout=0.05)
+        self.assertEqual(pool.get_stats()['allocated'], 1)
+
+    def test_exhausted_pool_overflows_instead_of_blocking(self):
+        """Wyczerpana pula - bufor tymczasowy, pula nie rośnie ponad limit"""
+        pool = BufferPool(buffer_size=1024, max_buffers=1)
+        with pool.buffer():
+            start = time.monotonic()
+            extra = pool.acquire(timeout=0.05, overflow=True)
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual(len(extra), 1024)
+            pool.release(extra)
+        stats = pool.get_stats()
+        self.assertEqual(stats['overflows'], 1)
+        self.assertEqual(stats['allocated'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(len(pool.free), 1)
+
+    def test_manager_reserves_buffers_for_concurrency(self):
+        manager = DownloadManager(max_concurrent=8, segments=4)
+        self.assertGreaterEqual(buffer_pool.max_buffers, 32)
+        manager.set_max_concurrent(10)
+        self.assertGreaterEqual(buffer_pool.max_buffers, 40)
+
+    def test_iter_into_reuses_one_buffer_and_keeps_connection(self):
+        serve_dir = Path(tempfile.mkdtemp())
+        try:
+            payload = bytes(range(256)) * 8000
+            (serve_dir / "clip.mp4").write_bytes(payload)
+            http = HttpPool()
+            pool = BufferPool(buffer_size=256 * 1024, max_buffers=2)
+            with LocalServer(serve_dir, RangeHandler) as server:
+                for _ in range(2):
+                    received = bytearray()
+                    response = http.get(server.url("clip.mp4"), stream=True, timeout=10)
+                    for chunk in iter_into(response, pool=pool):
+                        received += chunk
+                    self.assertEqual(bytes(received), payload)
+        finally:
+            shutil.rmtree(serve_dir, ignore_errors=True)
+
+        self.assertEqual(pool.get_stats()['allocated'], 1)
+        self.assertEqual(pool.get_stats()['in_use'], 0)
+        self.assertEqual(http.get_stats()['hits'], 1)
+
+
+class TestHttpPool(unittest.TestCase):
+    """Testy wspólnej puli połączeń"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+        for i in range(5):
+            (self.serve_dir / f"clip{i}.mp4").write_bytes(b"v" * 50_000)
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def test_repeated_downloads_reuse_connection(self):
+        """Kolejne pobrania z tego samego hosta używają otwartego połączenia"""
+        pool = HttpPool()
+        manager = DownloadManager(max_concurrent=1, http=pool)
+
+        with LocalServer(self.serve_dir, RangeHandler) as server:
+            for i in range(5):
+                manager.add_to_queue(server.url(f"clip{i}.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+
+        stats = manager.get_connection_stats()
+        self.assertEqual(len(manager.completed), 5)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 4)
+        host = f"127.0.0.1:{server.httpd.server_port}"
+        self.assertEqual(stats['by_host'][host]['misses'], 1)
+
+
+class TestResumableDownload(unittest.TestCase):
+    """Testy wznawiania pobierania z plików .part"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+        self.payload = bytes(range(256)) * 4096  # 1 MB
+        (self.serve_dir / "clip.mp4").write_bytes(self.payload)
+        self.manager = DownloadManager(segments=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def download(self, handler):
+        with LocalServer(self.serve_dir, handler) as server:
+            self.manager.add_to_queue(server.url("clip.mp4"), self.download_dir)
+            self.manager.start_processing()
+            self.manager.stop_processing(drain=True, timeout=10)
+
+    def test_retry_resumes_from_received_bytes(self):
+        """Po zerwanym połączeniu ponowna próba pobiera tylko brakującą część"""
+        log = []
+        handler = type("DroppingHandler", (RangeHandler,),
+                       {'drop_first_after': 300_000, 'requests_log': log})
+        self.download(handler)
+
+        self.assertEqual(len(log), 2)
+        self.assertIsNone(log[0])
+        resumed_from = int(re.match(r'bytes=(\d+)-$', log[1]).group(1))
+        self.assertTrue(0 < resumed_from <= 300_000)
+        self.assertEqual((self.download_dir / "clip.mp4").read_bytes(), self.payload)
+        self.assertFalse((self.download_dir / "clip.mp4.part").exists())
+        self.assertFalse((self.download_dir / "clip.mp4.part.json").exists())
+
+    def test_changed_resource_restarts_from_zero(self):
+        """Nieaktualny walidator (If-Range) - serwer odsyła cały plik"""
+        target = self.download_dir / "clip.mp4"
+        stale = PartialDownload(target, None)
+        with stale.open() as writer:
+            writer.write_at(0, b"x" * 1000)
+        stale.set_validators(len(self.payload), etag='"v0"')
+        log = []
+        handler = type("LoggingHandler", (RangeHandler,), {'requests_log': log})
+
+        with LocalServer(self.serve_dir, handler) as server:
+            stale.url = server.url("clip.mp4")
+            with FileWriter(stale.part_path) as writer:
+                stale.checkpoint(writer, 1000, force=True)
+            self.manager.add_to_queue(server.url("clip.mp4"), self.download_dir)
+            self.manager.start_processing()
+            self.manager.stop_processing(drain=True, timeout=10)
+
+        self.assertEqual(log, ["bytes=1000-"])
+        self.assertEqual(target.read_bytes(), self.payload)
+
+    def test_stale_part_past_end_restarts_from_zero(self):
+        """416 a .part dłuższy niż zasób (Content-Range: bytes */N) - od zera, w obu silnikach"""
+        engines = ['threaded'] + (['asyncio'] if async_download_engine.aiohttp is not None else [])
+        for engine in engines:
+            with self.subTest(engine=engine):
+                download_dir = Path(tempfile.mkdtemp())
+                self.addCleanup(shutil.rmtree, download_dir, ignore_errors=True)
+                target = download_dir / "clip.mp4"
+                stale_size = len(self.payload) + 1000
+                log = []
+                handler = type("LoggingHandler", (RangeHandler,), {'requests_log': log})
+                manager = DownloadManager(segments=1, engine=engine)
+                errors = []
+                manager.add_callback('error', lambda url, message: errors.append(message))
+
+                with LocalServer(self.serve_dir, handler) as server:
+                    stale = PartialDownload(target, server.url("clip.mp4"))
+                    with stale.open() as writer:
+                        writer.write_at(0, b"x" * stale_size)
+                    stale.set_validators(stale_size, etag=RangeHandler.etag)
+                    with FileWriter(stale.part_path) as writer:
+                        stale.checkpoint(writer, stale_size, force=True)
+                    manager.add_to_queue(server.url("clip.mp4"), download_dir)
+                    manager.start_processing()
+                    self.assertTrue(manager.stop_processing(drain=True, timeout=10))
+
+                self.assertEqual(errors, [])
+                self.assertEqual(log, [f"bytes={stale_size}-", None])
+                self.assertEqual(target.read_bytes(), self.payload)
+                self.assertFalse(stale.part_path.exists())
+                self.assertFalse(stale.state_path.exists())
+
+
+class TestStreamingDigest(unittest.TestCase):
+    """Testy skrótów liczonych podczas pobierania"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+        self.payload = bytes(range(256)) * 4096
+        (self.serve_dir / "clip.mp4").write_bytes(self.payload)
+        self.sha256 = hashlib.sha256(self.payload)
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def download(self, manager, **handler_attrs):
+        handler = type("DigestHandler", (RangeHandler,), handler_attrs)
+        errors = []
+        manager.add_callback('error', lambda url, message: errors.append(message))
+        with LocalServer(self.serve_dir, handler) as server:
+            manager.add_to_queue(server.url("clip.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+        return errors
+
+    def test_digests_verified_against_repr_digest(self):
+        manager = DownloadManager(segments=1)
+        value = base64.b64encode(self.sha256.digest()).decode()
+        self.download(manager, extra_headers={'Repr-Digest': f"sha-256=:{value}:"})
+
+        item = manager.completed[0]
+        self.assertEqual(item['digests']['sha256'], self.sha256.hexdigest())
+        self.assertEqual(item['digests']['md5'], hashlib.md5(self.payload).hexdigest())
+        self.assertEqual(item['digest_verified'], ['sha256'])
+
+    def test_file_hash_reuses_streamed_digests(self):
+        """calculate_file_hash z item['digests'] nie czyta pliku ponownie"""
+        manager = DownloadManager(segments=1)
+        self.download(manager)
+        item = manager.completed[0]
+        validator = SecurityValidator(blocklist_dir=self.download_dir / "none")
+
+        with patch('builtins.open', side_effect=AssertionError("plik czytany ponownie")):
+            self.assertEqual(manager.calculate_file_hash(item['file_path'], item['digests']),
+                             hashlib.md5(self.payload).hexdigest())
+            self.assertEqual(validator.calculate_file_hash(item['file_path'], item['digests']),
+                             self.sha256.hexdigest())
+        # Bez skrótów z pobierania - jak dotąd, z pliku
+        self.assertEqual(validator.calculate_file_hash(item['file_path']), self.sha256.hexdigest())
+
+    def test_content_md5_mismatch_fails(self):
+        manager = DownloadManager(segments=1)
+        bad = base64.b64encode(hashlib.md5(b"other").digest()).decode()
+        errors = self.download(manager, extra_headers={'Content-MD5': bad})
+
+        self.assertEqual(len(manager.completed), 0)
+        self.assertTrue(any(message.startswith("Błąd integralności") for message in errors))
+        self.assertFalse((self.download_dir / "clip.mp4").exists())
+
+    def test_segmented_and_resumed_downloads_have_digests(self):
+        manager = DownloadManager(segment_threshold=512 * 1024)
+        manager.segmented.min_segment_size = 128 * 1024
+        self.download(manager)
+        self.assertEqual(manager.completed[0]['digests']['sha256'], self.sha256.hexdigest())
+
+        shutil.rmtree(self.download_dir)
+        manager = DownloadManager(segments=1)
+        self.download(manager, drop_first_after=300_000, requests_log=[])
+        self.assertEqual(manager.completed[0]['digests']['sha256'], self.sha256.hexdigest())
+
+
+class TestContentStore(unittest.TestCase):
+    """Testy deduplikacji pobranych plików wg SHA-256"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+        self.store_dir = Path(tempfile.mkdtemp())
+        self.payload = bytes(range(256)) * 1024
+        (self.serve_dir / "clip.mp4").write_bytes(self.payload)
+        (self.serve_dir / "mirror.mp4").write_bytes(self.payload)
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def test_duplicate_becomes_hardlink(self):
+        store = ContentStore(self.store_dir)
+        sha256 = hashlib.sha256(self.payload).hexdigest()
+        first = self.download_dir / "a.mp4"
+        second = self.download_dir / "b.mp4"
+        first.write_bytes(self.payload)
+        second.write_bytes(self.payload)
+
+        self.assertFalse(store.contains(sha256))
+        self.assertFalse(store.ingest(first, sha256)['deduplicated'])
+        self.assertTrue(store.contains(sha256))
+        result = store.ingest(second, sha256)
+
+        self.assertEqual(result, {'deduplicated': True, 'method': 'hardlink', 'saved': len(self.payload)})
+        self.assertTrue(first.samefile(second))
+        self.assertEqual(second.read_bytes(), self.payload)
+        store.close()
+
+        # Indeks i licznik oszczędności przetrwają ponowne otwarcie
+        reopened = ContentStore(self.store_dir)
+        self.assertTrue(reopened.contains(sha256))
+        self.assertEqual(reopened.get_stats()['bytes_saved'], len(self.payload))
+        reopened.close()
+
+    def test_manager_reports_storage_saved(self):
+        store = ContentStore(self.store_dir)
+        manager = DownloadManager(segments=1, content_store=store)
+        with LocalServer(self.serve_dir, RangeHandler) as server:
+            manager.add_to_queue(server.url("clip.mp4"), self.download_dir)
+            manager.add_to_queue(server.url("mirror.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+
+        self.assertEqual(len(manager.completed), 2)
+        self.assertTrue((self.download_dir / "clip.mp4").samefile(self.download_dir / "mirror.mp4"))
+        self.assertEqual(manager.get_queue_status()['storage_saved'], len(self.payload))
+        store.close()
+
+    def test_gui_download_shares_inode_with_chat_download(self):
+        """Ten sam film z monitora czatów (ChatVideos) i z GUI (DeepIntelVideos) - jedna kopia"""
+        import main
+
+        class Var:
+            def __init__(self, value):
+                self.value = value
+
+            def get(self):
+                return self.value
+
+            def set(self, value):
+                self.value = value
+
+        class Root:
+            def after(self, delay, callback=None):
+                pass
+
+        chat_dir = self.download_dir / "ChatVideos"
+        gui_dir = self.download_dir / "DeepIntelVideos"
+        chat_dir.mkdir()
+        store = ContentStore(self.store_dir)
+        manager = DownloadManager(segments=1, content_store=store)
+
+        suite = main.DeepIntelVideoSuite.__new__(main.DeepIntelVideoSuite)
+        suite.root = Root()
+        suite.status_var = Var("")
+        suite.progress_var = Var(0)
+        suite.download_dir_var = Var(str(gui_dir))
+        suite.downloaded_files = []
+        suite.ffmpeg_available = False
+
+        with LocalServer(self.serve_dir, RangeHandler) as server:
+            manager.add_to_queue(server.url("clip.mp4"), chat_dir, priority=2)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+            with patch.object(main, 'download_manager', manager):
+                suite.download_video(server.url("mirror.mp4"))
+
+        self.assertTrue((chat_dir / "clip.mp4").samefile(gui_dir / "mirror.mp4"))
+        self.assertEqual((gui_dir / "mirror.mp4").read_bytes(), self.payload)
+        self.assertEqual(store.get_stats()['bytes_saved'], len(self.payload))
+        store.close()
+
+    def download_in_turn(self, manager, names, handler=RangeHandler):
+        with LocalServer(self.serve_dir, handler) as server:
+            for name in names:
+                manager.add_to_queue(server.url(name), self.download_dir)
+                manager.start_processing()
+                manager.stop_processing(drain=True, timeout=10)
+
+    def test_early_fingerprint_aborts_repost(self):
+        payload = bytes(range(256)) * 8192  # 2 MB
+        (self.serve_dir / "clip.mp4").write_bytes(payload)
+        (self.serve_dir / "repost.mp4").write_bytes(payload)
+        (self.serve_dir / "edited.mp4").write_bytes(payload[:-1] + b"!")
+        store = ContentStore(self.store_dir, prefix_size=64 * 1024, tail_size=4096)
+        manager = DownloadManager(segments=1, content_store=store)
+        log = []
+        handler = type("LoggingHandler", (RangeHandler,), {'requests_log': log})
+
+        self.download_in_turn(manager, ["clip.mp4", "repost.mp4", "edited.mp4"], handler)
+
+        self.assertEqual(len(manager.completed), 3)
+        repost, edited = manager.completed[1], manager.completed[2]
+        self.assertTrue(repost['deduplicated'])
+        self.assertTrue((self.download_dir / "clip.mp4").samefile(self.download_dir / "repost.mp4"))
+        # Zmieniona końcówka - sonda Range odrzuca dopasowanie, plik pobrany w całości
+        self.assertFalse(edited['deduplicated'])
+        self.assertEqual((self.download_dir / "edited.mp4").read_bytes()[-1:], b"!")
+        self.assertEqual(log.count(f"bytes={len(payload) - 4096}-"), 2)
+
+        status = manager.get_queue_status()
+        self.assertEqual(status['early_duplicates'], 1)
+        self.assertGreater(status['bandwidth_saved'], len(payload) // 2)
+        store.close()
+
+    def test_tail_probe_rejects_response_from_wrong_offset(self):
+        """Serwer odsyłający 206 od początku pliku - sonda nie czyta całości i nie uznaje duplikatu"""
+        payload = bytes(range(256)) * 8192
+        (self.serve_dir / "clip.mp4").write_bytes(payload)
+        (self.serve_dir / "repost.mp4").write_bytes(payload)
+        store = ContentStore(self.store_dir, prefix_size=64 * 1024, tail_size=4096)
+        manager = DownloadManager(segments=1, content_store=store)
+
+        class FromStartHandler(RangeHandler):
+            def _serve(self, body):
+                if self.headers.get('Range'):
+                    del self.headers['Range']
+                    self.headers['Range'] = 'bytes=0-'
+                super()._serve(body)
+
+        self.download_in_turn(manager, ["clip.mp4", "repost.mp4"], FromStartHandler)
+
+        self.assertEqual(len(manager.completed), 2)
+        self.assertEqual((self.download_dir / "repost.mp4").read_bytes(), payload)
+        status = manager.get_queue_status()
+        self.assertEqual(status['early_duplicates'], 0)
+        self.assertEqual(status['bandwidth_saved'], 0)
+        store.close()
+
+
+class TestQueueJournal(unittest.TestCase):
+    """Testy trwałego dziennika kolejki"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+        self.db_path = Path(tempfile.mkdtemp()) / "queue.db"
+        for name in ("a.mp4", "b.mp4"):
+            (self.serve_dir / name).write_bytes(b"x" * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+        shutil.rmtree(self.db_path.parent, ignore_errors=True)
+
+    def test_bulk_enqueue_is_one_commit(self):
+        journal = QueueJournal(self.db_path, commit_interval=10)
+        items = [make_item(f"http://example.com/{i}.mp4") for i in range(10_000)]
+        for item in items:
+            journal.record(item, 'queued')
+        journal.record(items[0], 'active')  # Nowszy stan scala się z wcześniejszym
+
+        self.assertEqual(journal.flush(), 10_000)
+        self.assertEqual(journal.commits, 1)
+        self.assertEqual(journal.counts()['queued'], 9_999)
+        self.assertEqual(journal.counts()['active'], 1)
+        journal.close()
+
+    def test_pending_items_survive_restart(self):
+        with LocalServer(self.serve_dir) as server:
+            manager = DownloadManager(journal=QueueJournal(self.db_path))
+            manager.add_to_queue(server.url("a.mp4"), self.download_dir)
+            manager.add_to_queue(server.url("b.mp4"), self.download_dir)
+            # "Awaria" w trakcie pobierania pierwszego elementu
+            with manager.lock:
+                manager._journal_record(manager.queue.pop(), 'active')
+            manager.journal.close()
+
+            journal = QueueJournal(self.db_path)
+            restarted = DownloadManager(journal=journal)
+            restarted.start_processing()
+            restarted.stop_processing(drain=True, timeout=10)
+
+        self.assertEqual(len(restarted.completed), 2)
+        self.assertTrue((self.download_dir / "a.mp4").exists())
+        self.assertEqual(journal.counts()['done'], 2)
+        journal.close()
+
+    def test_singleton_has_no_persistent_state(self):
+        """Import modułu nie otwiera plików w katalogu domowym - trwały stan włącza aplikacja"""
+        from download_manager import download_manager
+        self.assertIsNone(download_manager.journal)
+        self.assertIsNone(download_manager.completed.archive)
+        self.assertIsNone(download_manager.content_store)
+
+    def test_attach_persistence_recovers_queue_and_history(self):
+        journal = QueueJournal(self.db_path)
+        journal.record(make_item("http://example.com/done.mp4"), 'done')
+        journal.record(make_item("http://example.com/queued.mp4"), 'queued')
+        journal.flush()
+
+        manager = DownloadManager()
+        manager.attach_persistence(journal=journal)
+        self.assertEqual(len(manager.queue), 1)
+        self.assertEqual(len(manager.completed), 1)
+        self.assertFalse(manager.add_to_queue("http://example.com/done.mp4", "/tmp"))
+        journal.close()
+
+    def test_compact_removes_only_finished_rows(self):
+        journal = QueueJournal(self.db_path, commit_interval=10)
+        done, requeued = make_item("http://example.com/a.mp4"), make_item("http://example.com/b.mp4")
+        journal.record(done, 'done')
+        journal.record(requeued, 'done')
+        journal.flush()
+        journal.record(requeued, 'queued')  # URL dodany ponownie przed archiwizacją
+        journal.compact([done['url'], requeued['url']])
+
+        counts = journal.counts()
+        self.assertEqual(counts['done'], 0)
+        self.assertEqual(counts['queued'], 1)
+        journal.close()
+
+    def test_archived_history_leaves_journal(self):
+        """Wpisy przeniesione do archiwum historii nie zostają w dzienniku na zawsze"""
+        archive = HistoryArchive(self.db_path.parent / "history.db")
+        journal = QueueJournal(self.db_path)
+        manager = DownloadManager(history_size=2, archive=archive, journal=journal)
+        for i in range(5):
+            item = make_item(f"http://example.com/{i}.mp4")
+            manager.queue.push(item)
+            manager.queue.pop()
+            manager.active_downloads += 1
+            manager._finish_download(item, True)
+
+        self.assertEqual(journal.counts()['done'], 2)
+        self.assertEqual(manager.completed.total, 5)
+        self.assertFalse(manager.add_to_queue("http://example.com/0.mp4", "/tmp"))
+        manager.stop_processing()
+        journal.close()
+        archive.close()
+
+        # Restart: ostatnie wyniki z dziennika, starsze z archiwum - deduplikacja działa dalej
+        archive = HistoryArchive(self.db_path.parent / "history.db")
+        journal = QueueJournal(self.db_path)
+        restarted = DownloadManager(history_size=2, archive=archive, journal=journal)
+        self.assertEqual(restarted.get_queue_status()['completed'], 5)
+        self.assertEqual([item['url'] for item in restarted.completed],
+                         ["http://example.com/3.mp4", "http://example.com/4.mp4"])
+        for i in (0, 4):
+            self.assertFalse(restarted.add_to_queue(f"http://example.com/{i}.mp4", "/tmp"))
+        self.assertTrue(restarted.add_to_queue("http://example.com/5.mp4", "/tmp"))
+        journal.close()
+        archive.close()
+
+
+class TestDownloadHistory(unittest.TestCase):
+    """Testy ograniczonej historii z archiwum na dysku"""
+
+    def setUp(self):
+        self.archive_dir = Path(tempfile.mkdtemp())
+        self.archive = HistoryArchive(self.archive_dir / "history.db")
+
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+
+    def test_old_entries_spill_to_archive(self):
+        history = DownloadHistory('done', maxlen=10, archive=self.archive)
+        for i in range(100):
+            history.append(make_item(f"http://example.com/{i}.mp4"))
+
+        self.assertEqual(len(history), 10)
+        self.assertEqual(history.total, 100)
+        self.assertEqual(history[0]['url'], "http://example.com/90.mp4")
+        # Indeks URL-i obejmuje wpisy w pamięci i w archiwum
+        self.assertIn("http://example.com/3.mp4", history)
+        self.assertIn("http://example.com/99.mp4", history)
+        self.assertNotIn("http://example.com/100.mp4", history)
+
+    def test_archive_misses_skip_sqlite(self):
+        """Nowe URL-e odrzuca filtr Blooma - bez zapytań do bazy"""
+        history = DownloadHistory('done', maxlen=0, archive=self.archive)
+        for i in range(3000):  # Ponad początkową pojemność filtra
+            history.append(make_item(f"http://example.com/{i}.mp4"))
+        self.archive.flush()
+        self.assertIn("http://example.com/0.mp4", history)
+
+        statements = []
+        self.archive.reader.set_trace_callback(statements.append)
+        missing = sum(f"http://example.com/new{i}.mp4" in history for i in range(1000))
+        self.archive.reader.set_trace_callback(None)
+        self.assertEqual(missing, 0)
+        self.assertLess(len(statements), 50)
+        self.assertTrue(all(f"http://example.com/{i}.mp4" in history for i in range(0, 3000, 7)))
+
+        # Po restarcie filtr budowany z bazy
+        restarted = HistoryArchive(self.archive.db_path)
+        self.assertTrue(restarted.contains("http://example.com/2999.mp4", 'done'))
+        self.assertFalse(restarted.contains("http://example.com/3000.mp4", 'done'))
+        restarted.close()
+
+    def test_spilled_entries_are_group_committed(self):
+        """Przeniesienie do archiwum nie zapisuje na dysk - jedna partia w tle"""
+        archive = HistoryArchive(self.archive_dir / "batched.db", commit_interval=10)
+        self.addCleanup(archive.close)
+        history = DownloadHistory('done', maxlen=0, archive=archive)
+        for i in range(500):
+            history.append(make_item(f"http://example.com/{i}.mp4"))
+
+        self.assertEqual(archive.commits, 0)
+        self.assertIn("http://example.com/42.mp4", history)
+        self.assertEqual(history.total, 500)
+        self.assertEqual(archive.flush(), 500)
+        self.assertEqual(archive.commits, 1)
+        self.assertIn("http://example.com/42.mp4", history)
+        self.assertEqual(history.total, 500)
+
+    def test_manager_dedupes_and_retries_archived_items(self):
+        manager = DownloadManager(history_size=2, archive=self.archive)
+        items = [make_item(f"http://example.com/{i}.mp4") for i in range(5)]
+        for item in items:
+            manager.queue.push(item)
+            manager.queue.pop()
+            manager.active_downloads += 1
+            manager._finish_download(item, True)
+
+        self.assertEqual(len(manager.completed), 2)
+        self.assertEqual(manager.get_queue_status()['completed'], 5)
+        self.assertFalse(manager.add_to_queue("http://example.com/0.mp4", "/tmp"))
+
+        for i in range(5):
+            manager.failed.append(make_item(f"http://example.com/failed{i}.mp4"))
+        manager.retry_failed()
+        self.assertEqual(len(manager.queue), 5)
+        self.assertEqual(manager.failed.total, 0)
+
+
+class FlakyHandler(RangeHandler):
+    """Pierwsze żądanie o plik kończy się kodem first_status (z Retry-After), kolejne - treścią"""
+
+    first_status = 429
+    retry_after = "1"
+    hits = None
+
+    def do_GET(self):
+        self.hits.append(time.monotonic())
+        if len(self.hits) == 1 or self.path.startswith("/missing"):
+            status = 404 if self.path.startswith("/missing") else self.first_status
+            self.send_response(status)
+            self.send_header('Retry-After', self.retry_after)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        super().do_GET()
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Testy ponawiania z opóźnieniem"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+        (self.serve_dir / "clip.mp4").write_bytes(b"v" * 4096)
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def test_full_jitter_and_retry_after(self):
+        policy = RetryPolicy(base=1.0, cap=8.0, honour_retry_after=True)
+        self.assertEqual(policy.delay(3, rng=lambda: 1.0), 4.0)
+        self.assertEqual(policy.delay(10, rng=lambda: 1.0), 8.0)
+        self.assertEqual(policy.delay(10, rng=lambda: 0.25), 2.0)
+        self.assertEqual(policy.delay(1, retry_after=30), 30)
+
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertAlmostEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:30 GMT", now=1445412480), 30)
+        self.assertEqual(classify_status(429, "5"), ('rate_limited', 5))
+        self.assertEqual(classify_status(502), ('server', None))
+        self.assertEqual(classify_status(404), ('client', None))
+
+    def test_deferred_item_waits_without_slot(self):
+        queue = DownloadQueue(max_per_host=1)
+        now = [100.0]
+        queue.clock = lambda: now[0]
+        item = make_item("http://a.com/1.mp4")
+        queue.push(item)
+        queue.pop()
+        queue.defer(item, 5.0)
+
+        self.assertIn(item['url'], queue)
+        self.assertEqual(len(queue.active), 0)
+        self.assertFalse(queue.has_ready())
+        self.assertEqual(queue.retry_delay(), 5.0)
+        now[0] = 105.0
+        self.assertIs(queue.pop(), item)
+        self.assertIsNone(queue.retry_delay())
+
+    def test_manager_honours_retry_after_and_skips_client_errors(self):
+        hits = []
+        handler = type("Flaky", (FlakyHandler,), {'hits': hits})
+        manager = DownloadManager(segments=1)
+        with LocalServer(self.serve_dir, handler) as server:
+            manager.add_to_queue(server.url("clip.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+            self.assertEqual(len(manager.completed), 1)
+            self.assertGreaterEqual(hits[1] - hits[0], 0.9)
+
+            manager.add_to_queue(server.url("missing.mp4"), self.download_dir)
+            manager.start_processing()
+            manager.stop_processing(drain=True, timeout=10)
+
+        self.assertEqual(len(hits), 3)  # 404 - jedna próba, bez ponawiania
+        self.assertEqual(manager.failed[0]['attempts'], 1)
+
+
+class DownHandler(QuietHandler):
+    """Host w awarii - każde żądanie kończy się 503"""
+
+    hits = None
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        self.send_response(503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Testy bezpieczników per host"""
+
+    def test_open_probe_and_close(self):
+        now = [0.0]
+        breaker = CircuitBreaker(min_requests=4, open_seconds=10, clock=lambda: now[0])
+        for success in (True, False, False, True):
+            breaker.record(success)
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.available())
+        self.assertEqual(breaker.retry_in(), 10)
+
+        now[0] = 10.0
+        self.assertFalse(breaker.available())
+        self.assertEqual(breaker.expire(), 'half-open')
+        self.assertIsNone(breaker.retry_in())
+        self.assertTrue(breaker.available())
+        self.assertTrue(breaker.dispatch())
+        self.assertFalse(breaker.available())  # Tylko jedna sonda naraz
+        self.assertFalse(breaker.dispatch())
+        # Wynik żądania wysłanego przed otwarciem nie rozstrzyga
+        self.assertIsNone(breaker.record(True))
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertEqual(breaker.record(False, probe=True), 'open')
+        self.assertEqual(breaker.retry_in(), 20)  # Kolejne otwarcie - dwa razy dłużej
+        self.assertIsNone(breaker.record(False))  # Spóźniony błąd nie wydłuża otwarcia
+        self.assertEqual(breaker.retry_in(), 20)
+
+        now[0] = 30.0
+        breaker.expire()
+        self.assertTrue(breaker.dispatch())
+        self.assertEqual(breaker.record(True, probe=True), 'closed')
+        self.assertTrue(breaker.available())
+
+    def test_workers_idle_after_open_period_without_waiting_items(self):
+        """Otwarty bezpiecznik po terminie bez czekających elementów nie budzi wątków w kółko"""
+        for engine in ('threaded', 'asyncio'):
+            with self.subTest(engine=engine):
+                manager = DownloadManager(engine=engine)
+                manager.breakers.breaker_options.update(min_requests=1, open_seconds=0.01)
+                manager.breakers.record('down.example', False)
+                calls = []
+                next_wakeup = manager._next_wakeup
+                manager._next_wakeup = lambda: calls.append(1) or next_wakeup()
+
+                manager.start_processing()
+                time.sleep(0.3)
+                manager.stop_processing(timeout=5)
+                self.assertLess(len(calls), 20)
+
+    def test_open_host_items_wait_without_workers(self):
+        hits = []
+        handler = type("Down", (DownHandler,), {'hits': hits})
+        manager = DownloadManager(segments=1)
+        manager.retry_policies['server'] = RetryPolicy(base=0.01, cap=0.01)
+        manager.breakers.breaker_options.update(min_requests=3, open_seconds=60)
+        transitions = []
+        manager.add_callback('circuit', lambda host, old, new: transitions.append(new))
+
+        download_dir = Path(tempfile.mkdtemp())
+        try:
+            with LocalServer(download_dir, handler) as server:
+                for i in range(6):
+                    manager.add_to_queue(server.url(f"clip{i}.mp4"), download_dir)
+                manager.start_processing()
+                deadline = time.time() + 5
+                while 'open' not in transitions and time.time() < deadline:
+                    time.sleep(0.05)
+                time.sleep(0.3)
+                self.assertEqual(manager.active_downloads, 0)
+                manager.stop_processing(timeout=5)
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+        host = manager.get_circuit_status()['hosts']['127.0.0.1']
+        self.assertEqual(host['state'], 'open')
+        self.assertEqual(transitions, ['open'])
+        self.assertLessEqual(len(hits), 5)  # Bez bezpiecznika: 18 żądań
+        self.assertEqual(len(manager.queue), 6)
+
+
+class TestUrlClassifier(unittest.TestCase):
+    """Wspólna klasyfikacja URL-i"""
+
+    def test_verdict_kinds_and_reasons(self):
+        classifier = UrlClassifier()
+        cases = {
+            "https://example.com/video.mp4": ('video', 'video_extension'),
+            "https://cdn.example.com/get?file=clip.MKV&sig=1": ('video', 'video_extension'),
+            "https://example.com/pack.tar.gz": ('archive', 'archive_extension'),
+            "https://www.youtube.com/watch?v=abc": ('platform', 'platform_domain'),
+            "https://clips.twitch.tv/abc": ('platform', 'platform_domain'),
+            "https://malicious.com/video.mp4": ('blocked', 'blocked_domain'),
+            "https://example.com/setup.exe?x=1": ('dangerous', 'dangerous_extension'),
+            "javascript:alert('xss')": ('dangerous', 'dangerous_scheme'),
+            "ftp://example.com/video.mp4": ('invalid', 'scheme'),
+            "not-a-url": ('invalid', 'structure'),
+            "https://example.com/page.html": ('other', 'unknown'),
+        }
+        for url, (kind, reason) in cases.items():
+            with self.subTest(url=url):
+                verdict = classifier.classify(url)
+                self.assertEqual((verdict.kind, verdict.reason), (kind, reason))
+
+    def test_domains_match_on_label_boundaries(self):
+        domains = DomainSet(["malicious.com"])
+        self.assertEqual(domains.match("cdn.malicious.com"), "malicious.com")
+        self.assertIsNone(domains.match("notmalicious.com"))
+        self.assertIsNone(domains.match("malicious.com.example.org"))
+
+        classifier = UrlClassifier(blocked=domains)
+        self.assertEqual(classifier.classify("https://notmalicious.com/a.mp4").kind, 'video')
+
+    def test_results_are_cached_and_shared_by_modules(self):
+        classifier = UrlClassifier(cache_size=2)
+        for _ in range(3):
+            classifier.classify("https://example.com/a.mp4")
+        self.assertEqual(classifier.get_stats()['cache_hits'], 2)
+        classifier.reload(blocked=DomainSet(["example.com"]))
+        self.assertEqual(classifier.classify("https://example.com/a.mp4").kind, 'blocked')
+
+        manager = DownloadManager()
+        validator = SecurityValidator()
+        for url in ("https://vimeo.com/1", "https://example.com/a.webm"):
+            self.assertTrue(manager.is_valid_url(url)[0])
+            self.assertTrue(validator.validate_url(url)[0])
+        self.assertEqual(manager.is_valid_url("https://phishing-site.net/a.mp4"),
+                         (False, "Domena na czarnej liście: phishing-site.net"))
+        self.assertFalse(validator.validate_url("https://example.com/a.zip")[0])
+
+
+class TestDomainBlocklist(unittest.TestCase):
+    """Czarne listy domen z plików skompilowanych"""
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_compiled_list_matches_on_label_boundaries(self):
+        domains = [f"bad{i}.example.org" for i in range(5000)] + ["Evil.COM."]
+        for bits in (16, 0):
+            path = self.temp_dir / f"feed{bits}.blk"
+            self.assertEqual(compile_blocklist(domains + ["evil.com"], path, bits_per_domain=bits), 5001)
+            blocklist = DomainBlocklist(path)
+            self.assertEqual(blocklist.match("cdn.evil.com"), "evil.com")
+            self.assertEqual(blocklist.match("bad4999.example.org"), "bad4999.example.org")
+            self.assertIsNone(blocklist.match("notevil.com"))
+            self.assertIsNone(blocklist.match("example.org"))
+            self.assertFalse(any(blocklist.match(f"good{i}.example.org") for i in range(5000)))
+            blocklist.close()
+
+    def test_validator_loads_threat_feed(self):
+        feed = self.temp_dir / "feed.txt"
+        feed.write_text("# lista testowa\n0.0.0.0 tracker.bad-cdn.net\nphish.example\n")
+        classifier = UrlClassifier()
+        validator = SecurityValidator(blocklist_dir=self.temp_dir / "blk", classifier=classifier)
+
+        url = "https://video.tracker.bad-cdn.net/a.mp4"
+        self.assertTrue(validator.validate_url(url)[0])
+        self.assertEqual(validator.load_blocklist(feed), 2)
+        self.assertEqual(validator.validate_url(url), (False, "Domena na czarnej liście: tracker.bad-cdn.net"))
+        self.assertTrue(validator.validate_url("https://bad-cdn.net/a.mp4")[0])
+
+        # Nowy walidator wczytuje skompilowaną listę przy starcie, ponowne wczytanie jej nie dubluje
+        restarted = SecurityValidator(blocklist_dir=self.temp_dir / "blk", classifier=UrlClassifier())
+        self.assertFalse(restarted.validate_url("https://phish.example/a.mp4")[0])
+        restarted.load_blocklist(self.temp_dir / "blk" / "feed.blk")
+        self.assertEqual(len(restarted.classifier.blocked.lists), 2)
+
+    def test_replaced_list_stays_usable_for_readers(self):
+        """Ponowne wczytanie listy nie zamyka mapy używanej przez inne wątki"""
+        path = self.temp_dir / "feed.blk"
+        compile_blocklist(["evil.com"], path)
+        validator = SecurityValidator(blocklist_dir=self.temp_dir, classifier=UrlClassifier())
+        old = validator.classifier.blocked.lists[-1]
+        snapshot = validator.classifier.blocked.lists
+
+        compile_blocklist(["evil.com", "phish.example"], path)
+        validator.load_blocklist(path)
+        self.assertEqual(old.match("cdn.evil.com"), "evil.com")
+        self.assertEqual(len(snapshot), 2)
+        self.assertIsNot(validator.classifier.blocked.lists[-1], old)
+        self.assertFalse(validator.validate_url("https://phish.example/a.mp4")[0])
+
+    def test_validator_extends_custom_blocked_set(self):
+        """Klasyfikator z własnym DomainSet - lista zagrożeń dokładana obok niego"""
+        feed = self.temp_dir / "feed.txt"
+        feed.write_text("phish.example\n")
+        classifier = UrlClassifier(blocked=DomainSet(["evil.com"]))
+        validator = SecurityValidator(blocklist_dir=self.temp_dir / "blk", classifier=classifier)
+        validator.load_blocklist(feed)
+        self.assertFalse(validator.validate_url("https://phish.example/a.mp4")[0])
+        self.assertFalse(validator.validate_url("https://evil.com/a.mp4")[0])
+        self.assertTrue(validator.validate_url("https://good.example/a.mp4")[0])
+
+
+class TestCanonicalUrl(unittest.TestCase):
+    """Kanoniczna postać URL-a jako klucz deduplikacji"""
+
+    def test_variants_share_key(self):
+        groups = [
+            ["https://youtu.be/dQw4w9WgXcQ?si=abc",
+             "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=30",
+             "https://m.youtube.com/shorts/dQw4w9WgXcQ"],
+            ["https://vimeo.com/76979871", "https://player.vimeo.com/video/76979871?autoplay=1"],
+            ["HTTPS://CDN.Example.com:443/v/Clip.mp4/?utm_source=chat&b=2&a=1#t=10",
+             "https://cdn.example.com/v/Clip.mp4?a=1&b=2&fbclid=xyz"],
+            ["https://d1.cloudfront.net/a.mp4?Expires=1&Signature=abc&Key-Pair-Id=K",
+             "https://d1.cloudfront.net/a.mp4?Expires=2&Signature=def&Key-Pair-Id=K"],
+        ]
+        keys = []
+        for group in groups:
+            with self.subTest(url=group[0]):
+                self.assertEqual(len({canonical_url(url) for url in group}), 1)
+                # Klucz gotowego klucza jest tym samym kluczem (indeksy historii i archiwum)
+                self.assertEqual(canonical_url(canonical_url(group[0])), canonical_url(group[0]))
+            keys.append(canonical_url(group[0]))
+        self.assertEqual(keys[0], "youtube:dQw4w9WgXcQ")
+        self.assertEqual(keys[2], "https://cdn.example.com/v/Clip.mp4?a=1&b=2")
+
+        # Ścieżka (wielkość liter), port inny niż domyślny i znaczące parametry zostają
+        distinct = ["https://cdn.example.com/v/clip.mp4", "https://cdn.example.com/v/Clip.mp4",
+                    "https://cdn.example.com:8443/v/Clip.mp4", "https://example.com/dl?id=1",
+                    "https://example.com/dl?id=2", "https://example.com/dl?st=5"]
+        self.assertEqual(len({canonical_url(url) for url in distinct}), len(distinct))
+
+    def test_manager_skips_variants_in_queue_and_history(self):
+        temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        archive = HistoryArchive(temp_dir / "history.db")
+        self.addCleanup(archive.close)
+        manager = DownloadManager(history_size=1, archive=archive)
+        manager.rate_limit_per_minute = 1000
+        manager.rate_limit_per_hour = 1000
+
+        self.assertTrue(manager.add_to_queue("https://youtu.be/dQw4w9WgXcQ", temp_dir))
+        self.assertFalse(manager.add_to_queue("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=30", temp_dir))
+        results = manager.add_many(["https://cdn.example.com/a.mp4?utm_source=x",
+                                    "https://cdn.example.com/a.mp4",
+                                    "https://youtube.com/shorts/dQw4w9WgXcQ"], temp_dir)
+        self.assertEqual([reason for _, _, reason in results],
+                         ["OK", "Duplikat w tej partii", "Już w kolejce lub pobrany"])
+
+        # Ukończone (także przeniesione do archiwum) rozpoznawane po kluczu
+        for item in [manager.queue.pop(), manager.queue.pop()]:
+            manager.queue.mark_completed(item)
+            manager.completed.append(item)
+        self.assertEqual(len(manager.completed), 1)
+        self.assertIn("https://m.youtube.com/watch?v=dQw4w9WgXcQ", manager.queue)
+        self.assertIn("https://CDN.example.com/a.mp4#x", manager.queue)
+        self.assertFalse(manager.add_to_queue("https://youtu.be/dQw4w9WgXcQ?si=share", temp_dir))
+
+    def test_key_computed_once_per_item(self):
+        """Klucz liczony raz przy dodaniu (item['key']) - pobranie i ukończenie go nie przeliczają"""
+        calls = []
+
+        def counting_key(url):
+            calls.append(url)
+            return canonical_url(url)
+
+        with patch('download_manager.canonical_url', counting_key):
+            manager = DownloadManager(history_size=1)
+        manager.rate_limit_per_minute = 1000
+        manager.add_to_queue("https://cdn.example.com/a.mp4?utm_source=x", "/tmp")
+        manager.add_many(["https://cdn.example.com/b.mp4", "https://cdn.example.com/c.mp4"], "/tmp")
+        self.assertEqual(len(calls), 3)
+
+        for _ in range(3):
+            item = manager.queue.pop()
+            manager.queue.mark_completed(item)
+            manager.completed.append(item)  # history_size=1 - starsze wpisy przenoszone
+        self.assertEqual(len(calls), 3)
+        self.assertIsNone(manager.queue.pop())
+
+    def test_signature_like_params_kept_outside_cdn_hosts(self):
+        """Podpisy pomijane tylko na hostach CDN - gdzie indziej 'ref' czy 'signature' to inna treść"""
+        distinct = ["https://git.example.com/raw/clip.mp4?ref=main",
+                    "https://git.example.com/raw/clip.mp4?ref=v2",
+                    "https://media.example.com/clip.mp4?expires=1&signature=a&policy=p1",
+                    "https://media.example.com/clip.mp4?expires=1&signature=a&policy=p2"]
+        self.assertEqual(len({canonical_url(url) for url in distinct}), len(distinct))
+        self.assertEqual(canonical_url("https://bucket.s3.amazonaws.com/a.mp4?X-Amz-Signature=1&X-Amz-Date=2"),
+                         "https://bucket.s3.amazonaws.com/a.mp4")
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Testy limitera opartego na kubełkach tokenów"""
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_hour_limit_holds_beyond_history_size(self):
+        """Limit godzinowy działa także powyżej 100 prób (dawny deque(maxlen=100))"""
+        limiter = RateLimiter(per_minute=None, per_hour=150)
+        allowed = sum(limiter.acquire(f"https://a.com/{i}.mp4")[0] for i in range(200))
+        self.assertEqual(allowed, 150)
+        ok, message = limiter.check()
+        self.assertFalse(ok)
+        self.assertIn("150 pobrań na godzinę", message)
+
+    def test_domain_limit_is_separate_from_global(self):
+        limiter = RateLimiter(per_minute=100, per_hour=None,
+                              domain_limits={'example.com': {'per_minute': 2}})
+        self.assertTrue(limiter.acquire("https://cdn.example.com/1.mp4")[0])
+        self.assertTrue(limiter.acquire("https://example.com/2.mp4")[0])
+        ok, message = limiter.acquire("https://cdn.example.com/3.mp4")
+        self.assertFalse(ok)
+        self.assertIn("example.com", message)
+        self.assertTrue(limiter.acquire("https://other.org/1.mp4")[0])
+
+    def test_sqlite_store_shares_budget(self):
+        """Dwa limitery na tej samej bazie korzystają z jednego budżetu"""
+        db_path = self.temp_dir / "limits.db"
+        first = RateLimiter(per_minute=3, per_hour=None, store=SqliteBucketStore(db_path))
+        second = RateLimiter(per_minute=3, per_hour=None, store=SqliteBucketStore(db_path))
+        results = [limiter.acquire()[0] for limiter in (first, second, first, second)]
+        self.assertEqual(results, [True, True, True, False])
+
+    def test_manager_rejects_after_limit_without_spending_on_duplicates(self):
+        manager = DownloadManager(rate_limiter=RateLimiter(per_minute=2, per_hour=None))
+        errors = []
+        manager.add_callback('error', lambda url, message: errors.append(message))
+        self.assertTrue(manager.add_to_queue("https://example.com/a.mp4", self.temp_dir))
+        self.assertFalse(manager.add_to_queue("https://example.com/a.mp4", self.temp_dir))
+        self.assertTrue(manager.add_to_queue("https://example.com/b.mp4", self.temp_dir))
+        self.assertFalse(manager.add_to_queue("https://example.com/c.mp4", self.temp_dir))
+        self.assertTrue(errors[-1].startswith("Rate limit"))
+        self.assertEqual(manager.get_rate_limit_status()['last_minute'], 2)
+
+    def test_release_many_returns_tokens(self):
+        """Tokeny URL-i odrzuconych po acquire_many wracają do kubełków (globalnego i domeny)"""
+        for store in (None, SqliteBucketStore(self.temp_dir / "limits.db")):
+            with self.subTest(store=type(store).__name__):
+                limiter = RateLimiter(per_minute=3, per_hour=None, store=store,
+                                      domain_limits={'example.com': {'per_minute': 2}})
+                urls = ["https://example.com/1.mp4", "https://example.com/2.mp4", "https://b.org/3.mp4"]
+                self.assertTrue(all(ok for ok, _ in limiter.acquire_many(urls)))
+                self.assertFalse(limiter.acquire("https://b.org/4.mp4")[0])
+
+                limiter.release_many(urls[1:])
+                self.assertEqual(limiter.total_attempts, 1)
+                self.assertTrue(limiter.acquire("https://example.com/5.mp4")[0])
+                self.assertTrue(limiter.acquire("https://b.org/6.mp4")[0])
+                self.assertFalse(limiter.acquire("https://b.org/7.mp4")[0])
+
+
+class FakeSubscription:
+    def __init__(self, limits):
+        self.limits = limits
+        self.listeners = []
+
+    def get_limits(self):
+        return self.limits
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+
+class TestBandwidthGovernor(unittest.TestCase):
+    """Testy ogranicznika przepustowości na lokalnym serwerze HTTP"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def test_global_cap_shared_by_concurrent_downloads(self):
+        """Łączna przepustowość dwóch pobrań trzyma się limitu globalnego"""
+        size = 1536 * 1024
+        for name in ("a.mp4", "b.mp4"):
+            (self.serve_dir / name).write_bytes(b"x" * size)
+
+        cap = 2 * 1024 * 1024
+        manager = DownloadManager(max_concurrent=2, bandwidth=BandwidthGovernor(global_rate=cap))
+        with LocalServer(self.serve_dir) as server:
+            manager.add_to_queue(server.url("a.mp4"), self.download_dir)
+            manager.add_to_queue(server.url("b.mp4"), self.download_dir)
+            start = time.perf_counter()
+            manager.start_processing()
+            self.assertTrue(manager.stop_processing(drain=True, timeout=10))
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(manager.completed), 2)
+        throughput = 2 * size / elapsed
+        self.assertLessEqual(throughput, cap * 1.05)
+        self.assertGreaterEqual(throughput, cap * 0.85)
+
+    def test_subscription_sets_tier_and_concurrency(self):
+        governor = BandwidthGovernor(tier_rates={'normal': 1024 * 1024, 'unlimited': None})
+        manager = DownloadManager(max_concurrent=3, bandwidth=governor)
+        subscription = FakeSubscription({'max_concurrent': 2, 'download_speed': 'normal'})
+        manager.attach_subscription(subscription)
+        self.assertEqual(manager.max_concurrent, 2)
+        self.assertEqual(manager.speed_tier, 'normal')
+
+        # Zmiana planu w trakcie działania
+        for callback in subscription.listeners:
+            callback({'max_concurrent': 5, 'download_speed': 'unlimited'})
+        self.assertEqual(manager.max_concurrent, 5)
+        self.assertEqual(manager.speed_tier, 'unlimited')
+
+        transfer = governor.open('normal')
+        self.assertAlmostEqual(transfer.reserve(512 * 1024), 0.5, places=2)
+        transfer.close()
+
+    def test_import_does_not_pull_subscription_singleton(self):
+        """Import menedżera nie tworzy singletonów subskrypcji/analityki"""
+        import subprocess
+        import sys
+        probe = ("import sys, download_manager; "
+                 "print('subscription_manager' in sys.modules, 'analytics_service' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent.parent, check=True)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], 'False False')
+
+    def test_startup_wires_subscription_manager(self):
+        """main.setup_download_manager wiąże menedżer z singletonem subskrypcji"""
+        import main
+        from subscription_manager import subscription_manager
+
+        state_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state_dir, True)
+        manager = DownloadManager(http=HttpPool())
+        validator = SecurityValidator(blocklist_dir=state_dir / 'none', classifier=UrlClassifier())
+        compile_blocklist(['evil.example'], state_dir / 'threats.blk')
+        config = get_config()
+        config['download']['persistent_queue'] = False
+        config['security']['blocklist_dir'] = str(state_dir)
+        listeners = list(subscription_manager.listeners)
+        with patch.object(main, 'download_manager', manager), \
+                patch.object(main, 'security_validator', validator), \
+                patch.object(main, 'QueueJournal', partial(QueueJournal, state_dir / 'queue.db')), \
+                patch.object(main, 'HistoryArchive', partial(HistoryArchive, state_dir / 'history.db')), \
+                patch.object(main, 'ContentStore', partial(ContentStore, state_dir / 'store')):
+            main.setup_download_manager(config)
+        try:
+            # Klucze konfiguracji: bez dziennika kolejki, magazyn treści, listy z blocklist_dir
+            self.assertIsNone(manager.journal)
+            self.assertIsNotNone(manager.content_store)
+            self.assertEqual(validator.classifier.classify('https://evil.example/a.mp4').reason, 'blocked_domain')
+            with patch.object(subscription_manager, 'is_premium', True):
+                subscription_manager.notify_limits_changed()
+                self.assertEqual(manager.max_concurrent,
+                                 subscription_manager.premium_features['max_concurrent'])
+                self.assertEqual(manager.speed_tier,
+                                 subscription_manager.premium_features['download_speed'])
+        finally:
+            subscription_manager.listeners[:] = listeners
+            manager.stop_processing()
+
+    def test_configure_reads_config_keys(self):
+        """DownloadManager.configure stosuje klucze z config.load_config()"""
+        manager = DownloadManager(http=HttpPool())
+        config = get_config()
+        config['download'].update(max_per_host=1, segments=2, segment_threshold_mb=8,
+                                  checkpoint_interval_mb=1, digests=['sha1'], history_size=5,
+                                  early_fingerprint=False)
+        config['rate_limit'].update(per_minute=7, per_domain={'example.com': {'per_minute': 2}})
+        config['bandwidth'].update(global_limit_mb_per_second=3, per_download_mb_per_second=1)
+        config['circuit_breaker']['open_seconds'] = 5
+        manager.configure(config)
+
+        mb = 1024 * 1024
+        self.assertEqual(manager.queue.max_per_host, 1)
+        self.assertEqual(manager.segmented.segments, 2)
+        self.assertEqual(manager.segment_threshold, 8 * mb)
+        self.assertEqual(manager.checkpoint_interval, 1 * mb)
+        self.assertEqual(manager.digest_algorithms, ('sha1',))
+        self.assertEqual(manager.completed.maxlen, 5)
+        self.assertFalse(manager.early_fingerprint)
+        self.assertEqual(manager.max_concurrent, config['download']['max_concurrent'])
+        self.assertEqual(manager.rate_limit_per_minute, 7)
+        self.assertEqual(manager.rate_limiter.domain_for('https://cdn.example.com/a.mp4'), 'example.com')
+        self.assertEqual(manager.bandwidth.global_rate, 3 * mb)
+        self.assertEqual(manager.bandwidth.per_download_rate, 1 * mb)
+        self.assertEqual(manager.bandwidth.tier_buckets['normal'].rate, 2 * mb)
+        self.assertEqual(manager.breakers._breaker('example.com').open_seconds, 5)
+
+        if async_download_engine.aiohttp is not None:
+            manager.configure({'download': {'engine': 'asyncio'}})
+            self.assertEqual(manager.engine, 'asyncio')
+            self.assertIsNotNone(manager.async_engine)
+
+        # Nieznany algorytm skrótu - błąd przy konfiguracji, nie przy pierwszym pobraniu
+        config['download']['digests'] = ['nope']
+        with self.assertRaises(ValueError):
+            manager.configure(config)
+
+
+class TestProgressTracker(unittest.TestCase):
+    """Testy agregacji zdarzeń postępu"""
+
+    def test_events_are_rate_limited_with_speed_and_eta(self):
+        now = [0.0]
+        events = []
+        tracker = ProgressTracker(1000 * 8192, lambda *event: events.append(event),
+                                  max_events_per_second=4, clock=lambda: now[0])
+
+        # 1000 fragmentów po 8 KB w ciągu 2 sekund
+        for i in range(1, 1001):
+            now[0] = i * 0.002
+            tracker.update(i * 8192)
+        tracker.finish(1000 * 8192)
+
+        self.assertLessEqual(len(events), 2 * 4 + 1)
+        percent, downloaded, total, speed, eta = events[-1]
+        self.assertEqual((percent, downloaded, eta), (100.0, total, 0.0))
+        self.assertAlmostEqual(speed, 8192 / 0.002, delta=8192 / 0.002 * 0.05)
+        self.assertGreater(events[0][4], 0)
+
+    def test_manager_emits_final_event(self):
+        serve_dir = Path(tempfile.mkdtemp())
+        download_dir = Path(tempfile.mkdtemp())
+        try:
+            (serve_dir / "clip.mp4").write_bytes(b"p" * 2 * 1024 * 1024)
+            manager = DownloadManager()
+            events = []
+            manager.add_callback('progress', lambda url, *event: events.append(event))
+            with LocalServer(serve_dir) as server:
+                manager.add_to_queue(server.url("clip.mp4"), download_dir)
+                manager.start_processing()
+                manager.stop_processing(drain=True, timeout=10)
+        finally:
+            shutil.rmtree(serve_dir, ignore_errors=True)
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+        # 256 fragmentów po 8 KB - kilka zdarzeń zamiast 256
+        self.assertLess(len(events), 10)
+        self.assertEqual(events[-1][0], 100.0)
+        self.assertEqual(events[-1][1], 2 * 1024 * 1024)
+
+    def test_final_event_without_transfer(self):
+        """Plik już pobrany i kompletny .part (416) - także końcowe 100%, w obu silnikach"""
+        serve_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, serve_dir, ignore_errors=True)
+        payload = b"q" * 100_000
+        for name in ("done.mp4", "part.mp4"):
+            (serve_dir / name).write_bytes(payload)
+
+        for engine in ('threaded', 'asyncio'):
+            with self.subTest(engine=engine):
+                download_dir = Path(tempfile.mkdtemp())
+                self.addCleanup(shutil.rmtree, download_dir, ignore_errors=True)
+                (download_dir / "done.mp4").write_bytes(payload)
+                manager = DownloadManager(engine=engine)
+                events = {}
+                manager.add_callback('progress', lambda url, *event: events.setdefault(url, []).append(event))
+                with LocalServer(serve_dir, RangeHandler) as server:
+                    partial = PartialDownload(download_dir / "part.mp4", server.url("part.mp4"))
+                    with partial.open() as writer:
+                        writer.write_at(0, payload)
+                    partial.set_validators(len(payload), etag=RangeHandler.etag)
+                    with FileWriter(partial.part_path) as writer:
+                        partial.checkpoint(writer, len(payload), force=True)
+
+                    for name in ("done.mp4", "part.mp4"):
+                        manager.add_to_queue(server.url(name), download_dir)
+                    manager.start_processing()
+                    self.assertTrue(manager.stop_processing(drain=True, timeout=10))
+
+                    self.assertEqual(len(manager.completed), 2)
+                    self.assertEqual((download_dir / "part.mp4").read_bytes(), payload)
+                    for name in ("done.mp4", "part.mp4"):
+                        self.assertEqual(events[server.url(name)][-1][:2], (100.0, len(payload)))
+
+
+@unittest.skipIf(async_download_engine.aiohttp is None, "aiohttp nie jest zainstalowany")
+class TestAsyncEngine(unittest.TestCase):
+    """Testy silnika asyncio"""
+
+    def setUp(self):
+        self.serve_dir = Path(tempfile.mkdtemp())
+        self.download_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.serve_dir, ignore_errors=True)
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def test_rejects_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            DownloadManager(engine='gevent')
+
+    def test_downloads_many_clips_concurrently(self):
+        """Silnik asyncio pobiera pliki przez to samo API kolejki i callbacków"""
+        for i in range(40):
+            (self.serve_dir / f"clip{i}.mp4").write_bytes(bytes([i]) * (10_000 + i))
+
+        manager = DownloadManager(max_concurrent=100, engine='asyncio')
+        manager.rate_limit_per_minute = 1000
+        completed = []
+        manager.add_callback('complete', lambda url, path: completed.append(path))
+
+        with LocalServer(self.serve_dir) as server:
+            for i in range(40):
+                self.assertTrue(manager.add_to_queue(server.url(f"clip{i}.mp4"), self.download_dir))
+            manager.start_processing()
+            self.assertTrue(manager.stop_processing(drain=True, timeout=10))
+
+        self.assertEqual(len(completed), 40)
+        for i in range(40):
+            data = (self.download_dir / f"clip{i}.mp4").read_bytes()
+            self.assertEqual(data, bytes([i]) * (10_000 + i))
+
+    def test_resize_replaces_connection_limit(self):
+        """set_max_concurrent zmienia też limit połączeń aiohttp (nowa sesja, stara zamknięta)"""
+        for i in range(6):
+            (self.serve_dir / f"clip{i}.mp4").write_bytes(bytes([i]) * 50_000)
+        manager = DownloadManager(max_concurrent=2, engine='asyncio')
+        manager.rate_limit_per_minute = 1000
+
+        with LocalServer(self.serve_dir) as server:
+            manager.start_processing()
+            engine = manager.async_engine
+            first = engine.session
+            self.assertEqual(first.connector.limit, 2)
+
+            manager.set_max_concurrent(5)
+            deadline = time.monotonic() + 5
+            while engine.session is first and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(engine.session.connector.limit, 5)
+
+            for i in range(6):
+                manager.add_to_queue(server.url(f"clip{i}.mp4"), self.download_dir)
+            self.assertTrue(manager.stop_processing(drain=True, timeout=10))
+
+        self.assertTrue(first.closed)
+        self.assertEqual(len(manager.completed), 6)
+
+    def test_interrupted_transfer_resumes_from_part_file(self):
+        """Zerwane połączenie: dane w .part (plik docelowy nie powstaje), ponowienie przez Range"""
+        payload = bytes(range(256)) * 4096
+        (self.serve_dir / "clip.mp4").write_bytes(payload)
+        log = []
+
+        class DroppingHandler(RangeHandler):
+            drop_first_after = 300_000
+            requests_log = log
+
+            def finish(self):
+                # aiohttp zgłasza zerwanie przed oddaniem zbuforowanych danych - daj je odczytać
+                if len(self.requests_log) == 1:
+                    time.sleep(0.2)
+                super().finish()
+
+        handler = DroppingHandler
+        manager = DownloadManager(engine='asyncio')
+        manager.checkpoint_interval = 64 * 1024
+        target = self.download_dir / "clip.mp4"
+        seen_target = []
+        manager.add_callback('error', lambda url, message: seen_target.append(target.exists()))
+
+        with LocalServer(self.serve_dir, handler) as server:
+            manager.add_to_queue(server.url("clip.mp4"), self.download_dir)
+            manager.start_processing()
+            self.assertTrue(manager.stop_processing(drain=True, timeout=10))
+
+        self.assertEqual(seen_target, [False])
+        self.assertEqual(len(log), 2)
+        resumed_from = int(re.match(r'bytes=(\d+)-$', log[1]).group(1))
+        self.assertTrue(0 < resumed_from <= 300_000)
+        self.assertEqual(target.read_bytes(), payload)
+        self.assertFalse((self.download_dir / "clip.mp4.part").exists())
+        self.assertFalse((self.download_dir / "clip.mp4.part.json").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
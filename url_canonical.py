@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Kanoniczna postać URL-a - klucz deduplikacji (kolejka, historia, monitor czatów)
+- Filmy z serwisów mapowane na identyfikator: youtu.be/X, youtube.com/watch?v=X&t=30,
+  /shorts/X, /embed/X -> youtube:X (podobnie Vimeo, Dailymotion, Twitch)
+- Pozostałe URL-e: małe litery w schemacie i hoście, bez domyślnego portu, fragmentu
+  i końcowego ukośnika, bez parametrów śledzących (utm_*, fbclid...), pozostałe
+  parametry posortowane
+- Podpisy CDN (CloudFront, S3, GCS, Azure SAS, Akamai) pomijane tylko na hostach
+  tych usług - na innych hostach te same nazwy parametrów mogą znaczyć inną treść
+- Klucz służy tylko do porównań - pobierany jest zawsze oryginalny URL
+"""
+
+import re
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Parametry śledzenia kampanii i kliknięć - wszędzie bez wpływu na treść
+TRACKING_PARAMS = frozenset((
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_ga',
+))
+
+TRACKING_PREFIXES = ('utm_',)
+
+# Parametry ignorowane tylko na danych hostach (i ich subdomenach): podpisy i terminy
+# ważności linków CDN, parametry udostępniania serwisów. Gdzie indziej nazwy takie jak
+# 'signature', 'expires' czy 'ref' mogą wskazywać inną treść - zostają w kluczu.
+# Host -> (nazwy, prefiksy)
+HOST_PARAMS = {
+    'cloudfront.net': (frozenset(('expires', 'signature', 'key-pair-id', 'policy')), ()),
+    'amazonaws.com': (frozenset(('awsaccesskeyid', 'signature', 'expires')), ('x-amz-',)),
+    'storage.googleapis.com': (frozenset(), ('x-goog-',)),
+    'blob.core.windows.net': (frozenset(('sv', 'ss', 'srt', 'sp', 'se', 'st', 'spr', 'sig', 'sr', 'si')), ()),
+    'akamaihd.net': (frozenset(('hdnts', 'hdnea', '__gda__')), ()),
+    'akamaized.net': (frozenset(('hdnts', 'hdnea', '__gda__')), ()),
+    'youtube.com': (frozenset(('si', 'feature', 'ab_channel', 'pp')), ()),
+    'youtu.be': (frozenset(('si', 'feature')), ()),
+    'twitter.com': (frozenset(('ref_src', 's', 't')), ()),
+    'x.com': (frozenset(('ref_src', 's', 't')), ()),
+}
+
+_NO_HOST_PARAMS = (frozenset(), ())
+
+_YOUTUBE_ID = re.compile(r'[A-Za-z0-9_-]{11}')
+
+
+def _ignored(name, host_params):
+    name = name.lower()
+    names, prefixes = host_params
+    return (name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES) or
+            name in names or (prefixes and name.startswith(prefixes)))
+
+
+def _youtube(host, segments, params):
+    if host == 'youtu.be':
+        video = segments[0] if segments else None
+    elif segments and segments[0] in ('shorts', 'embed', 'live', 'v') and len(segments) > 1:
+        video = segments[1]
+    else:
+        video = params.get('v')
+    if video and _YOUTUBE_ID.fullmatch(video):
+        return f"youtube:{video}"
+    return None
+
+
+def _vimeo(host, segments, params):
+    # vimeo.com/123, vimeo.com/channels/x/123, player.vimeo.com/video/123
+    for index, segment in enumerate(segments):
+        if segment.isdigit():
+            # Filmy niepubliczne: vimeo.com/123/abcdef - skrót jest częścią identyfikatora
+            unlisted = segments[index + 1] if index + 1 < len(segments) else params.get('h')
+            return f"vimeo:{segment}/{unlisted}" if unlisted and unlisted.isalnum() else f"vimeo:{segment}"
+    return None
+
+
+def _dailymotion(host, segments, params):
+    if host == 'dai.ly':
+        video = segments[0] if segments else None
+    elif len(segments) > 1 and segments[-2] == 'video':
+        video = segments[-1]
+    else:
+        video = None
+    # Stary format: /video/x2abc_tytul-filmu
+    return f"dailymotion:{video.split('_', 1)[0]}" if video else None
+
+
+def _twitch(host, segments, params):
+    if host == 'clips.twitch.tv' and segments:
+        return f"twitch-clip:{segments[0]}"
+    if len(segments) > 2 and segments[1] == 'clip':
+        return f"twitch-clip:{segments[2]}"
+    if len(segments) > 1 and segments[0] == 'videos' and segments[1].isdigit():
+        return f"twitch:{segments[1]}"
+    return None
+
+
+# Domena -> reguła (host, segmenty ścieżki, parametry) -> klucz lub None (zwykła normalizacja)
+PLATFORM_RULES = {
+    'youtube.com': _youtube,
+    'youtube-nocookie.com': _youtube,
+    'youtu.be': _youtube,
+    'vimeo.com': _vimeo,
+    'dailymotion.com': _dailymotion,
+    'dai.ly': _dailymotion,
+    'twitch.tv': _twitch,
+}
+
+
+def _for_host(table, host, default=None):
+    """Wpis tabeli dla hosta lub jego domeny nadrzędnej (m.youtube.com, player.vimeo.com)"""
+    domain = host
+    while domain:
+        entry = table.get(domain)
+        if entry is not None:
+            return entry
+        dot = domain.find('.')
+        if dot < 0:
+            return default
+        domain = domain[dot + 1:]
+    return default
+
+
+@lru_cache(maxsize=16384)
+def canonical_url(url):
+    """Klucz deduplikacji URL-a; URL, którego nie da się przetworzyć, zwracany bez zmian"""
+    try:
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or '').rstrip('.')
+        port = parts.port
+    except (AttributeError, ValueError):
+        return url
+    scheme = parts.scheme.lower()
+    if not host or scheme not in DEFAULT_PORTS:
+        return url
+
+    segments = [segment for segment in parts.path.split('/') if segment]
+    pairs = parse_qsl(parts.query, keep_blank_values=True)
+
+    rule = _for_host(PLATFORM_RULES, host)
+    if rule is not None:
+        key = rule(host, segments, dict(pairs))
+        if key:
+            return key
+
+    netloc = f"[{host}]" if ':' in host else host  # IPv6
+    if port not in (None, DEFAULT_PORTS[scheme]):
+        netloc = f"{netloc}:{port}"
+    path = parts.path.rstrip('/') or '/'
+    host_params = _for_host(HOST_PARAMS, host, _NO_HOST_PARAMS)
+    query = urlencode(sorted((name, value) for name, value in pairs if not _ignored(name, host_params)))
+    return f"{scheme}://{netloc}{path}?{query}" if query else f"{scheme}://{netloc}{path}"
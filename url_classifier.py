@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Wspólna klasyfikacja URL-i (menedżer pobierania, walidator, GUI, monitor czatów)
+- Jedno parsowanie URL-a, jeden przebieg wyrażenia regularnego po ścieżce i zapytaniu
+- Rozszerzenia i domeny w zbiorach haszujących; domena dopasowywana po granicach
+  etykiet (sufiksy hosta), więc sprawdzenie kosztuje O(liczba etykiet)
+- Werdykt: plik wideo, archiwum, strona serwisu wideo, domena zablokowana,
+  niebezpieczny URL (plus nieprawidłowy / inny) z kodem przyczyny
+- Wyniki zapamiętywane w ograniczonym LRU
+"""
+
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from domain_blocklist import Blocklists
+
+# Rodzaje werdyktu
+VIDEO = 'video'
+ARCHIVE = 'archive'
+PLATFORM = 'platform'
+BLOCKED = 'blocked'
+DANGEROUS = 'dangerous'
+INVALID = 'invalid'
+OTHER = 'other'
+
+VIDEO_EXTENSIONS = frozenset(('mp4', 'mov', 'avi', 'mkv', 'webm', 'flv', 'wmv', 'm4v'))
+ARCHIVE_EXTENSIONS = frozenset(('zip', 'rar', '7z', 'tar.gz'))
+DANGEROUS_EXTENSIONS = frozenset(('exe', 'scr', 'bat', 'cmd'))
+DANGEROUS_SCHEMES = frozenset(('javascript', 'data'))
+ALLOWED_SCHEMES = frozenset(('http', 'https'))
+
+BLOCKED_DOMAINS = (
+    "malicious.com",
+    "phishing-site.net",
+    "suspicious-downloads.org",
+    "fake-video-host.net",
+    "virus-downloads.com",
+    "malware-central.org",
+)
+
+PLATFORM_DOMAINS = (
+    "youtube.com", "youtu.be",
+    "vimeo.com",
+    "twitch.tv",
+    "dailymotion.com",
+    "wistia.com", "fast.wistia.net",
+)
+
+# Wszystkie "rozszerzenia" w ścieżce i zapytaniu jednym przebiegiem:
+# .mp4 na końcu, przed / ? & # ; lub = (np. /get?file=clip.mp4, /video.mp4/download)
+_EXTENSION_RE = re.compile(r'\.(tar\.gz|[a-z0-9]{1,5})(?=[/?&#;=]|$)')
+
+# Komunikaty dla kodów przyczyny odrzucenia ({detail} - domena lub wzorzec)
+MESSAGES = {
+    'structure': "Nieprawidłowa struktura URL",
+    'scheme': "Obsługiwane są tylko protokoły HTTP/HTTPS",
+    'blocked_domain': "Domena na czarnej liście: {detail}",
+    'dangerous_scheme': "Niebezpieczny wzorzec w URL: {detail}:",
+    'dangerous_extension': "Niebezpieczny wzorzec w URL: .{detail}",
+    'archive_extension': "URL nie wygląda na link do wideo",
+    'unknown': "URL nie wygląda na link do wideo",
+}
+
+
+class UrlVerdict(NamedTuple):
+    kind: str
+    reason: str  # Kod przyczyny, np. 'video_extension', 'blocked_domain'
+    host: str
+    detail: Optional[str] = None  # Dopasowana domena, rozszerzenie lub schemat
+
+    @property
+    def is_video(self):
+        """Plik wideo lub strona serwisu wideo"""
+        return self.kind in (VIDEO, PLATFORM)
+
+    @property
+    def message(self):
+        return MESSAGES.get(self.reason, "OK").format(detail=self.detail)
+
+
+class DomainSet:
+    """Zbiór domen dopasowywanych po granicach etykiet (host lub jego sufiks)"""
+
+    def __init__(self, domains=()):
+        self.domains = {domain.lower().strip('.') for domain in domains}
+
+    def add(self, domain):
+        self.domains.add(domain.lower().strip('.'))
+
+    def match(self, host):
+        """Najdłuższa pasująca domena z zestawu (sam host lub domena nadrzędna) albo None"""
+        domains = self.domains
+        while host:
+            if host in domains:
+                return host
+            dot = host.find('.')
+            if dot < 0:
+                return None
+            host = host[dot + 1:]
+        return None
+
+    def __contains__(self, host):
+        return self.match(host) is not None
+
+    def __len__(self):
+        return len(self.domains)
+
+
+class UrlClassifier:
+    def __init__(self, blocked=None, platforms=None, cache_size=8192):
+        # blocked / platforms - dowolny obiekt z match(host) (np. DomainSet);
+        # domyślna czarna lista przyjmuje kolejne listy zagrożeń (SecurityValidator.load_blocklist)
+        self.blocked = blocked if blocked is not None else Blocklists([DomainSet(BLOCKED_DOMAINS)])
+        self.platforms = platforms if platforms is not None else DomainSet(PLATFORM_DOMAINS)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, url):
+        """Werdykt dla URL-a (bez pamięci podręcznej - używać classify)"""
+        try:
+            parts = urlsplit(url.strip())
+            host = parts.hostname or ''
+        except (AttributeError, ValueError):
+            return UrlVerdict(INVALID, 'structure', '')
+        scheme = parts.scheme.lower()
+
+        if scheme in DANGEROUS_SCHEMES:
+            return UrlVerdict(DANGEROUS, 'dangerous_scheme', host, scheme)
+        if not scheme or not parts.netloc:
+            return UrlVerdict(INVALID, 'structure', host)
+        if scheme not in ALLOWED_SCHEMES:
+            return UrlVerdict(INVALID, 'scheme', host, scheme)
+
+        blocked = self.blocked.match(host)
+        if blocked:
+            return UrlVerdict(BLOCKED, 'blocked_domain', host, blocked)
+
+        target = parts.path.lower()
+        if parts.query:
+            target = f"{target}?{parts.query.lower()}"
+        extensions = set(_EXTENSION_RE.findall(target))
+        if extensions:
+            for kind, reason, known in ((DANGEROUS, 'dangerous_extension', DANGEROUS_EXTENSIONS),
+                                        (ARCHIVE, 'archive_extension', ARCHIVE_EXTENSIONS),
+                                        (VIDEO, 'video_extension', VIDEO_EXTENSIONS)):
+                found = extensions & known
+                if found:
+                    return UrlVerdict(kind, reason, host, min(found))
+
+        platform = self.platforms.match(host)
+        if platform:
+            return UrlVerdict(PLATFORM, 'platform_domain', host, platform)
+        return UrlVerdict(OTHER, 'unknown', host)
+
+    def reload(self, blocked=None, platforms=None):
+        """Podmień listy domen (np. po wczytaniu nowej listy zagrożeń) i wyczyść pamięć podręczną"""
+        if blocked is not None:
+            self.blocked = blocked
+        if platforms is not None:
+            self.platforms = platforms
+        self.classify.cache_clear()
+
+    def get_stats(self):
+        info = self.classify.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'cache_hits': info.hits,
+            'cache_misses': info.misses,
+            'cache_size': info.currsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0
+        }
+
+
+# Singleton instance
+url_classifier = UrlClassifier()
+
+
+def classify(url):
+    return url_classifier.classify(url)